@@ -9,6 +9,8 @@ class ClientConfig(BaseModel):
     athena_database: Optional[str] = None
     athena_workgroup: Optional[str] = None
     inventory_replenishment_table: Optional[str] = None
+    # Max estimated bytes one inventory query may scan; falls back to ATHENA_SCAN_BUDGET_BYTES
+    athena_scan_budget_bytes: Optional[int] = None
 
 # Configuration Store
 # Mapping from Company ID to ClientConfig
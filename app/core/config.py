@@ -22,17 +22,93 @@ class Settings(BaseSettings):
     DB_USER: str
     DB_PASSWORD: str
     DB_PORT: str = "1433"
-    DB_POOL_SIZE: int = 10
+    # Base pool size; defaults to DB_EXECUTOR_WORKERS. The pool never holds
+    # more than DB_POOL_SIZE + DB_MAX_OVERFLOW connections
+    DB_POOL_SIZE: Optional[int] = None
     DB_MAX_OVERFLOW: int = 20
     DB_POOL_RECYCLE: int = 3600
-    DB_POOL_PRE_PING: bool = True
+    # Liveness is checked in the background (DB_POOL_MONITOR_SECONDS);
+    # pre-ping adds a round-trip to every checkout
+    DB_POOL_PRE_PING: bool = False
+    # Threads running blocking DB calls for async callers; keep at or below
+    # DB_POOL_SIZE so a worker never waits for a pooled connection
+    DB_EXECUTOR_WORKERS: int = 10
+    # Seconds between pool liveness pings; 0 disables the monitor thread
+    DB_POOL_MONITOR_SECONDS: int = 30
+    # The recommended pool size is the peak concurrency of the last
+    # DB_POOL_SIZING_WINDOWS monitor intervals
+    DB_POOL_SIZING_WINDOWS: int = 10
 
     # AWS Settings
     AWS_S3_BUCKET: str
     AWS_REGION: str = "us-east-1"
     AWS_ACCESS_KEY_ID: Optional[str] = None
     AWS_SECRET_ACCESS_KEY: Optional[str] = None
+
+    # Athena Settings
+    ATHENA_SCHEMA_CACHE_TTL: int = 3600
+    # Seconds before a failed table schema load is retried
+    ATHENA_SCHEMA_RETRY_SECONDS: int = 60
+    # Prepared statements one worker keeps per workgroup (least recently
+    # used ones are deleted) and executions of a shape before it is prepared
+    ATHENA_PREPARED_STATEMENT_LIMIT: int = 200
+    ATHENA_PREPARE_AFTER_EXECUTIONS: int = 2
+    QUERY_PLAN_CACHE_SIZE: int = 1024
+    # Executions one worker may have in flight per workgroup
+    ATHENA_MAX_CONCURRENT_QUERIES: int = 10
+    ATHENA_THROTTLE_MAX_RETRIES: int = 5
+    ATHENA_THROTTLE_BASE_DELAY: float = 0.5
+    ATHENA_THROTTLE_MAX_DELAY: float = 8.0
+    # Executions still running after this many seconds are stopped; 0 disables
+    ATHENA_QUERY_TIMEOUT_SECONDS: int = 300
+
+    # Scan cost pre-flight: Athena price per TB scanned, default per-tenant
+    # budget per query (0 disables) and row cap of downgraded queries
+    ATHENA_COST_PER_TB: float = 5.0
+    ATHENA_SCAN_BUDGET_BYTES: int = 0
+    ATHENA_DOWNGRADE_ROW_LIMIT: int = 1000
+    # Objects listed when sizing a table location without Glue statistics
+    SCAN_ESTIMATE_MAX_LISTED_OBJECTS: int = 10000
+
+    # Local inventory snapshot settings
+    INVENTORY_SNAPSHOT_ENABLED: bool = True
+    INVENTORY_SNAPSHOT_REFRESH_SECONDS: int = 900
+    INVENTORY_SNAPSHOT_MAX_AGE_SECONDS: int = 3600
+    # Tables whose SELECT * result file is larger are not snapshotted
+    INVENTORY_SNAPSHOT_MAX_BYTES: int = 100 * 1024 * 1024
+
+    # Hot-query materialization: the most frequent filter shapes of a table
+    # are materialized with CTAS and queries on them read the smaller table
+    MATERIALIZATION_ENABLED: bool = False
+    MATERIALIZATION_TOP_SHAPES: int = 5
+    MATERIALIZATION_MIN_HITS: int = 20
+    MATERIALIZATION_REFRESH_SECONDS: int = 3600
+
+    # Bulk exports (UNLOAD to Parquet): how long jobs are tracked before
+    # their files are deleted and how long download URLs stay valid
+    EXPORT_JOB_TTL_SECONDS: int = 86400
+    EXPORT_URL_EXPIRY_SECONDS: int = 3600
+    # Deadline of the UNLOAD execution itself; 0 disables
+    EXPORT_QUERY_TIMEOUT_SECONDS: int = 1800
+
+    # Inventory result cache settings
+    RESULT_CACHE_TTL_SECONDS: int = 300
+    RESULT_CACHE_MAX_ENTRIES: int = 64
+    RESULT_CACHE_MAX_BYTES: int = 20 * 1024 * 1024
+    # Runs of a filter shape within the TTL before its result is downloaded,
+    # and downloads in flight at once
+    RESULT_CACHE_MIN_HITS: int = 2
+    RESULT_CACHE_MAX_CONCURRENT_POPULATES: int = 2
     
+    # Monthly sales rollup: months loaded by the bulk build, and how often
+    # (and how many recent months) the incremental refresh reloads
+    SALES_ROLLUP_ENABLED: bool = True
+    SALES_ROLLUP_HISTORY_MONTHS: int = 36
+    SALES_ROLLUP_REFRESH_MONTHS: int = 2
+    SALES_ROLLUP_REFRESH_SECONDS: int = 3600
+    # After a failed build, the company is served from SQL for this long
+    SALES_ROLLUP_BUILD_BACKOFF_SECONDS: int = 300
+
     # Logging Settings
     LOG_LEVEL: str = "INFO"
 
@@ -1,11 +1,172 @@
 from app.core.config import settings
 import asyncio
+import hashlib
+import heapq
+import itertools
+import math
+import random
+import threading
+import time
 import boto3
-from typing import Optional, Dict, Any, TypeVar
+from botocore.exceptions import ClientError
+from collections import OrderedDict
+from decimal import Decimal
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import AsyncIterator, Optional, Dict, Any, List, Set, Tuple, TypeVar
 from app.lib.logger import log
 
 T = TypeVar('T')
 
+ATHENA_INTEGER_TYPES = {"tinyint", "smallint", "int", "integer", "bigint"}
+ATHENA_FLOAT_TYPES = {"float", "double", "real"}
+# Decoded to Decimal so monetary and quantity values keep their precision;
+# the response encoders serialize them
+ATHENA_DECIMAL_TYPES = {"decimal"}
+
+def _to_float(value: str) -> Optional[float]:
+    parsed = float(value)
+    # NaN/Infinity are not valid JSON
+    return parsed if math.isfinite(parsed) else None
+
+def _value_decoder(column_type: str) -> Any:
+    base_type = column_type.split("(")[0].strip().lower()
+    if base_type in ATHENA_INTEGER_TYPES:
+        return int
+    if base_type in ATHENA_FLOAT_TYPES:
+        return _to_float
+    if base_type in ATHENA_DECIMAL_TYPES:
+        return Decimal
+    if base_type == "boolean":
+        return lambda value: value == "true"
+    return None
+
+def decode_result_set(rows: List[Dict[str, Any]], column_info: List[Dict[str, Any]]) -> Tuple[List[str], List[List[Any]]]:
+    """
+    Decodes GetQueryResults rows into typed columns using the ResultSetMetadata
+    column types. Cells are transposed once and each column is converted with
+    a single decoder, instead of building a dict per row.
+    """
+    names = [col.get('Name', '') for col in column_info]
+    if not rows:
+        return names, [[] for _ in names]
+
+    cells = [[cell.get('VarCharValue') for cell in row.get('Data', [])] for row in rows]
+    columns: List[List[Any]] = []
+    for info, values in zip(column_info, zip(*cells)):
+        decoder = _value_decoder(info.get('Type', 'varchar'))
+        if decoder is None:
+            columns.append(list(values))
+        else:
+            columns.append([None if v is None else decoder(v) for v in values])
+    return names, columns
+
+# Largest MaxResults GetQueryResults accepts
+ATHENA_MAX_PAGE_SIZE = 1000
+
+# Error codes Athena uses when the account or workgroup is over its limits
+THROTTLING_ERROR_CODES = {"TooManyRequestsException", "ThrottlingException"}
+
+class QueryPriority(IntEnum):
+    """Admission order when a workgroup is at capacity; lower goes first."""
+    INTERACTIVE = 0
+    BULK = 1
+
+class WorkgroupGovernor:
+    """
+    Caps the executions this process has in flight in one workgroup. Callers
+    over the cap wait in a priority queue (FIFO within a priority) and a
+    released slot is handed straight to the next waiter.
+    """
+    def __init__(self, workgroup: str, max_concurrency: int):
+        self.workgroup = workgroup
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        # Metrics
+        self.admitted = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.throttled_retries = 0
+
+    def queue_depth(self, priority: Optional[QueryPriority] = None) -> int:
+        return sum(
+            1 for p, _, future in self._waiters
+            if not future.done() and (priority is None or p == priority)
+        )
+
+    async def acquire(self, priority: QueryPriority = QueryPriority.INTERACTIVE) -> None:
+        start = time.monotonic()
+        if self.in_flight < self.max_concurrency and self.queue_depth() == 0:
+            self.in_flight += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (int(priority), next(self._sequence), future))
+            try:
+                # release() hands its slot over by resolving the future
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # The slot was handed over just before the cancellation
+                    self.release()
+                raise
+
+        waited = time.monotonic() - start
+        self.admitted += 1
+        self.total_wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        if waited >= 1:
+            log.info(f"Athena query waited {waited:.2f}s for a slot in workgroup {self.workgroup}")
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": {p.name.lower(): self.queue_depth(p) for p in QueryPriority},
+            "admitted": self.admitted,
+            "avg_wait_ms": round(1000 * self.total_wait_seconds / self.admitted, 2) if self.admitted else 0.0,
+            "max_wait_ms": round(1000 * self.max_wait_seconds, 2),
+            "throttled_retries": self.throttled_retries,
+        }
+
+class AthenaGovernor:
+    """
+    Per-workgroup admission control for query executions. Limits are per
+    process, so ATHENA_MAX_CONCURRENT_QUERIES should be the workgroup's
+    share for one worker.
+    """
+    def __init__(self, max_concurrency: int = settings.ATHENA_MAX_CONCURRENT_QUERIES):
+        self.max_concurrency = max_concurrency
+        self._workgroups: Dict[str, WorkgroupGovernor] = {}
+
+    def for_workgroup(self, workgroup: Optional[str]) -> WorkgroupGovernor:
+        name = workgroup or "primary"
+        governor = self._workgroups.get(name)
+        if governor is None:
+            governor = self._workgroups[name] = WorkgroupGovernor(name, self.max_concurrency)
+        return governor
+
+    @asynccontextmanager
+    async def slot(self, workgroup: Optional[str], priority: QueryPriority = QueryPriority.INTERACTIVE) -> AsyncIterator[WorkgroupGovernor]:
+        governor = self.for_workgroup(workgroup)
+        await governor.acquire(priority)
+        try:
+            yield governor
+        finally:
+            governor.release()
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        return {name: governor.metrics() for name, governor in self._workgroups.items()}
+
 class AthenaClient:
     def __init__(self):
         self.client = boto3.client(
@@ -14,6 +175,274 @@ class AthenaClient:
             aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
             aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
         )
+        # (workgroup, statement name) pairs registered with Athena, least
+        # recently used first, and executions of shapes not prepared yet
+        self._prepared_statements: "OrderedDict[Tuple[str, str], None]" = OrderedDict()
+        self._shape_executions: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        self._prepared_lock = threading.Lock()
+        self.governor = AthenaGovernor()
+
+    def _get_prepared_statement(self, query: str, workgroup: str) -> Optional[str]:
+        """
+        Returns the name of the workgroup's prepared statement for the query
+        shape, registering it once the shape has run
+        ATHENA_PREPARE_AFTER_EXECUTIONS times, or None while it runs as a
+        plain parameterized query. The name is derived from the query text,
+        so the same shape always maps to the same statement. At most
+        ATHENA_PREPARED_STATEMENT_LIMIT statements are kept per worker; the
+        least recently used one is deleted to make room.
+        """
+        statement_name = f"stmt_{hashlib.sha1(query.encode('utf-8')).hexdigest()[:24]}"
+        key = (workgroup, statement_name)
+        evicted: List[Tuple[str, str]] = []
+        with self._prepared_lock:
+            if key in self._prepared_statements:
+                self._prepared_statements.move_to_end(key)
+                return statement_name
+
+            executions = self._shape_executions.pop(key, 0) + 1
+            if executions < settings.ATHENA_PREPARE_AFTER_EXECUTIONS:
+                # One-off shapes never reach the workgroup's statement quota
+                self._shape_executions[key] = executions
+                while len(self._shape_executions) > settings.ATHENA_PREPARED_STATEMENT_LIMIT:
+                    self._shape_executions.popitem(last=False)
+                return None
+
+            self._prepared_statements[key] = None
+            while len(self._prepared_statements) > settings.ATHENA_PREPARED_STATEMENT_LIMIT:
+                evicted.append(self._prepared_statements.popitem(last=False)[0])
+
+        for evicted_workgroup, evicted_name in evicted:
+            self._delete_prepared_statement(evicted_workgroup, evicted_name)
+
+        try:
+            self.client.create_prepared_statement(
+                StatementName=statement_name,
+                WorkGroup=workgroup,
+                QueryStatement=query
+            )
+            log.info(f"Registered Athena prepared statement {statement_name} in workgroup {workgroup}")
+        except self.client.exceptions.InvalidRequestException as e:
+            # Another worker registered the same shape first
+            if "already exists" not in str(e).lower():
+                self._forget_prepared_statement(key)
+                raise
+        except Exception:
+            self._forget_prepared_statement(key)
+            raise
+        return statement_name
+
+    def _forget_prepared_statement(self, key: Tuple[str, str]) -> None:
+        with self._prepared_lock:
+            self._prepared_statements.pop(key, None)
+
+    def _delete_prepared_statement(self, workgroup: str, statement_name: str) -> None:
+        try:
+            self.client.delete_prepared_statement(StatementName=statement_name, WorkGroup=workgroup)
+            log.info(f"Deleted Athena prepared statement {statement_name} from workgroup {workgroup}")
+        except Exception as e:
+            # Already deleted by another worker
+            log.warning(f"Could not delete Athena prepared statement {statement_name}: {str(e)}")
+
+    def get_table_metadata(self, database: str, table_name: str, catalog: str = "AwsDataCatalog") -> Dict[str, Any]:
+        """Returns the Glue TableMetadata (columns, partition keys and table parameters)."""
+        response = self.client.get_table_metadata(
+            CatalogName=catalog,
+            DatabaseName=database,
+            TableName=table_name
+        )
+        return response.get('TableMetadata', {})
+
+    def get_table_columns(self, database: str, table_name: str, catalog: str = "AwsDataCatalog") -> Dict[str, str]:
+        """
+        Returns a mapping of column name to Athena/Glue type for the table,
+        including partition keys.
+        """
+        metadata = self.get_table_metadata(database, table_name, catalog)
+        columns = metadata.get('Columns', []) + metadata.get('PartitionKeys', [])
+        return {col['Name']: col.get('Type', 'string') for col in columns}
+
+    def start_query(
+        self,
+        query: str,
+        database: Optional[str] = None,
+        output_location: Optional[str] = None,
+        workgroup: Optional[str] = None,
+        parameters: Optional[List[str]] = None
+    ) -> str:
+        """Submits the query and returns its execution id."""
+        start_kwargs = {
+            'QueryString': query,
+            'QueryExecutionContext': {'Database': database},
+            'ResultConfiguration': {'OutputLocation': output_location},
+            'WorkGroup': workgroup
+        }
+        statement_name = None
+        if parameters:
+            if workgroup:
+                statement_name = self._get_prepared_statement(query, workgroup)
+                if statement_name:
+                    start_kwargs['QueryString'] = f"EXECUTE {statement_name}"
+            start_kwargs['ExecutionParameters'] = parameters
+
+        try:
+            response = self.client.start_query_execution(**start_kwargs)
+        except self.client.exceptions.InvalidRequestException as e:
+            # Another worker evicted and deleted the shared statement
+            if not statement_name or "not found" not in str(e).lower():
+                raise
+            self._forget_prepared_statement((workgroup, statement_name))
+            log.info(f"Athena prepared statement {statement_name} was deleted, running the query unprepared")
+            start_kwargs['QueryString'] = query
+            response = self.client.start_query_execution(**start_kwargs)
+        execution_id = response['QueryExecutionId']
+        if not execution_id:
+            raise Exception("Failed to start query execution")
+        return execution_id
+
+    @staticmethod
+    def _is_throttling(error: Exception) -> bool:
+        return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES
+
+    async def _start_with_retry(self, governor: WorkgroupGovernor, *args: Any) -> str:
+        """
+        Submits the query, retrying throttling errors with full-jitter
+        exponential backoff.
+        """
+        attempt = 0
+        while True:
+            try:
+                # boto3 blocks; submissions waiting out throttling must not stall the loop
+                return await asyncio.to_thread(self.start_query, *args)
+            except ClientError as e:
+                if not self._is_throttling(e) or attempt >= settings.ATHENA_THROTTLE_MAX_RETRIES:
+                    raise
+                delay = random.uniform(0, min(settings.ATHENA_THROTTLE_MAX_DELAY, settings.ATHENA_THROTTLE_BASE_DELAY * 2 ** attempt))
+                attempt += 1
+                governor.throttled_retries += 1
+                log.warning(f"Athena throttled query submission in workgroup {governor.workgroup}, retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def execute(
+        self,
+        query: str,
+        database: Optional[str] = None,
+        output_location: Optional[str] = None,
+        workgroup: Optional[str] = None,
+        parameters: Optional[List[str]] = None,
+        priority: QueryPriority = QueryPriority.INTERACTIVE,
+        timeout_seconds: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Runs the query to completion under the workgroup's concurrency limit
+        and returns its QueryExecution description. The slot is held from
+        submission until the execution finishes. If the caller is cancelled
+        or the deadline (ATHENA_QUERY_TIMEOUT_SECONDS unless given) passes,
+        the execution is stopped and the slot released.
+        """
+        if timeout_seconds is None:
+            timeout_seconds = settings.ATHENA_QUERY_TIMEOUT_SECONDS
+
+        async with self.governor.slot(workgroup, priority) as governor:
+            execution_id = await self._start_with_retry(governor, query, database, output_location, workgroup, parameters)
+            return await self._await_execution(execution_id, timeout_seconds)
+
+    async def resume(
+        self,
+        execution_id: str,
+        workgroup: Optional[str] = None,
+        priority: QueryPriority = QueryPriority.INTERACTIVE,
+        timeout_seconds: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Waits for an execution started by an earlier request and returns its
+        QueryExecution description. A finished execution returns right away;
+        a running one is awaited under a workgroup slot with the same
+        deadline and cancellation handling as execute().
+        """
+        if timeout_seconds is None:
+            timeout_seconds = settings.ATHENA_QUERY_TIMEOUT_SECONDS
+
+        execution = await self._check_execution(execution_id)
+        if execution is not None:
+            return execution
+        async with self.governor.slot(workgroup, priority):
+            return await self._await_execution(execution_id, timeout_seconds)
+
+    async def _await_execution(self, execution_id: str, timeout_seconds: float) -> Dict[str, Any]:
+        """Waits for the execution, stopping it on cancellation or past the deadline."""
+        try:
+            return await asyncio.wait_for(self.wait_for_query(execution_id), timeout_seconds if timeout_seconds > 0 else None)
+        except asyncio.TimeoutError:
+            await self.stop_query(execution_id)
+            raise Exception(f"Athena query {execution_id} exceeded its {timeout_seconds}s deadline and was cancelled")
+        except asyncio.CancelledError:
+            # The caller went away: stop paying for the scan
+            await asyncio.shield(self.stop_query(execution_id))
+            raise
+
+    async def stop_query(self, execution_id: str) -> None:
+        """Cancels a running execution; failures are logged, not raised."""
+        try:
+            await asyncio.to_thread(self.client.stop_query_execution, QueryExecutionId=execution_id)
+            log.info(f"Stopped Athena query {execution_id}")
+        except Exception as e:
+            log.warning(f"Could not stop Athena query {execution_id}: {str(e)}")
+
+    async def _check_execution(self, execution_id: str) -> Optional[Dict[str, Any]]:
+        """Returns the QueryExecution description once it succeeded, None while it runs."""
+        response = await asyncio.to_thread(self.client.get_query_execution, QueryExecutionId=execution_id)
+        state = response['QueryExecution']['Status']['State']
+
+        if state in ['FAILED', 'CANCELLED']:
+            error_msg = response['QueryExecution']['Status'].get('StateChangeReason', 'Unknown error')
+            raise Exception(f"Athena query failed or was cancelled: {error_msg}")
+
+        if state == 'SUCCEEDED':
+            return response['QueryExecution']
+        return None
+
+    async def wait_for_query(self, execution_id: str) -> Dict[str, Any]:
+        """Polls until the execution succeeds and returns its QueryExecution description."""
+        while True:
+            execution = await self._check_execution(execution_id)
+            if execution is not None:
+                return execution
+            await asyncio.sleep(2)
+
+    async def iter_result_pages(
+        self,
+        execution_id: str,
+        next_token: Optional[str] = None,
+        page_size: int = ATHENA_MAX_PAGE_SIZE
+    ) -> AsyncIterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        """
+        Yields the results of a finished execution one typed page of rows at
+        a time, with the token of the page after it. The next page is only
+        fetched once the consumer asks for it, so memory stays at one page
+        however large the result set is.
+        """
+        is_first_page = not next_token
+        while True:
+            kwargs = {
+                'QueryExecutionId': execution_id,
+                'MaxResults': page_size
+            }
+            if next_token:
+                kwargs['NextToken'] = next_token
+
+            results = await asyncio.to_thread(self.client.get_query_results, **kwargs)
+            result_set = results.get('ResultSet', {})
+            rows = result_set.get('Rows', [])
+            if is_first_page:
+                rows = rows[1:]
+                is_first_page = False
+
+            names, columns = decode_result_set(rows, result_set.get('ResultSetMetadata', {}).get('ColumnInfo', []))
+            next_token = results.get('NextToken')
+            yield [dict(zip(names, values)) for values in zip(*columns)], next_token
+            if not next_token:
+                return
 
     async def run_query(
         self,
@@ -23,8 +452,17 @@ class AthenaClient:
         max_results: int = 20,
         database: Optional[str] = None,
         output_location: Optional[str] = None,
-        workgroup: Optional[str] = None
+        workgroup: Optional[str] = None,
+        parameters: Optional[List[str]] = None,
+        priority: QueryPriority = QueryPriority.INTERACTIVE,
+        timeout_seconds: Optional[float] = None,
+        columnar: bool = False
     ) -> Dict[str, Any]:
+        """
+        Runs (or continues) a query and returns one page of typed results:
+        a list of row dicts, or with `columnar` a mapping of column name to
+        its values.
+        """
         
         # Use provided values or fall back to instance defaults
         db = database
@@ -33,30 +471,10 @@ class AthenaClient:
 
         try:
             if not execution_id:
-                response = self.client.start_query_execution(
-                    QueryString=query,
-                    QueryExecutionContext={'Database': db},
-                    ResultConfiguration={'OutputLocation': out_loc},
-                    WorkGroup=wg
-                )
-                execution_id = response['QueryExecutionId']
-                if not execution_id:
-                    raise Exception("Failed to start query execution")
-
-            if not next_token:
-                state = 'RUNNING'
-                while state in ['RUNNING', 'QUEUED']:
-                    response = self.client.get_query_execution(QueryExecutionId=execution_id)
-                    state = response['QueryExecution']['Status']['State']
-                    
-                    if state in ['FAILED', 'CANCELLED']:
-                        error_msg = response['QueryExecution']['Status'].get('StateChangeReason', 'Unknown error')
-                        raise Exception(f"Athena query failed or was cancelled: {error_msg}")
-                    
-                    if state == 'SUCCEEDED':
-                        break
-                    
-                    await asyncio.sleep(2)
+                execution = await self.execute(query, db, out_loc, wg, parameters, priority, timeout_seconds)
+                execution_id = execution['QueryExecutionId']
+            elif not next_token:
+                await self.resume(execution_id, wg, priority, timeout_seconds)
 
             kwargs = {
                 'QueryExecutionId': execution_id,
@@ -65,35 +483,27 @@ class AthenaClient:
             if next_token:
                 kwargs['NextToken'] = next_token
 
-            results = self.client.get_query_results(**kwargs)
+            results = await asyncio.to_thread(self.client.get_query_results, **kwargs)
             
             result_set = results.get('ResultSet', {})
             rows = result_set.get('Rows', [])
             new_next_token = results.get('NextToken')
 
-            if not rows:
-                return {
-                    'results': [],
-                    'executionId': execution_id,
-                    'nextToken': None,
-                    'hasMore': False
-                }
+            # The first page starts with the header row
+            if not next_token:
+                rows = rows[1:]
 
             column_info = result_set.get('ResultSetMetadata', {}).get('ColumnInfo', [])
-            headers = [col.get('Name', '') for col in column_info]
-
-            start_index = 1 if not next_token else 0
-            data = []
-            for row in rows[start_index:]:
-                data_row = row.get('Data', [])
-                item = {}
-                for i, col in enumerate(data_row):
-                    if i < len(headers):
-                        item[headers[i]] = col.get('VarCharValue')
-                data.append(item)
+            names, columns = decode_result_set(rows, column_info)
+
+            if columnar:
+                data = dict(zip(names, columns))
+            else:
+                data = [dict(zip(names, values)) for values in zip(*columns)]
 
             return {
                 'results': data,
+                'count': len(rows),
                 'executionId': execution_id,
                 'nextToken': new_next_token,
                 'hasMore': bool(new_next_token)
@@ -1,11 +1,204 @@
+import asyncio
+import threading
+import time
 import urllib
-from typing import Generator
-from sqlalchemy import create_engine
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Generator, Iterator, Optional, TypeVar
+from sqlalchemy import create_engine, event, exc as sqla_exc
 from sqlalchemy.orm import sessionmaker, Session, declarative_base
 from sqlalchemy.engine import Engine
+from sqlalchemy.pool import PoolProxiedConnection, QueuePool
 from loguru import logger as log
 from app.core.config import settings
 
+class MonitoredQueuePool(QueuePool):
+    """QueuePool that times every checkout."""
+    def connect(self) -> PoolProxiedConnection:
+        start = time.monotonic()
+        outcome = "failed"
+        try:
+            connection = super().connect()
+            outcome = "ok"
+            return connection
+        except sqla_exc.TimeoutError:
+            outcome = "timeout"
+            raise
+        finally:
+            pool_monitor.record_checkout(time.monotonic() - start, outcome)
+
+class PoolMonitor:
+    """
+    Instruments the engine pool (checkout wait, connect time, in-use, idle
+    and overflow connections) and runs a background thread that:
+
+    - pings one idle connection every interval instead of pinging on every
+      checkout. Checkouts are FIFO, so successive probes rotate through the
+      idle connections. A failed ping means the server dropped them, so the
+      pool is disposed and reconnects on the next checkout. Probe checkouts
+      are left out of the checkout and concurrency figures.
+    - recommends a pool size from the peak concurrency of the last few
+      intervals, between the base size and the connection cap. The pool
+      itself keeps its configured size; a recommendation above DB_POOL_SIZE
+      means sustained load is being served by overflow connections.
+    """
+    def __init__(
+        self,
+        interval_seconds: int = settings.DB_POOL_MONITOR_SECONDS,
+        sizing_windows: int = settings.DB_POOL_SIZING_WINDOWS
+    ):
+        self.interval_seconds = interval_seconds
+        self._engine: Optional[Engine] = None
+        self.min_size = 0
+        self.max_connections = 0
+        self._lock = threading.Lock()
+        self._connect_started = threading.local()
+        self._probing = threading.local()
+        self._probes_out = 0
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.connect_failures = 0
+        self._total_checkout = 0.0
+        self._max_checkout = 0.0
+        self.connects = 0
+        self._total_connect = 0.0
+        self._max_connect = 0.0
+        self.pings = 0
+        self.failed_pings = 0
+        self._window_peak = 0
+        self._peaks: Deque[int] = deque(maxlen=max(sizing_windows, 1))
+        self._recommended_size = 0
+
+    def attach(self, engine: Engine, min_size: int, max_connections: int) -> None:
+        self._engine = engine
+        self.min_size = min_size
+        self.max_connections = max_connections
+        self._recommended_size = min_size
+        event.listen(engine, "do_connect", self._on_do_connect)
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+
+        if self.interval_seconds > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="db-pool-monitor", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def record_checkout(self, waited: float, outcome: str) -> None:
+        if getattr(self._probing, "active", False):
+            return
+        with self._lock:
+            if outcome == "ok":
+                self.checkouts += 1
+                self._total_checkout += waited
+                self._max_checkout = max(self._max_checkout, waited)
+            elif outcome == "timeout":
+                self.checkout_timeouts += 1
+            else:
+                self.connect_failures += 1
+
+    def _on_do_connect(self, dialect, conn_rec, cargs, cparams) -> None:
+        # Fires on the connecting thread right before the driver connects
+        self._connect_started.value = time.monotonic()
+
+    def _on_connect(self, dbapi_connection, connection_record) -> None:
+        started = getattr(self._connect_started, "value", None)
+        elapsed = time.monotonic() - started if started is not None else 0.0
+        with self._lock:
+            self.connects += 1
+            self._total_connect += elapsed
+            self._max_connect = max(self._max_connect, elapsed)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        if getattr(self._probing, "active", False):
+            return
+        in_use = self._engine.pool.checkedout()
+        with self._lock:
+            self._window_peak = max(self._window_peak, in_use - self._probes_out)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval_seconds):
+            try:
+                self._ping()
+                self._close_window()
+            except Exception as e:
+                log.error(f"DB pool monitor failed: {str(e)}")
+
+    def _ping(self) -> None:
+        pool = self._engine.pool
+        # Checking out with no idle connection would open a new one just to ping it
+        if pool.checkedin() == 0:
+            return
+        self._probing.active = True
+        with self._lock:
+            self._probes_out += 1
+        try:
+            connection = pool.connect()
+        except Exception:
+            with self._lock:
+                self._probes_out -= 1
+            raise
+        finally:
+            self._probing.active = False
+
+        try:
+            self._engine.dialect.do_ping(connection.dbapi_connection)
+            with self._lock:
+                self.pings += 1
+        except Exception as e:
+            with self._lock:
+                self.pings += 1
+                self.failed_pings += 1
+            log.warning(f"DB liveness ping failed, disposing pooled connections: {str(e)}")
+            connection.invalidate(e)
+            self._engine.dispose()
+        finally:
+            connection.close()
+            with self._lock:
+                self._probes_out -= 1
+
+    def _close_window(self) -> None:
+        pool = self._engine.pool
+        with self._lock:
+            # Connections still out count for the next window too
+            self._peaks.append(self._window_peak)
+            self._window_peak = max(pool.checkedout() - self._probes_out, 0)
+            previous = self._recommended_size
+            self._recommended_size = min(max(max(self._peaks), self.min_size), self.max_connections)
+            recommended = self._recommended_size
+
+        if recommended != previous:
+            log.info(f"Recommended DB pool size is now {recommended} (configured {self.min_size})")
+
+    def metrics(self) -> Dict[str, Any]:
+        pool = self._engine.pool if self._engine is not None else None
+        with self._lock:
+            return {
+                "pool_size": pool.size() if pool is not None else 0,
+                "recommended_pool_size": self._recommended_size,
+                "max_connections": self.max_connections,
+                "in_use": max(pool.checkedout() - self._probes_out, 0) if pool is not None else 0,
+                "idle": pool.checkedin() if pool is not None else 0,
+                "overflow": max(pool.overflow(), 0) if pool is not None else 0,
+                "peak_in_use": max([self._window_peak, *self._peaks]),
+                "checkouts": self.checkouts,
+                "checkout_timeouts": self.checkout_timeouts,
+                "connect_failures": self.connect_failures,
+                "avg_checkout_ms": round(self._total_checkout / self.checkouts * 1000, 2) if self.checkouts else 0.0,
+                "max_checkout_ms": round(self._max_checkout * 1000, 2),
+                "connects": self.connects,
+                "avg_connect_ms": round(self._total_connect / self.connects * 1000, 2) if self.connects else 0.0,
+                "max_connect_ms": round(self._max_connect * 1000, 2),
+                "pings": self.pings,
+                "failed_pings": self.failed_pings,
+            }
+
+pool_monitor = PoolMonitor()
+
 class DatabaseManager:
     """
     Singleton Database Manager for MSSQL using SQLAlchemy.
@@ -30,8 +223,9 @@ class DatabaseManager:
         password = settings.DB_PASSWORD
         port = settings.DB_PORT
 
-        # Connection pooling settings
-        pool_size = settings.DB_POOL_SIZE
+        # Connection pooling settings; by default every DB executor worker
+        # can hold a pooled connection, and overflow is left to sync callers
+        pool_size = settings.DB_POOL_SIZE or settings.DB_EXECUTOR_WORKERS
         max_overflow = settings.DB_MAX_OVERFLOW
         pool_recycle = settings.DB_POOL_RECYCLE
         pool_pre_ping = settings.DB_POOL_PRE_PING
@@ -50,6 +244,7 @@ class DatabaseManager:
                 max_overflow=max_overflow,
                 pool_recycle=pool_recycle,
                 pool_pre_ping=pool_pre_ping,
+                poolclass=MonitoredQueuePool,
                 # pool_timeout=30, # Default is 30
                 echo=False # Set to True for debugging SQL queries
             )
@@ -60,6 +255,8 @@ class DatabaseManager:
                 autoflush=False
             )
             
+            pool_monitor.attach(self._engine, min_size=pool_size, max_connections=pool_size + max_overflow)
+
             log.info(f"Successfully initialized DB engine for {server}")
         except Exception as e:
             log.error(f"Error initializing database engine: {str(e)}")
@@ -75,10 +272,136 @@ class DatabaseManager:
     def engine(self) -> Engine:
         return self._engine
 
+T = TypeVar('T')
+
+class DatabaseExecutor:
+    """
+    Bounded thread pool that runs blocking SQLAlchemy/pyodbc work for async
+    callers, so a DB round-trip neither blocks the event loop nor borrows
+    a thread from the shared default executor. Each call gets its own
+    session, opened and closed on the worker thread.
+    """
+    def __init__(self, max_workers: int = settings.DB_EXECUTOR_WORKERS):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._total_run = 0.0
+        self._max_run = 0.0
+
+    def _call(self, submitted_at: float, fn: Callable[[Session], T]) -> T:
+        started_at = time.monotonic()
+        with self._lock:
+            self.queued -= 1
+            self.in_flight += 1
+            waited = started_at - submitted_at
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+
+        db = db_manager.get_session()
+        ok = False
+        try:
+            result = fn(db)
+            ok = True
+            return result
+        finally:
+            db.close()
+            elapsed = time.monotonic() - started_at
+            with self._lock:
+                self.in_flight -= 1
+                if ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self._total_run += elapsed
+                self._max_run = max(self._max_run, elapsed)
+
+    async def run(self, fn: Callable[[Session], T]) -> T:
+        """Runs fn(session) on a DB worker thread and returns its result."""
+        with self._lock:
+            self.queued += 1
+        future = self._executor.submit(self._call, time.monotonic(), fn)
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    async def stream(self, fn: Callable[[Session], Iterator[T]], max_buffered: int = 4) -> AsyncIterator[T]:
+        """
+        Runs fn(session) on a DB worker thread and yields the items of the
+        iterator it returns (e.g. batches from a server-side cursor) as they
+        are produced. At most `max_buffered` items wait for the consumer, so
+        a slow consumer pauses the cursor instead of growing memory. The
+        worker stops reading when the consumer goes away.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=max_buffered)
+        stopped = threading.Event()
+        done = object()
+
+        def put(item: Any) -> bool:
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while True:
+                try:
+                    future.result(timeout=1)
+                    return True
+                except FutureTimeoutError:
+                    if stopped.is_set():
+                        future.cancel()
+                        return False
+
+        def produce(db: Session) -> None:
+            try:
+                for item in fn(db):
+                    if stopped.is_set() or not put(item):
+                        return
+            except Exception as e:
+                put(e)
+                return
+            put(done)
+
+        worker = asyncio.ensure_future(self.run(produce))
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stopped.set()
+            await asyncio.shield(worker)
+
+    def _on_done(self, future: Future) -> None:
+        # A call cancelled while still queued never reaches _call
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                "max_workers": self.max_workers,
+                "in_flight": self.in_flight,
+                "queued": self.queued,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_wait_ms": round(self._total_wait / finished * 1000, 2) if finished else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 2),
+                "avg_run_ms": round(self._total_run / finished * 1000, 2) if finished else 0.0,
+                "max_run_ms": round(self._max_run * 1000, 2),
+            }
+
 Base = declarative_base()
 
 # Global instance
 db_manager = DatabaseManager()
+db_executor = DatabaseExecutor()
 
 def get_db() -> Generator[Session, None, None]:
     """
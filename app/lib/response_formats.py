@@ -0,0 +1,104 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple
+import msgpack
+import pyarrow as pa
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+JSON_MEDIA_TYPE = "application/json"
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+# Accept values that map to a supported format; JSON wins ties and wildcards
+MEDIA_TYPE_ALIASES = {
+    JSON_MEDIA_TYPE: JSON_MEDIA_TYPE,
+    "*/*": JSON_MEDIA_TYPE,
+    "application/*": JSON_MEDIA_TYPE,
+    ARROW_STREAM_MEDIA_TYPE: ARROW_STREAM_MEDIA_TYPE,
+    "application/vnd.apache.arrow.file": ARROW_STREAM_MEDIA_TYPE,
+    MSGPACK_MEDIA_TYPE: MSGPACK_MEDIA_TYPE,
+    "application/x-msgpack": MSGPACK_MEDIA_TYPE,
+    "application/vnd.msgpack": MSGPACK_MEDIA_TYPE,
+}
+
+# Schema metadata key holding the non-tabular part of the response
+ARROW_RESPONSE_METADATA_KEY = b"response"
+
+def negotiate_media_type(request: Request, tabular: bool = True) -> str:
+    """
+    Picks the response format from the Accept header, honouring q-values.
+    Falls back to JSON when the header is missing or names nothing supported.
+    Arrow IPC is only offered for tabular responses (`tabular`).
+    """
+    candidates: List[Tuple[float, int, str]] = []
+    for position, part in enumerate(request.headers.get("accept", "").split(",")):
+        media_range, *params = [p.strip() for p in part.split(";")]
+        media_type = MEDIA_TYPE_ALIASES.get(media_range.lower())
+        if media_type is None or (media_type == ARROW_STREAM_MEDIA_TYPE and not tabular):
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            candidates.append((-quality, position, media_type))
+    return min(candidates)[2] if candidates else JSON_MEDIA_TYPE
+
+def wants_columns(request: Request) -> bool:
+    """
+    Arrow tables are built from column arrays, so the service should produce
+    them directly. MessagePack keeps the shape the request asked for.
+    """
+    return negotiate_media_type(request) == ARROW_STREAM_MEDIA_TYPE
+
+def _to_arrow(content: Any) -> pa.Table:
+    """
+    Tabular responses (a `results` mapping of column name to values) become
+    the table itself, with the rest of the response as JSON schema metadata.
+    Any other object becomes a one-row table.
+    """
+    if isinstance(content, dict) and isinstance(content.get("results"), (dict, list)):
+        results = content["results"]
+        if isinstance(results, dict):
+            table = pa.table(results)
+        else:
+            table = pa.Table.from_pylist(results)
+        rest = {k: v for k, v in content.items() if k != "results"}
+        return table.replace_schema_metadata({ARROW_RESPONSE_METADATA_KEY: json.dumps(jsonable_encoder(rest)).encode("utf-8")})
+    return pa.Table.from_pylist([jsonable_encoder(content)])
+
+def _arrow_bytes(table: pa.Table) -> bytes:
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def _msgpack_default(value: Any) -> Any:
+    # Dates, enums and models fall back to their JSON representation
+    return jsonable_encoder(value)
+
+def negotiated_response(
+    request: Request,
+    content: Any,
+    status_code: int = 200,
+    headers: Optional[Dict[str, str]] = None,
+    tabular: bool = True
+) -> Response:
+    """
+    Serializes a route's result as Arrow IPC stream, MessagePack or JSON
+    depending on the Accept header. Responses that are a single record
+    rather than rows (`tabular=False`) are never sent as Arrow.
+    """
+    media_type = negotiate_media_type(request, tabular)
+    vary = {"Vary": "Accept", **(headers or {})}
+    if media_type == ARROW_STREAM_MEDIA_TYPE:
+        return Response(_arrow_bytes(_to_arrow(content)), status_code=status_code, media_type=media_type, headers=vary)
+    if media_type == MSGPACK_MEDIA_TYPE:
+        body = msgpack.packb(content, default=_msgpack_default, use_bin_type=True)
+        return Response(body, status_code=status_code, media_type=media_type, headers=vary)
+    return JSONResponse(jsonable_encoder(content), status_code=status_code, headers=vary)
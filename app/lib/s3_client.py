@@ -2,6 +2,7 @@ import pandas as pd
 import boto3
 import io
 import json
+from typing import Any, Dict, Iterator, List, Optional
 from app.lib.logger import log
 from app.core.config import settings
 
@@ -56,6 +57,91 @@ class S3Client:
             log.error(f"Error reading json from s3://{bucket}/{key}: {str(e)}")
             raise e
 
+    def read_bytes(self, bucket: str, key: str) -> bytes:
+        """
+        Reads a file from S3 using boto3 and returns its raw content.
+        """
+        try:
+            response = self.client.get_object(Bucket=bucket, Key=key)
+            return response['Body'].read()
+        except Exception as e:
+            log.error(f"Error reading s3://{bucket}/{key}: {str(e)}")
+            raise e
+
+    def get_object_size(self, bucket: str, key: str) -> int:
+        """
+        Returns the size in bytes of an S3 object without downloading it.
+        """
+        response = self.client.head_object(Bucket=bucket, Key=key)
+        return response['ContentLength']
+
+    def get_prefix_size(self, bucket: str, prefix: str, max_objects: Optional[int] = None) -> int:
+        """
+        Returns the total size in bytes of all S3 objects under a prefix.
+        With max_objects, listing stops after that many objects and the size
+        of the objects listed so far is returned.
+        """
+        paginator = self.client.get_paginator("list_objects_v2")
+        total = 0
+        listed = 0
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                total += obj['Size']
+                listed += 1
+                if max_objects is not None and listed >= max_objects:
+                    log.warning(f"Stopped sizing s3://{bucket}/{prefix} after {listed} objects")
+                    return total
+        return total
+
+    def list_prefix(self, bucket: str, prefix: str) -> List[Dict[str, Any]]:
+        """
+        Returns the key and size of every S3 object under a prefix.
+        """
+        paginator = self.client.get_paginator("list_objects_v2")
+        return [
+            {'key': obj['Key'], 'size': obj['Size']}
+            for page in paginator.paginate(Bucket=bucket, Prefix=prefix)
+            for obj in page.get('Contents', [])
+        ]
+
+    def iter_object_chunks(self, bucket: str, key: str, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        """
+        Returns an iterator over the content of an S3 object in chunks,
+        without loading it whole. The object is opened right away so a
+        missing key fails here rather than mid-iteration.
+        """
+        body = self.client.get_object(Bucket=bucket, Key=key)['Body']
+
+        def chunks() -> Iterator[bytes]:
+            try:
+                yield from body.iter_chunks(chunk_size)
+            finally:
+                body.close()
+        return chunks()
+
+    def generate_presigned_url(self, bucket: str, key: str, expires_in: int) -> str:
+        """
+        Returns a URL that allows downloading an S3 object without credentials.
+        """
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={'Bucket': bucket, 'Key': key},
+            ExpiresIn=expires_in
+        )
+
+    def delete_prefix(self, bucket: str, prefix: str) -> int:
+        """
+        Deletes all S3 objects under a prefix and returns how many were deleted.
+        """
+        deleted = 0
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            keys = [{'Key': obj['Key']} for obj in page.get('Contents', [])]
+            if keys:
+                self.client.delete_objects(Bucket=bucket, Delete={'Objects': keys, 'Quiet': True})
+                deleted += len(keys)
+        return deleted
+
     def read_json_as_dict(self, bucket: str, key: str) -> dict:
         """
         Reads a json file from S3 using boto3 and returns a dictionary.
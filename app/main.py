@@ -1,20 +1,34 @@
 # app/main.py
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.lib.logger import setup_logging
 from app.lib.exceptions import register_error_handlers
 from app.core.config import settings
+from app.lib.athena import athena_client
+from app.lib.database import db_executor, pool_monitor
 from app.routers.demand_forecast import router as demand_forecast_router
 from app.routers.inventory_analysis import router as inventory_analysis_router
 from app.routers.mcp import mcp_app
+from app.services.sales.sales_rollup import sales_rollup_store
 
 # Initialize structured logging
 log = setup_logging()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with mcp_app.lifespan(app):
+        sales_rollup_store.start()
+        try:
+            yield
+        finally:
+            await sales_rollup_store.stop()
+            pool_monitor.stop()
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     description="Production-grade FastAPI server with MSSQL pooling, MCP tools, and structured logging.",
-    lifespan=mcp_app.lifespan,
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -45,6 +59,21 @@ def list_routes():
             routes.append({"path": route.path, "methods": getattr(route, "methods", [])})
     return routes
 
+@app.get("/debug/athena")
+def athena_metrics():
+    """In-flight executions, queue depth and admission wait per Athena workgroup."""
+    return athena_client.governor.metrics()
+
+@app.get("/debug/db")
+def db_metrics():
+    """Queue depth, in-flight calls and wait/run times of the DB executor."""
+    return db_executor.metrics()
+
+@app.get("/debug/db/pool")
+def db_pool_metrics():
+    """Checkout wait, connect time, in-use/idle/overflow connections and recommended size of the DB pool."""
+    return pool_monitor.metrics()
+
 
 if __name__ == "__main__":
     import uvicorn
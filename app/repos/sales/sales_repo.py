@@ -1,8 +1,165 @@
-from typing import Any
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple
+import pandas as pd
 from sqlalchemy.orm import Session
 from sqlalchemy import text
+from sqlalchemy.sql.elements import TextClause
 from datetime import date
-from sqlalchemy.dialects import mssql
+from app.lib.database import db_executor
+from app.lib.logger import log
+
+# Statements are built once per shape (with or without the region filter,
+# monthly or not, with or without TOP) and only take bound parameters, so
+# every call reuses SQLAlchemy's compiled form and SQL Server's cached plan
+# for that shape instead of rebuilding the SQL text.
+
+_REGION_FILTER = "AND cr.RegionName = :region_name"
+
+_UNITS_SOLD_SQL = """
+            SELECT 
+                SUM(s.UnitsSold) AS TotalUnitsSold 
+            FROM Sales s
+            LEFT JOIN Dealer d ON d.DealerID = s.DealerID
+            LEFT JOIN CorporateRegion cr ON cr.RegionID = d.CorporateRegionID
+            WHERE s.CompanyID = :company_id
+                AND s.SalesType = :sales_type
+                AND SalesDate >= :start_date
+                AND SalesDate <  :end_date
+                {region_filter}
+        """
+
+_YOY_SALES_SQL = """
+            SELECT 
+                YEAR(SalesDate) AS SalesYear,
+                MONTH(SalesDate) AS SalesMonth,
+                SUM(s.UnitsSold) AS TotalUnitsSold
+            FROM Sales s
+            LEFT JOIN Dealer d ON d.DealerID = s.DealerID
+            LEFT JOIN CorporateRegion cr ON cr.RegionID = d.CorporateRegionID
+            WHERE s.CompanyID = :company_id
+            AND s.SalesType = :sales_type
+            AND SalesDate >= :start_date
+            AND SalesDate <  :end_date
+            {region_filter}
+            GROUP BY 
+                YEAR(SalesDate),
+                MONTH(SalesDate)
+            ORDER BY SalesMonth;
+        """
+
+_MONTHLY_ROLLUP_SQL = """
+            SELECT 
+                s.SalesType AS SalesType,
+                cr.RegionName AS RegionName,
+                YEAR(s.SalesDate) AS SalesYear,
+                MONTH(s.SalesDate) AS SalesMonth,
+                SUM(s.UnitsSold) AS TotalUnitsSold
+            FROM Sales s
+            LEFT JOIN Dealer d ON d.DealerID = s.DealerID
+            LEFT JOIN CorporateRegion cr ON cr.RegionID = d.CorporateRegionID
+            WHERE s.CompanyID = :company_id
+            AND s.SalesDate >= :start_date
+            AND s.SalesDate <  :end_date
+            GROUP BY 
+                s.SalesType,
+                cr.RegionName,
+                YEAR(s.SalesDate),
+                MONTH(s.SalesDate)
+        """
+
+_UNITS_BY_REGION_SQL = """
+            SELECT 
+                cr.RegionName AS RegionName,
+                {month_columns}
+                SUM(s.UnitsSold) AS TotalUnitsSold
+            FROM Sales s
+            LEFT JOIN Dealer d ON d.DealerID = s.DealerID
+            LEFT JOIN CorporateRegion cr ON cr.RegionID = d.CorporateRegionID
+            WHERE s.CompanyID = :company_id
+            AND s.SalesType = :sales_type
+            AND s.SalesDate >= :start_date
+            AND s.SalesDate <  :end_date
+            GROUP BY {group_columns}
+        """
+
+_UNITS_BY_DEALER_SQL = """
+            WITH DealerSales AS (
+                SELECT 
+                    s.DealerID AS DealerID,
+                    cr.RegionName AS RegionName,
+                    SUM(s.UnitsSold) AS TotalUnitsSold
+                FROM Sales s
+                LEFT JOIN Dealer d ON d.DealerID = s.DealerID
+                LEFT JOIN CorporateRegion cr ON cr.RegionID = d.CorporateRegionID
+                WHERE s.CompanyID = :company_id
+                AND s.SalesType = :sales_type
+                AND s.SalesDate >= :start_date
+                AND s.SalesDate <  :end_date
+                {region_filter}
+                GROUP BY s.DealerID, cr.RegionName
+            ),
+            RankedDealers AS (
+                SELECT 
+                    DealerID,
+                    RegionName,
+                    TotalUnitsSold,
+                    ROW_NUMBER() OVER (ORDER BY TotalUnitsSold DESC, DealerID) AS SalesRank,
+                    CAST(TotalUnitsSold AS FLOAT) / NULLIF(SUM(TotalUnitsSold) OVER (), 0) AS ShareOfSales
+                FROM DealerSales
+            )
+            SELECT {top} DealerID, RegionName, TotalUnitsSold, SalesRank, ShareOfSales
+            FROM RankedDealers
+            WHERE SalesRank > :offset
+            ORDER BY SalesRank
+        """
+
+# Keyed by whether the region filter applies
+UNITS_SOLD_QUERIES: Dict[bool, TextClause] = {
+    by_region: text(_UNITS_SOLD_SQL.format(region_filter=_REGION_FILTER if by_region else ""))
+    for by_region in (False, True)
+}
+YOY_SALES_QUERIES: Dict[bool, TextClause] = {
+    by_region: text(_YOY_SALES_SQL.format(region_filter=_REGION_FILTER if by_region else ""))
+    for by_region in (False, True)
+}
+MONTHLY_ROLLUP_QUERY: TextClause = text(_MONTHLY_ROLLUP_SQL)
+# Keyed by whether the totals are split by month
+UNITS_BY_REGION_QUERIES: Dict[bool, TextClause] = {
+    False: text(_UNITS_BY_REGION_SQL.format(month_columns="", group_columns="cr.RegionName")),
+    True: text(_UNITS_BY_REGION_SQL.format(
+        month_columns="YEAR(s.SalesDate) AS SalesYear, MONTH(s.SalesDate) AS SalesMonth,",
+        group_columns="cr.RegionName, YEAR(s.SalesDate), MONTH(s.SalesDate)"
+    )),
+}
+# Keyed by (region filter applies, TOP applies)
+UNITS_BY_DEALER_QUERIES: Dict[Tuple[bool, bool], TextClause] = {
+    (by_region, limited): text(_UNITS_BY_DEALER_SQL.format(
+        region_filter=_REGION_FILTER if by_region else "",
+        top="TOP (:limit)" if limited else ""
+    ))
+    for by_region in (False, True)
+    for limited in (False, True)
+}
+
+def _filters_region(region_name: Optional[str]) -> bool:
+    return bool(region_name) and region_name.lower() != "all"
+
+def _sales_params(
+    company_id: str,
+    start_date: date,
+    end_date: date,
+    sales_type: Optional[str] = None,
+    region_name: Optional[str] = None
+) -> Dict[str, Any]:
+    params: Dict[str, Any] = {
+        "company_id": company_id,
+        "start_date": start_date,
+        "end_date": end_date
+    }
+    if sales_type is not None:
+        params["sales_type"] = sales_type
+    if _filters_region(region_name):
+        params["region_name"] = region_name
+    return params
 
 
 class SalesRepo:
@@ -20,41 +177,11 @@ class SalesRepo:
         """
         Fetches UnitsSold and SalesDate from the Sales table for a specific company and date range.
         """
-        query_str = """
-            SELECT 
-                SUM(s.UnitsSold) AS TotalUnitsSold 
-            FROM Sales s
-            LEFT JOIN Dealer d ON d.DealerID = s.DealerID
-            LEFT JOIN CorporateRegion cr ON cr.RegionID = d.CorporateRegionID
-            WHERE s.CompanyID = :company_id
-                AND s.SalesType = :sales_type
-                AND SalesDate >= :start_date
-                AND SalesDate <  :end_date
-        """
-        
-        params = {
-            "company_id": company_id,
-            "sales_type": sales_type,
-            "start_date": start_date,
-            "end_date": end_date
-        }
-
-        if region_name and region_name.lower() != "all":
-            query_str += " AND cr.RegionName = :region_name"
-            params["region_name"] = region_name
-
-        stmt = text(query_str).bindparams(**params)
-
-        compiled = stmt.compile(
-            dialect=mssql.dialect(),
-            compile_kwargs={"literal_binds": True}
+        result = self.db.execute(
+            UNITS_SOLD_QUERIES[_filters_region(region_name)],
+            _sales_params(company_id, start_date, end_date, sales_type, region_name)
         )
 
-        # print("Executing SQL:")
-        # print(compiled)
-
-        result = self.db.execute(text(query_str), params)
-
         return result.scalar_one_or_none()
 
     def get_yoy_sales_total(
@@ -68,51 +195,174 @@ class SalesRepo:
         """
         Fetches UnitsSold and SalesDate from the Sales table for a specific company and date range.
         """
-        query_str = """
-            SELECT 
-                YEAR(SalesDate) AS SalesYear,
-                MONTH(SalesDate) AS SalesMonth,
-                SUM(s.UnitsSold) AS TotalUnitsSold
-            FROM Sales s
-            LEFT JOIN Dealer d ON d.DealerID = s.DealerID
-            LEFT JOIN CorporateRegion cr ON cr.RegionID = d.CorporateRegionID
-            WHERE s.CompanyID = :company_id
-            AND s.SalesType = :sales_type
-            AND SalesDate >= :start_date
-            AND SalesDate <  :end_date
-        """
+        result = self.db.execute(
+            YOY_SALES_QUERIES[_filters_region(region_name)],
+            _sales_params(company_id, start_date, end_date, sales_type, region_name)
+        )
+
+        log.info(f"Result fetched: {result}")
         
-        params = {
-            "company_id": company_id,
-            "sales_type": sales_type,
-            "start_date": start_date,
-            "end_date": end_date
-        }
-
-        if region_name and region_name.lower() != "all":
-            query_str += " AND cr.RegionName = :region_name"
-            params["region_name"] = region_name
-
-        query_str += """
-            GROUP BY 
-                YEAR(SalesDate),
-                MONTH(SalesDate)
-            ORDER BY SalesMonth;
+        return [dict(row._mapping) for row in result]
+
+    def get_monthly_rollup(
+        self,
+        company_id: str,
+        start_date: date,
+        end_date: date
+    ) -> list[dict[str, Any]]:
+        """
+        Fetches units sold per sales type, region and month for a company and
+        date range, the source rows of the monthly sales rollup.
+        """
+        result = self.db.execute(MONTHLY_ROLLUP_QUERY, _sales_params(company_id, start_date, end_date))
+
+        return [dict(row._mapping) for row in result]
+
+    def get_units_sold_by_region(
+        self,
+        company_id: str,
+        start_date: date,
+        end_date: date,
+        sales_type: str,
+        by_month: bool = False
+    ) -> pd.DataFrame:
+        """
+        Fetches units sold for every region in one query, optionally split by
+        month. Returns a frame with RegionName, [SalesYear, SalesMonth] and
+        TotalUnitsSold; sales of dealers without a region have a missing RegionName.
+        """
+        result = self.db.execute(
+            UNITS_BY_REGION_QUERIES[by_month],
+            _sales_params(company_id, start_date, end_date, sales_type)
+        )
+
+        return pd.DataFrame.from_records(result.fetchall(), columns=list(result.keys()))
+
+    def iter_units_sold_by_dealer(
+        self,
+        company_id: str,
+        start_date: date,
+        end_date: date,
+        sales_type: str,
+        region_name: str,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        batch_size: int = 500
+    ) -> Iterator[list[dict[str, Any]]]:
         """
+        Ranks dealers by units sold and yields them in batches, best first,
+        starting after the first `offset` dealers and stopping after `limit`.
+        Ranking, the share of total sales and TOP run in SQL Server and rows
+        are read through a server-side cursor, so memory stays at one batch.
+        """
+        params = _sales_params(company_id, start_date, end_date, sales_type, region_name)
+        params["offset"] = offset
+        if limit is not None:
+            params["limit"] = limit
+
+        query = UNITS_BY_DEALER_QUERIES[(_filters_region(region_name), limit is not None)]
+        result = self.db.execute(
+            query,
+            params,
+            execution_options={"stream_results": True, "yield_per": batch_size}
+        )
+        try:
+            for partition in result.mappings().partitions():
+                yield [dict(row) for row in partition]
+        finally:
+            result.close()
+
 
-        stmt = text(query_str).bindparams(**params)
+class AsyncSalesRepo:
+    """
+    Async counterpart of SalesRepo. Every query runs on the bounded DB
+    executor with its own session, so concurrent callers overlap their
+    round-trips instead of blocking the event loop.
+    """
+
+    async def get_units_sold_by_company_and_date_range(
+        self,
+        company_id: str,
+        start_date: date,
+        end_date: date,
+        sales_type: str,
+        region_name: str
+    ) -> float:
+        return await db_executor.run(
+            lambda db: SalesRepo(db).get_units_sold_by_company_and_date_range(
+                company_id, start_date, end_date, sales_type, region_name
+            )
+        )
+
+    async def get_yoy_sales_total(
+        self,
+        company_id: str,
+        start_date: date,
+        end_date: date,
+        sales_type: str,
+        region_name: str
+    ) -> list[dict[str, Any]]:
+        return await db_executor.run(
+            lambda db: SalesRepo(db).get_yoy_sales_total(
+                company_id, start_date, end_date, sales_type, region_name
+            )
+        )
 
-        compiled = stmt.compile(
-            dialect=mssql.dialect(),
-            compile_kwargs={"literal_binds": True}
+    async def get_monthly_rollup(
+        self,
+        company_id: str,
+        start_date: date,
+        end_date: date
+    ) -> list[dict[str, Any]]:
+        return await db_executor.run(
+            lambda db: SalesRepo(db).get_monthly_rollup(company_id, start_date, end_date)
         )
 
-        # print("Executing SQL:")
-        # print(compiled)
+    async def get_units_sold_by_region(
+        self,
+        company_id: str,
+        start_date: date,
+        end_date: date,
+        sales_type: str,
+        by_month: bool = False
+    ) -> pd.DataFrame:
+        return await db_executor.run(
+            lambda db: SalesRepo(db).get_units_sold_by_region(company_id, start_date, end_date, sales_type, by_month)
+        )
 
-        result = self.db.execute(text(query_str), params)
+    async def get_units_sold_by_dealer(
+        self,
+        company_id: str,
+        start_date: date,
+        end_date: date,
+        sales_type: str,
+        region_name: str,
+        offset: int = 0,
+        limit: Optional[int] = None
+    ) -> list[dict[str, Any]]:
+        return await db_executor.run(
+            lambda db: [
+                row
+                for batch in SalesRepo(db).iter_units_sold_by_dealer(
+                    company_id, start_date, end_date, sales_type, region_name, offset, limit
+                )
+                for row in batch
+            ]
+        )
 
-        from app.lib.logger import log
-        log.info(f"Result fetched: {result}")
-        
-        return [dict(row._mapping) for row in result]
\ No newline at end of file
+    async def stream_units_sold_by_dealer(
+        self,
+        company_id: str,
+        start_date: date,
+        end_date: date,
+        sales_type: str,
+        region_name: str,
+        offset: int = 0,
+        limit: Optional[int] = None
+    ) -> AsyncIterator[list[dict[str, Any]]]:
+        async for batch in db_executor.stream(
+            lambda db: SalesRepo(db).iter_units_sold_by_dealer(
+                company_id, start_date, end_date, sales_type, region_name, offset, limit
+            )
+        ):
+            yield batch
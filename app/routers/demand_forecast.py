@@ -1,8 +1,9 @@
-from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi import APIRouter, HTTPException, Depends, Header, Request
 from app.services.demand_forecast.base import IDemandForecastService
 from app.services.demand_forecast.factory import DemandForecastServiceFactory
 from app.schemas.demand_forecast import DemandForecastRequest, DemandForecastResponse
 from app.lib.logger import log
+from app.lib.response_formats import negotiated_response
 from app.core.client_config import get_client_config, ClientConfig
 
 router = APIRouter(prefix="/demand-forecast", tags=["Demand Forecast"])
@@ -27,18 +28,20 @@ def get_service(config: ClientConfig = Depends(get_config)) -> IDemandForecastSe
         raise HTTPException(status_code=501, detail=str(e))
 
 @router.post("/", response_model=DemandForecastResponse)
-def get_demand_forecast(
+async def get_demand_forecast(
     request: DemandForecastRequest,
+    http_request: Request,
     x_company_id: str = Header(..., alias="x-company-id"),
     service: IDemandForecastService = Depends(get_service)
 ):
     """
-    Endpoint to get demand forecast details.
+    Endpoint to get demand forecast details, as JSON or MessagePack
+    depending on the Accept header.
     """
     try:        
         request.company_id = x_company_id
-        result = service.get_forecast_explanation(request)
-        return result
+        result = await service.get_forecast_explanation(request)
+        return negotiated_response(http_request, result.model_dump(mode="json"), tabular=False)
     except Exception as e:
         log.error(f"Failed to explain demand forecast: {e}")
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
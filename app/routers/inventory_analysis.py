@@ -1,12 +1,24 @@
-from fastapi import APIRouter, HTTPException, Depends, Header
-from app.schemas.inventory_analysis import InventoryAnalysisRequestWithSelection
+import asyncio
+import json
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Optional, Tuple
+from fastapi import APIRouter, HTTPException, Depends, Header, Request
+from fastapi.responses import StreamingResponse
+from app.schemas.inventory_analysis import InventoryAggregationRequest, InventoryAnalysisRequestWithSelection, ResultFormat, StockHealthRequest
 from app.services.inventory_analysis.base import IInventoryAnalysisService
 from app.services.inventory_analysis.factory import InventoryAnalysisServiceFactory
 from app.core.client_config import get_client_config, ClientConfig
 from app.lib.logger import log
+from app.lib.response_formats import negotiated_response, wants_columns
 
 router = APIRouter(prefix="/inventory", tags=["inventory"])
 
+# How often a running request checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = 1.0
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+SSE_MEDIA_TYPE = "text/event-stream"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+
 def get_config(x_company_id: str = Header(..., alias="x-company-id")) -> ClientConfig:
     """
     Dependency to get client configuration based on x-company-id header.
@@ -26,22 +38,172 @@ def get_service(config: ClientConfig = Depends(get_config)) -> IInventoryAnalysi
     except NotImplementedError as e:
         raise HTTPException(status_code=501, detail=str(e))
 
+async def run_until_disconnected(http_request: Request, awaitable: Awaitable[Any]) -> Any:
+    """
+    Runs the service call and cancels it when the client disconnects, so the
+    Athena execution behind it is stopped instead of running to completion.
+    """
+    task = asyncio.ensure_future(awaitable)
+    while True:
+        try:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        if done:
+            return task.result()
+        if await http_request.is_disconnected():
+            log.info(f"Client disconnected from {http_request.url.path}, cancelling the request")
+            task.cancel()
+            # Nobody reads the response; 499 is the conventional "client closed request"
+            raise HTTPException(status_code=499, detail="Client disconnected")
+
 @router.post("/enough-stock")
 async def enough_stock(
     request: InventoryAnalysisRequestWithSelection,
+    http_request: Request,
     service: IInventoryAnalysisService = Depends(get_service)
 ):
     try:
-        return await service.get_enough_stock(request)
+        if wants_columns(http_request):
+            request.result_format = ResultFormat.COLUMNS
+        return negotiated_response(http_request, await run_until_disconnected(http_request, service.get_enough_stock(request)))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/excess-stock")
 async def excess_stock(
     request: InventoryAnalysisRequestWithSelection,
+    http_request: Request,
+    service: IInventoryAnalysisService = Depends(get_service)
+):
+    try:
+        if wants_columns(http_request):
+            request.result_format = ResultFormat.COLUMNS
+        return negotiated_response(http_request, await run_until_disconnected(http_request, service.get_excess_stock(request)))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/aggregate")
+async def aggregate(
+    request: InventoryAggregationRequest,
+    http_request: Request,
+    service: IInventoryAnalysisService = Depends(get_service)
+):
+    try:
+        if wants_columns(http_request):
+            request.result_format = ResultFormat.COLUMNS
+        return negotiated_response(http_request, await run_until_disconnected(http_request, service.aggregate_inventory(request)))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/stock-health")
+async def stock_health(
+    request: StockHealthRequest,
+    http_request: Request,
+    service: IInventoryAnalysisService = Depends(get_service)
+):
+    try:
+        if wants_columns(http_request):
+            request.result_format = ResultFormat.COLUMNS
+        return negotiated_response(http_request, await run_until_disconnected(http_request, service.get_stock_health(request)))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def ndjson_stream(pages: AsyncIterator[Tuple[List[Dict[str, Any]], Optional[str]]]) -> AsyncIterator[str]:
+    """One JSON row per line, sent a page at a time."""
+    try:
+        async for rows, _ in pages:
+            if rows:
+                yield "".join(json.dumps(row, default=str) + "\n" for row in rows)
+    except Exception as e:
+        log.error(f"Inventory stream failed: {str(e)}")
+        yield json.dumps({"error": str(e)}) + "\n"
+
+async def sse_stream(execution_id: str, pages: AsyncIterator[Tuple[List[Dict[str, Any]], Optional[str]]]) -> AsyncIterator[str]:
+    """
+    One `rows` event per page whose id is the nextToken to resume after it,
+    then an `end` event with the row count (or an `error` event).
+    """
+    count = 0
+    try:
+        async for rows, next_token in pages:
+            count += len(rows)
+            yield f"id: {next_token or ''}\nevent: rows\ndata: {json.dumps(rows, default=str)}\n\n"
+        yield f"event: end\ndata: {json.dumps({'executionId': execution_id, 'count': count})}\n\n"
+    except Exception as e:
+        log.error(f"Inventory stream failed: {str(e)}")
+        yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+@router.post("/stream")
+async def stream(
+    request: InventoryAnalysisRequestWithSelection,
+    http_request: Request,
+    service: IInventoryAnalysisService = Depends(get_service)
+):
+    """
+    Streams the whole result set as NDJSON, or as server-sent events when the
+    client accepts text/event-stream. Pages are read from Athena only as fast
+    as the client consumes them.
+    """
+    try:
+        execution_id, pages = await run_until_disconnected(http_request, service.stream_inventory(request))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    headers = {"X-Execution-Id": execution_id}
+    if SSE_MEDIA_TYPE in http_request.headers.get("accept", ""):
+        headers["Cache-Control"] = "no-cache"
+        return StreamingResponse(sse_stream(execution_id, pages), media_type=SSE_MEDIA_TYPE, headers=headers)
+    return StreamingResponse(ndjson_stream(pages), media_type=NDJSON_MEDIA_TYPE, headers=headers)
+
+@router.post("/export", status_code=202)
+async def start_export(
+    request: InventoryAnalysisRequestWithSelection,
+    http_request: Request,
     service: IInventoryAnalysisService = Depends(get_service)
 ):
+    """Starts an UNLOAD of the full result set to Parquet; poll GET /export/{job_id}."""
     try:
-        return await service.get_excess_stock(request)
+        return negotiated_response(http_request, await service.start_export(request), status_code=202, tabular=False)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/export/{job_id}")
+async def get_export(job_id: str, http_request: Request, service: IInventoryAnalysisService = Depends(get_service)):
+    try:
+        return negotiated_response(http_request, await service.get_export(job_id), tabular=False)
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.delete("/export/{job_id}")
+async def cancel_export(job_id: str, http_request: Request, service: IInventoryAnalysisService = Depends(get_service)):
+    try:
+        return negotiated_response(http_request, await service.cancel_export(job_id), tabular=False)
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/export/{job_id}/files/{index}")
+async def download_export_file(job_id: str, index: int, service: IInventoryAnalysisService = Depends(get_service)):
+    """Streams one Parquet part of a finished export from S3."""
+    try:
+        key, chunks = service.open_export_file(job_id, index)
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    filename = key.rsplit("/", 1)[-1]
+    return StreamingResponse(
+        chunks,
+        media_type=PARQUET_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{filename}.parquet"'}
+    )
@@ -1,10 +1,13 @@
-from typing import Any
+import json
+from typing import Any, Dict, List
 from fastapi import APIRouter
-from fastmcp import FastMCP
+from fastmcp import Context, FastMCP
 from app.tools.inventory_tools import inventory_tools
 from app.tools.demand_forecast_tools import demand_forecast_tools
-from app.schemas.inventory_analysis import InventoryAnalysisRequestWithSelection, InventoryAnalysisOutput
+from app.tools.sales_tools import sales_tools
+from app.schemas.inventory_analysis import InventoryAggregationRequest, InventoryAnalysisRequestWithSelection, InventoryAnalysisOutput, StockHealthRequest
 from app.schemas.demand_forecast import DemandForecastRequest, DemandForecastResponse
+from app.schemas.sales import DealerSalesRequest, DealerSalesResponse
 from app.core.context import get_company_id, set_company_id
 from app.lib.logger import log
 from fastmcp.server.dependencies import get_http_request
@@ -63,6 +66,59 @@ async def excess_stock_analysis(
     
     return InventoryAnalysisOutput(**result["structuredContent"])
 
+@mcp.tool(
+    name="inventory_aggregation",
+    description="Aggregate inventory (sum/count/avg/min/max of numeric fields) grouped by columns, e.g. total replenishment quantity by supplier.",
+)
+async def inventory_aggregation(
+    request: InventoryAggregationRequest
+) -> InventoryAnalysisOutput:
+    """Aggregate inventory grouped by columns."""
+    company_id = get_company_id()
+    log.info(f"Aggregating inventory for company: {company_id}")
+    
+    result = await inventory_tools.inventory_aggregation(request.model_dump())
+    
+    return InventoryAnalysisOutput(**result["structuredContent"])
+
+@mcp.tool(
+    name="stock_health_analysis",
+    description="Classify stocks in one pass as not_enough (replenishment quantity > 0), excess (total inventory > target inventory) or healthy, checked in that order. Returns a page of rows per class, or per-class counts with summary=true.",
+)
+async def stock_health_analysis(
+    request: StockHealthRequest
+) -> InventoryAnalysisOutput:
+    """Classify stocks as not enough, excess or healthy."""
+    company_id = get_company_id()
+    log.info(f"Analyzing stock health for company: {company_id}")
+    
+    result = await inventory_tools.stock_health_analysis(request.model_dump())
+    
+    return InventoryAnalysisOutput(**result["structuredContent"])
+
+@mcp.tool(
+    name="inventory_stream",
+    description=(
+        "Stream every row of an inventory query instead of paging with nextToken. "
+        "Rows arrive as NDJSON in progress notifications (send a progressToken); "
+        "the result holds the executionId and row count."
+    ),
+)
+async def inventory_stream(
+    request: InventoryAnalysisRequestWithSelection,
+    ctx: Context
+) -> InventoryAnalysisOutput:
+    """Stream every row of an inventory query as progress notifications."""
+    company_id = get_company_id()
+    log.info(f"Streaming inventory for company: {company_id}")
+
+    async def send_page(rows: List[Dict[str, Any]], count: int) -> None:
+        await ctx.report_progress(progress=count, message="\n".join(json.dumps(row, default=str) for row in rows))
+
+    result = await inventory_tools.inventory_stream(request.model_dump(), send_page)
+    
+    return InventoryAnalysisOutput(**result["structuredContent"])
+
 @mcp.tool(
     name="demand_forecast_details",
     description="Get demand forecast details based on user's query.",
@@ -79,6 +135,28 @@ async def demand_forecast_details(
     return DemandForecastResponse(**result["structuredContent"])
 
 
+@mcp.tool(
+    name="dealer_sales_breakdown",
+    description=(
+        "Rank dealers by units sold for a sales type, region and date range (top N, paginated with nextToken). "
+        "With stream=true every ranked dealer is sent in progress notifications instead of one page."
+    ),
+)
+async def dealer_sales_breakdown(
+    request: DealerSalesRequest,
+    ctx: Context
+) -> DealerSalesResponse:
+    """Rank dealers by units sold."""
+    company_id = get_company_id()
+    log.info(f"Dealer sales breakdown for company: {company_id}")
+
+    async def send_batch(dealers: List[Dict[str, Any]], count: int) -> None:
+        await ctx.report_progress(progress=count, total=request.top_n, message=json.dumps(dealers))
+
+    result = await sales_tools.dealer_sales_breakdown(request.model_dump(), send_batch)
+
+    return DealerSalesResponse(**result["structuredContent"])
+
 # Create streamable HTTP ASGI app
 # We set path="/" so that when mounted at "/mcp" in main.py, 
 # the MCP endpoint is available at exactly "/mcp"
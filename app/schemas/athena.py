@@ -9,3 +9,12 @@ class AthenaPaginatedResult(BaseModel):
     executionId: str
     nextToken: Optional[str] = None
     hasMore: bool
+
+
+class AthenaQuery(BaseModel):
+    """
+    Parameterized Athena query: the query shape with `?` placeholders and
+    the ordered execution parameters bound to them.
+    """
+    query: str
+    parameters: List[str] = []
@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import List, Optional, Union, Generic, TypeVar
+from typing import Dict, List, Optional, Union, Generic, TypeVar
 from pydantic import BaseModel, Field
 
 T = TypeVar('T')
@@ -8,6 +8,12 @@ class SortBy(str, Enum):
     ASC = "ASC"
     DESC = "DESC"
 
+class PaginationMode(str, Enum):
+    # Page through one Athena execution with its nextToken
+    TOKEN = "token"
+    # Push ORDER BY/LIMIT into the SQL; nextToken is a cursor on the sort keys
+    KEYSET = "keyset"
+
 class Condition(str, Enum):
     EQUALS_TO = "equals_to"
     NOT_EQUALS_TO = "not_equals_to"
@@ -24,6 +30,32 @@ class Operations(str, Enum):
     MULTIPLY = "multiply"
     DIVISION = "division"
     MODULO = "modulo"
+    GREATEST = "greatest"
+    LEAST = "least"
+    COALESCE = "coalesce"
+    # Label each row with the first bucket whose range contains value_a
+    BUCKET = "bucket"
+
+class ResultFormat(str, Enum):
+    # One object per row
+    ROWS = "rows"
+    # Column names once, each mapped to its array of values
+    COLUMNS = "columns"
+
+class StockHealth(str, Enum):
+    # Not enough stock: replenishment quantity > 0 (checked first)
+    NOT_ENOUGH = "not_enough"
+    # Excess stock: total inventory > target inventory
+    EXCESS = "excess"
+    # Everything else
+    HEALTHY = "healthy"
+
+class AggregateFunction(str, Enum):
+    SUM = "sum"
+    COUNT = "count"
+    AVG = "avg"
+    MIN = "min"
+    MAX = "max"
 
 class ConditionalValues(BaseModel):
     condition: Optional[Condition] = None
@@ -33,10 +65,27 @@ class ConditionalValues(BaseModel):
     sortBy: Optional[SortBy] = None
     orderBy: Optional[bool] = None
 
-class SelectionOperations(BaseModel):
+class Bucket(BaseModel):
+    label: str
+    # Inclusive lower and exclusive upper bound; None leaves that side open
+    min: Optional[Union[float, int]] = None
+    max: Optional[Union[float, int]] = None
+
+class SelectionExpression(BaseModel):
+    """
+    An expression tree node. Operands are column names, numbers or nested
+    expressions. Arithmetic uses value_a and value_b; greatest, least and
+    coalesce take `values` (or value_a and value_b); bucket maps value_a to
+    the label of the first matching bucket, else `default`.
+    """
     operation: Operations
-    value_a: Union[str, float, int]
-    value_b: Union[str, float, int]
+    value_a: Optional[Union["SelectionExpression", str, float, int]] = None
+    value_b: Optional[Union["SelectionExpression", str, float, int]] = None
+    values: Optional[List[Union["SelectionExpression", str, float, int]]] = None
+    buckets: Optional[List[Bucket]] = None
+    default: Optional[str] = None
+
+class SelectionOperations(SelectionExpression):
     alias: str
     sortBy: Optional[SortBy] = None
     comparison: Optional[ConditionalValues] = None
@@ -82,6 +131,12 @@ class InventoryAnalysisRequest(BaseModel):
     limit: Optional[int] = 20
     executionId: Optional[str] = None
     nextToken: Optional[str] = None
+    pagination: Optional[PaginationMode] = None
+    # Columns to return; None or ["*"] returns every column
+    columns: Optional[List[str]] = None
+    # Only estimate the scan cost of the query, do not run it
+    dry_run: Optional[bool] = None
+    result_format: Optional[ResultFormat] = None
     sku: Optional[str] = None
     supplier: Optional[str] = None
     main_category: Optional[str] = Field(None, alias="main Category")
@@ -113,6 +168,71 @@ class InventoryAnalysisRequest(BaseModel):
 
 class InventoryAnalysisRequestWithSelection(InventoryAnalysisRequest):
     selections: Optional[List[Union[str, SelectionOperations]]] = None
+    # Return only the matching count and numeric statistics, no rows
+    summary: Optional[bool] = None
+
+class NumericSummary(BaseModel):
+    min: Optional[float] = None
+    max: Optional[float] = None
+    avg: Optional[float] = None
+    sum: Optional[float] = None
+
+class InventorySummary(BaseModel):
+    total_count: int
+    stats: Dict[str, NumericSummary] = {}
+
+class Aggregation(BaseModel):
+    function: AggregateFunction
+    # Numeric column to aggregate; omit with count to count rows
+    column: Optional[str] = None
+    alias: Optional[str] = None
+    sortBy: Optional[SortBy] = None
+
+class InventoryAggregationRequest(InventoryAnalysisRequest):
+    group_by: List[str] = []
+    aggregations: List[Aggregation]
+
+class StockHealthRequest(InventoryAnalysisRequestWithSelection):
+    # Restrict the rows (and paging) to one class; None returns a page per class
+    health_class: Optional[StockHealth] = None
+
+class StockHealthClass(BaseModel):
+    count: int
+    hasMore: bool
+    # Pass back as nextToken to fetch the next page of this class
+    nextToken: Optional[str] = None
+
+class ScanEstimate(BaseModel):
+    # None when the table size is unknown
+    estimated_bytes: Optional[int] = None
+    estimated_cost_usd: Optional[float] = None
+    budget_bytes: Optional[int] = None
+    # allowed, downgraded or rejected
+    action: str = "allowed"
+    # Columns the downgraded query was restricted to
+    columns: Optional[List[str]] = None
+    row_limit: Optional[int] = None
+
+class ExportStatus(str, Enum):
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+class ExportFile(BaseModel):
+    key: str
+    size_bytes: int
+    # Presigned GET URL, valid for EXPORT_URL_EXPIRY_SECONDS
+    url: Optional[str] = None
+
+class ExportJob(BaseModel):
+    jobId: str
+    status: ExportStatus
+    executionId: Optional[str] = None
+    # s3:// prefix holding the Parquet parts
+    location: str
+    error: Optional[str] = None
+    files: Optional[List[ExportFile]] = None
+    estimate: Optional[ScanEstimate] = None
 
 class InventoryAnalysisOutput(BaseModel):
     results: str
@@ -120,3 +240,6 @@ class InventoryAnalysisOutput(BaseModel):
     nextToken: Optional[str] = None
     hasMore: bool
     count: int
+    summary: Optional[InventorySummary] = None
+    classes: Optional[Dict[str, StockHealthClass]] = None
+    estimate: Optional[ScanEstimate] = None
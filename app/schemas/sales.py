@@ -0,0 +1,30 @@
+from pydantic import BaseModel
+from typing import List, Optional
+
+class DealerSalesRequest(BaseModel):
+    # ISO dates; the range is [start_date, end_date). Defaults to the last 12 full months
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    sales_type: str = "Retail"
+    region: str = "All"
+    # Only the top N dealers by units sold; None ranks every dealer
+    top_n: Optional[int] = 20
+    limit: Optional[int] = 20
+    nextToken: Optional[str] = None
+    # Send every ranked dealer as progress notifications instead of one page
+    stream: bool = False
+
+class DealerSales(BaseModel):
+    dealer_id: str
+    region: Optional[str] = None
+    units_sold: float
+    # Fraction of the units sold by all dealers matching the filters
+    share: Optional[float] = None
+    rank: int
+
+class DealerSalesResponse(BaseModel):
+    results: List[DealerSales] = []
+    count: int = 0
+    hasMore: bool = False
+    nextToken: Optional[str] = None
+    error: Optional[str] = None
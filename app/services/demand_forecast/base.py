@@ -3,5 +3,5 @@ from app.schemas.demand_forecast import DemandForecastRequest, DemandForecastRes
 
 class IDemandForecastService(ABC):
     @abstractmethod
-    def get_forecast_explanation(self, params: DemandForecastRequest) -> DemandForecastResponse:
+    async def get_forecast_explanation(self, params: DemandForecastRequest) -> DemandForecastResponse:
         pass
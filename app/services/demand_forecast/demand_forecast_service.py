@@ -1,3 +1,4 @@
+import asyncio
 from datetime import datetime
 import pandas as pd
 import numpy as np
@@ -5,8 +6,7 @@ from typing import Optional
 from app.core.config import settings
 from app.lib.s3_client import s3_client
 from app.lib.logger import log
-from app.lib.database import db_manager
-from app.services.sales.sales_service import SalesService
+from app.services.sales.sales_service import AsyncSalesService
 from app.schemas.demand_forecast import DemandForecastRequest, DemandForecastResponse
 
 from app.services.demand_forecast.base import IDemandForecastService
@@ -37,19 +37,19 @@ class TymDemandForecastService(IDemandForecastService):
             0.0062: "99%",
         }
 
-    def get_forecast_explanation(self, params: DemandForecastRequest) -> DemandForecastResponse:
+    async def get_forecast_explanation(self, params: DemandForecastRequest) -> DemandForecastResponse:
         """
         Main entry point to fetch data and calculate metrics.
         """
         try:
-            df = s3_client.read_parquet(bucket=self.bucket, key=self.forecast_parquet_file_key)
+            df = await asyncio.to_thread(s3_client.read_parquet, bucket=self.bucket, key=self.forecast_parquet_file_key)
 
-            return self._calculate_metrics(df, params)
+            return await self._calculate_metrics(df, params)
         except Exception as e:
             log.exception(f"Failed to get demand forecast explanation: {e}")
             raise e
 
-    def _calculate_metrics(self, df: pd.DataFrame, params: DemandForecastRequest) -> DemandForecastResponse:
+    async def _calculate_metrics(self, df: pd.DataFrame, params: DemandForecastRequest) -> DemandForecastResponse:
         """
         Internal method to coordinate calculations.
         """
@@ -81,43 +81,37 @@ class TymDemandForecastService(IDemandForecastService):
 
         forecasted_demand, records_count = result
 
-        # Calculate change vs previous month actual sales
-        change_vs_last_month, prev_month_actual_sales, current_month_forecasted_demand = self._calculate_change_vs_previous_month_actual_sales(
-                        filtered_df, 
-                        target_date, 
-                        params.company_id,
-                        params.sales_type,
-                        params.filter_value
-                    )
-
-        # Calculate change vs same month last year actual sales
-        db = db_manager.get_session()
-        try:
-            sales_service = SalesService(db)
-            change_vs_same_month_last_year, same_month_last_year_actual_sales, _ = self._calculate_change_vs_same_month_last_year(
-                            sales_service=sales_service,
-                            df=filtered_df, 
-                            target_date=target_date, 
-                            company_id=params.company_id,
-                            sales_type=params.sales_type,
-                            region_name=params.filter_value
-                        )
-        finally:
-            db.close()
-        
-        # Calculate coefficient of variation
-        db = db_manager.get_session()
-        try:
-            sales_service = SalesService(db)
-            coefficient_of_variation, actual_sales_yoy_percentage_changes = self._calculate_cv(
-                            sales_service=sales_service,
-                            company_id=params.company_id,
-                            sales_type=params.sales_type,
-                            region_name=params.filter_value,
-                            target_date=target_date
-                        )
-        finally:
-            db.close()
+        # The three sales lookups are independent; run them concurrently on the DB executor
+        sales_service = AsyncSalesService()
+        (
+            (change_vs_last_month, prev_month_actual_sales, current_month_forecasted_demand),
+            (change_vs_same_month_last_year, same_month_last_year_actual_sales, _),
+            (coefficient_of_variation, actual_sales_yoy_percentage_changes),
+        ) = await asyncio.gather(
+            self._calculate_change_vs_previous_month_actual_sales(
+                sales_service=sales_service,
+                df=filtered_df,
+                target_date=target_date,
+                company_id=params.company_id,
+                sales_type=params.sales_type,
+                region_name=params.filter_value
+            ),
+            self._calculate_change_vs_same_month_last_year(
+                sales_service=sales_service,
+                df=filtered_df,
+                target_date=target_date,
+                company_id=params.company_id,
+                sales_type=params.sales_type,
+                region_name=params.filter_value
+            ),
+            self._calculate_cv(
+                sales_service=sales_service,
+                company_id=params.company_id,
+                sales_type=params.sales_type,
+                region_name=params.filter_value,
+                target_date=target_date
+            )
+        )
         
         # Calculate confidence and uncertainty if the request period is monthly
         filtered_df = self._filter_data(df, params, self.forecast_uncertanity_filter_names)
@@ -134,7 +128,7 @@ class TymDemandForecastService(IDemandForecastService):
         trend = None
         all_months_seasonality = {}
 
-        region_time_series_config = s3_client.read_json_as_dict(bucket=self.bucket, key=self.config.s3_region_time_series_config_key)
+        region_time_series_config = await asyncio.to_thread(s3_client.read_json_as_dict, bucket=self.bucket, key=self.config.s3_region_time_series_config_key)
                 
         if params.filter_name == "Region" and params.filter_value.lower() != "all":
             try:
@@ -251,7 +245,7 @@ class TymDemandForecastService(IDemandForecastService):
         """
         return round(float(forecasted_demand / records_count), 2)
 
-    def _calculate_change_vs_previous_month_actual_sales(self, df: pd.DataFrame, target_date: pd.Timestamp, company_id: str, sales_type: str, region_name: str) -> tuple[float, float, float]:
+    async def _calculate_change_vs_previous_month_actual_sales(self, sales_service: AsyncSalesService, df: pd.DataFrame, target_date: pd.Timestamp, company_id: str, sales_type: str, region_name: str) -> tuple[float, float, float]:
         """
         Calculates the percentage change for current month forecasted demand vs previous month's actual sales.
         Uses the Sales table for actual sales data.
@@ -273,18 +267,13 @@ class TymDemandForecastService(IDemandForecastService):
             prev_year = prev_month_date.year
 
             # Fetch actual sales from DB
-            db = db_manager.get_session()
-            try:
-                sales_service = SalesService(db)
-                prev_month_actual_sales = sales_service.get_monthly_sales_total(
-                    company_id=company_id,
-                    year=prev_year,
-                    month=prev_month,
-                    sales_type=sales_type,
-                    region_name=region_name
-                )
-            finally:
-                db.close()
+            prev_month_actual_sales = await sales_service.get_monthly_sales_total(
+                company_id=company_id,
+                year=prev_year,
+                month=prev_month,
+                sales_type=sales_type,
+                region_name=region_name
+            )
 
             if prev_month_actual_sales == 0 or prev_month_actual_sales is None:
                 log.warning(f"No actual sales data found for {prev_year}-{prev_month}")
@@ -297,7 +286,7 @@ class TymDemandForecastService(IDemandForecastService):
             log.exception(f"Error calculating change vs previous month actual sales: {e}")
             return 0.0, 0.0, 0.0
 
-    def _calculate_change_vs_same_month_last_year(self, sales_service: SalesService, df: pd.DataFrame, target_date: pd.Timestamp, company_id: str, sales_type: str, region_name: str) -> tuple[float, float, float]:
+    async def _calculate_change_vs_same_month_last_year(self, sales_service: AsyncSalesService, df: pd.DataFrame, target_date: pd.Timestamp, company_id: str, sales_type: str, region_name: str) -> tuple[float, float, float]:
         """
         Calculates the percentage change for current month forecasted demand vs same month last year.
         Uses the Sales table for actual sales data.
@@ -314,7 +303,7 @@ class TymDemandForecastService(IDemandForecastService):
             same_month_last_year = target_date.replace(year=target_date.year - 1)
             
             try:
-                same_month_last_year_actual_sales = sales_service.get_monthly_sales_total(
+                same_month_last_year_actual_sales = await sales_service.get_monthly_sales_total(
                     company_id=company_id,
                     year=same_month_last_year.year,
                     month=same_month_last_year.month,
@@ -337,9 +326,9 @@ class TymDemandForecastService(IDemandForecastService):
             log.exception(f"Error calculating change vs same month last year actual sales: {e}")
             return 0.0, 0.0, 0.0
     
-    def _calculate_cv(self, sales_service: SalesService, target_date: pd.Timestamp, company_id: str, sales_type: str, region_name: str) -> tuple[float, dict[str, float]]:
+    async def _calculate_cv(self, sales_service: AsyncSalesService, target_date: pd.Timestamp, company_id: str, sales_type: str, region_name: str) -> tuple[float, dict[str, float]]:
         try:
-            forecast_result = sales_service.get_last_12_months_yoy_sales_total(
+            forecast_result = await sales_service.get_last_12_months_yoy_sales_total(
                 company_id=company_id,
                 sales_type=sales_type,
                 region_name=region_name
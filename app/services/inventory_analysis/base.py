@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any
-from app.schemas.inventory_analysis import InventoryAnalysisRequestWithSelection
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from app.schemas.inventory_analysis import InventoryAggregationRequest, InventoryAnalysisRequestWithSelection, StockHealthRequest
 
 class IInventoryAnalysisService(ABC):
     @abstractmethod
@@ -10,3 +10,34 @@ class IInventoryAnalysisService(ABC):
     @abstractmethod
     async def get_excess_stock(self, request: InventoryAnalysisRequestWithSelection) -> Dict[str, Any]:
         pass
+
+    @abstractmethod
+    async def aggregate_inventory(self, request: InventoryAggregationRequest) -> Dict[str, Any]:
+        pass
+
+    @abstractmethod
+    async def get_stock_health(self, request: StockHealthRequest) -> Dict[str, Any]:
+        pass
+
+    @abstractmethod
+    async def stream_inventory(
+        self,
+        request: InventoryAnalysisRequestWithSelection
+    ) -> Tuple[str, AsyncIterator[Tuple[List[Dict[str, Any]], Optional[str]]]]:
+        pass
+
+    @abstractmethod
+    async def start_export(self, request: InventoryAnalysisRequestWithSelection) -> Dict[str, Any]:
+        pass
+
+    @abstractmethod
+    async def get_export(self, job_id: str) -> Dict[str, Any]:
+        pass
+
+    @abstractmethod
+    async def cancel_export(self, job_id: str) -> Dict[str, Any]:
+        pass
+
+    @abstractmethod
+    def open_export_file(self, job_id: str, index: int) -> Tuple[str, Iterator[bytes]]:
+        pass
@@ -0,0 +1,71 @@
+import asyncio
+import time
+from typing import Dict, Optional, Tuple
+from app.core.config import settings
+from app.lib.athena import ATHENA_DECIMAL_TYPES, ATHENA_FLOAT_TYPES, ATHENA_INTEGER_TYPES, athena_client
+from app.lib.logger import log
+
+NUMERIC_TYPES = ATHENA_INTEGER_TYPES | ATHENA_FLOAT_TYPES | ATHENA_DECIMAL_TYPES
+
+class ColumnTypeRegistry:
+    """
+    Per-tenant cache of column types loaded from the Glue/Athena table schema.
+    The query builder uses it to compare numeric columns natively instead of
+    wrapping them in CAST(... AS DOUBLE), which keeps Parquet statistics and
+    partition pruning usable.
+    """
+    def __init__(
+        self,
+        ttl_seconds: int = settings.ATHENA_SCHEMA_CACHE_TTL,
+        retry_seconds: int = settings.ATHENA_SCHEMA_RETRY_SECONDS
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.retry_seconds = retry_seconds
+        # (database, table) -> (loaded_at, column types)
+        self._cache: Dict[Tuple[str, str], Tuple[float, Dict[str, str]]] = {}
+        # (database, table) -> time of the last failed load
+        self._failed_at: Dict[Tuple[str, str], float] = {}
+
+    @staticmethod
+    def is_numeric(column_type: Optional[str]) -> bool:
+        if not column_type:
+            return False
+        return column_type.split("(")[0].strip().lower() in NUMERIC_TYPES
+
+    async def get_column_types(self, database: Optional[str], table_name: Optional[str]) -> Dict[str, str]:
+        """
+        Returns the cached column types for the table, loading them on first use
+        or once the TTL expires. Returns an empty mapping if the schema cannot be
+        loaded, in which case the builder falls back to CAST for every column.
+        A failed load is not retried for retry_seconds.
+        """
+        if not database or not table_name:
+            return {}
+
+        key = (database, table_name)
+        cached = self._cache.get(key)
+        if cached and time.monotonic() - cached[0] < self.ttl_seconds:
+            return cached[1]
+
+        failed_at = self._failed_at.get(key)
+        if failed_at is not None and time.monotonic() - failed_at < self.retry_seconds:
+            return cached[1] if cached else {}
+
+        try:
+            column_types = await asyncio.to_thread(athena_client.get_table_columns, database, table_name)
+            log.info(f"Loaded {len(column_types)} column types for {database}.{table_name}")
+        except Exception as e:
+            log.warning(f"Could not load column types for {database}.{table_name}, retrying in {self.retry_seconds}s: {str(e)}")
+            self._failed_at[key] = time.monotonic()
+            # Keep serving a stale schema rather than dropping back to CAST
+            return cached[1] if cached else {}
+
+        self._failed_at.pop(key, None)
+        self._cache[key] = (time.monotonic(), column_types)
+        return column_types
+
+    def invalidate(self, database: str, table_name: str) -> None:
+        self._cache.pop((database, table_name), None)
+        self._failed_at.pop((database, table_name), None)
+
+column_type_registry = ColumnTypeRegistry()
@@ -0,0 +1,162 @@
+import asyncio
+import hashlib
+import time
+import uuid
+from dataclasses import dataclass, replace
+from typing import Dict, FrozenSet, Optional, Tuple
+from urllib.parse import urlparse
+from app.core.client_config import ClientConfig
+from app.core.config import settings
+from app.lib.athena import QueryPriority, athena_client
+from app.lib.logger import log
+from app.lib.s3_client import s3_client
+from app.services.inventory_analysis.query_builder_service import query_builder_service
+from app.services.inventory_analysis.query_plan import Predicate, QueryPlan, SortKey, inline_parameters
+
+@dataclass(frozen=True)
+class MaterializedShape:
+    table_name: str
+    source_table: str
+    predicates: FrozenSet[Predicate]
+    location: str
+    created_at: float
+
+    @property
+    def age_seconds(self) -> float:
+        return time.monotonic() - self.created_at
+
+class HotQueryMaterializer:
+    """
+    Materializes the hottest filter shapes of an inventory table (as counted
+    by QueryBuilderService) into pre-filtered, pre-sorted Parquet tables with
+    CTAS, and rewrites plans whose predicates include a materialized shape to
+    read that table with only the remaining predicates.
+
+    Tables are rebuilt every refresh interval while their shape stays hot;
+    a table is used only while younger than twice that interval, so a stale
+    copy of the source table is never read for long.
+    """
+    def __init__(
+        self,
+        enabled: bool = settings.MATERIALIZATION_ENABLED,
+        top_shapes: int = settings.MATERIALIZATION_TOP_SHAPES,
+        min_hits: int = settings.MATERIALIZATION_MIN_HITS,
+        refresh_seconds: int = settings.MATERIALIZATION_REFRESH_SECONDS
+    ):
+        self.enabled = enabled
+        self.top_shapes = top_shapes
+        self.min_hits = min_hits
+        self.refresh_seconds = refresh_seconds
+        # (database, source table, predicates) -> materialized table
+        self._shapes: Dict[Tuple[str, str, FrozenSet[Predicate]], MaterializedShape] = {}
+        self._refresh_tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._last_refresh: Dict[Tuple[str, str], float] = {}
+
+    def rewrite(self, config: ClientConfig, plan: QueryPlan) -> QueryPlan:
+        """
+        Returns the plan reading the narrowest fresh materialized table that
+        covers it, or the plan unchanged.
+        """
+        if not self.enabled or not config.athena_database or not config.s3_athena_output_location:
+            return plan
+
+        self._schedule_refresh(config, plan.table_name)
+
+        best: Optional[MaterializedShape] = None
+        for (database, source_table, predicates), shape in self._shapes.items():
+            if database != config.athena_database or source_table != plan.table_name:
+                continue
+            if shape.age_seconds >= 2 * self.refresh_seconds or not predicates.issubset(plan.predicates):
+                continue
+            if best is None or len(predicates) > len(best.predicates):
+                best = shape
+
+        if best is None:
+            return plan
+        log.info(f"Rewrote inventory query to read materialized table {best.table_name}")
+        return replace(
+            plan,
+            table_name=best.table_name,
+            predicates=tuple(p for p in plan.predicates if p not in best.predicates)
+        )
+
+    def _schedule_refresh(self, config: ClientConfig, table_name: str) -> None:
+        key = (config.athena_database, table_name)
+        if time.monotonic() - self._last_refresh.get(key, float("-inf")) < self.refresh_seconds:
+            return
+        task = self._refresh_tasks.get(key)
+        if task is not None and not task.done():
+            return
+        self._last_refresh[key] = time.monotonic()
+        self._refresh_tasks[key] = asyncio.create_task(self._refresh(config, table_name))
+
+    async def _refresh(self, config: ClientConfig, table_name: str) -> None:
+        database = config.athena_database
+        hot = query_builder_service.hot_shapes(table_name, self.top_shapes, self.min_hits)
+        hot_predicates = {predicates for predicates, _ in hot}
+
+        for predicates, order_by in hot:
+            try:
+                await self._materialize(config, table_name, predicates, order_by)
+            except Exception as e:
+                log.error(f"Failed to materialize hot query shape of {database}.{table_name}: {str(e)}")
+
+        # Shapes that cooled down are dropped
+        for key in [k for k in self._shapes if k[:2] == (database, table_name) and k[2] not in hot_predicates]:
+            asyncio.create_task(self._drop(config, self._shapes.pop(key), delay_seconds=settings.ATHENA_QUERY_TIMEOUT_SECONDS))
+
+    async def _materialize(
+        self,
+        config: ClientConfig,
+        table_name: str,
+        predicates: FrozenSet[Predicate],
+        order_by: Tuple[SortKey, ...]
+    ) -> None:
+        shape_id = hashlib.sha1(repr((table_name, sorted(map(repr, predicates)))).encode("utf-8")).hexdigest()[:16]
+        materialized_name = f"mv_{shape_id}_{uuid.uuid4().hex[:8]}"
+        location = f"{config.s3_athena_output_location.rstrip('/')}/materialized/{materialized_name}/"
+
+        # Predicates are sorted so the same shape always renders the same SQL
+        plan = QueryPlan(table_name=table_name, predicates=tuple(sorted(predicates, key=repr)), order_by=order_by)
+        select_sql, parameters = plan.sql
+        ctas = (
+            f"CREATE TABLE {materialized_name} "
+            f"WITH (format = 'PARQUET', write_compression = 'SNAPPY', external_location = '{location}') "
+            f"AS {inline_parameters(select_sql, parameters)}"
+        )
+
+        start = time.monotonic()
+        await athena_client.execute(
+            query=ctas,
+            database=config.athena_database,
+            output_location=config.s3_athena_output_location,
+            workgroup=config.athena_workgroup,
+            priority=QueryPriority.BULK
+        )
+        log.info(f"Materialized {config.athena_database}.{materialized_name} from {table_name} in {time.monotonic() - start:.2f}s")
+
+        key = (config.athena_database, table_name, predicates)
+        previous = self._shapes.get(key)
+        self._shapes[key] = MaterializedShape(materialized_name, table_name, predicates, location, time.monotonic())
+        if previous is not None:
+            # Queries submitted just before the swap may still be reading it
+            asyncio.create_task(self._drop(config, previous, delay_seconds=settings.ATHENA_QUERY_TIMEOUT_SECONDS))
+
+    async def _drop(self, config: ClientConfig, shape: MaterializedShape, delay_seconds: float = 0) -> None:
+        await asyncio.sleep(delay_seconds)
+        try:
+            await athena_client.execute(
+                query=f"DROP TABLE IF EXISTS {shape.table_name}",
+                database=config.athena_database,
+                output_location=config.s3_athena_output_location,
+                workgroup=config.athena_workgroup,
+                priority=QueryPriority.BULK
+            )
+            # Dropping an external table leaves its data behind
+            location = urlparse(shape.location)
+            await asyncio.to_thread(s3_client.delete_prefix, location.netloc, location.path.lstrip("/"))
+            log.info(f"Dropped materialized table {shape.table_name}")
+        except Exception as e:
+            log.warning(f"Could not drop materialized table {shape.table_name}: {str(e)}")
+
+hot_query_materializer = HotQueryMaterializer()
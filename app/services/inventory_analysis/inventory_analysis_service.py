@@ -1,41 +1,457 @@
-from app.lib.athena import athena_client
-from typing import Dict, Any
-from app.schemas.inventory_analysis import InventoryAnalysisRequestWithSelection
-from app.services.inventory_analysis.query_builder_service import query_builder_service
+from dataclasses import replace
+from app.lib.athena import QueryPriority, athena_client
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from app.core.config import settings
+from app.schemas.athena import AthenaQuery
+from app.schemas.inventory_analysis import (
+    InventoryAggregationRequest,
+    InventoryAnalysisRequest,
+    InventoryAnalysisRequestWithSelection,
+    InventorySummary,
+    NumericSummary,
+    PaginationMode,
+    ResultFormat,
+    ScanEstimate,
+    StockHealth,
+    StockHealthRequest
+)
+from app.services.inventory_analysis.query_builder_service import (
+    query_builder_service,
+    SUMMARY_COUNT_ALIAS,
+    STOCK_HEALTH_COLUMN,
+    STOCK_HEALTH_COUNT,
+    STOCK_HEALTH_INPUTS,
+    STOCK_HEALTH_RANK
+)
+from app.services.inventory_analysis.column_type_registry import column_type_registry
+from app.services.inventory_analysis.local_inventory_engine import local_inventory_engine
+from app.services.inventory_analysis.result_cache import inventory_result_cache
+from app.services.inventory_analysis.scan_cost_estimator import scan_cost_estimator
+from app.services.inventory_analysis.hot_query_materializer import hot_query_materializer
+from app.services.inventory_analysis.inventory_exporter import inventory_exporter
+from app.services.inventory_analysis.query_plan import QueryPlan, encode_keyset_cursor, decode_keyset_cursor
 from app.services.inventory_analysis.base import IInventoryAnalysisService
 from app.core.client_config import ClientConfig
 from app.lib.logger import log
 
+# Athena returns at most 1000 rows per GetQueryResults call, and the first
+# call spends one of them on the header row
+MAX_KEYSET_PAGE_SIZE = 998
+
+# A stock health page holds up to `limit` rows of each of the three classes
+MAX_STOCK_HEALTH_PAGE_SIZE = (MAX_KEYSET_PAGE_SIZE + 1) // len(StockHealth)
+
+# Prefix of executionId/nextToken values issued for local snapshot results
+LOCAL_TOKEN_PREFIX = "local:"
+
+# Prefix of executionId/nextToken values issued for cached result pages
+CACHE_TOKEN_PREFIX = "cache:"
+
 class MaxliteInventoryAnalysisService(IInventoryAnalysisService):
     def __init__(self, config: ClientConfig):
         self.config = config
 
-    async def get_enough_stock(self, request: InventoryAnalysisRequestWithSelection) -> Dict[str, Any]:
+    async def _get_column_types(self) -> Dict[str, str]:
+        return await column_type_registry.get_column_types(
+            self.config.athena_database,
+            self.config.inventory_replenishment_table
+        )
+
+    async def _run_athena(self, query: AthenaQuery, request: InventoryAnalysisRequest, max_results: int) -> Dict[str, Any]:
+        return await athena_client.run_query(
+            columnar=request.result_format == ResultFormat.COLUMNS,
+            query=query.query,
+            parameters=query.parameters,
+            execution_id=request.executionId,
+            next_token=request.nextToken,
+            max_results=max_results,
+            database=self.config.athena_database,
+            output_location=self.config.s3_athena_output_location,
+            workgroup=self.config.athena_workgroup
+        )
+
+    def _run_local(self, plan: QueryPlan, request: InventoryAnalysisRequest) -> Optional[Dict[str, Any]]:
+        """
+        Answers the plan from the in-memory snapshot when one is fresh enough.
+        Returns None to fall back to Athena. Pages of a local result carry
+        local tokens and are always served from the same snapshot.
+        """
+        is_local_page = bool(request.executionId and request.executionId.startswith(LOCAL_TOKEN_PREFIX))
+        if request.executionId and not is_local_page:
+            return None
+        if request.nextToken and not request.nextToken.startswith(LOCAL_TOKEN_PREFIX):
+            return None
+        if not settings.INVENTORY_SNAPSHOT_ENABLED or not local_inventory_engine.can_execute(plan):
+            if is_local_page:
+                raise Exception("Local result set is no longer available, re-run the query without executionId")
+            return None
+
+        snapshot = local_inventory_engine.get_snapshot(self.config)
+        if snapshot is None or (is_local_page and request.executionId != f"{LOCAL_TOKEN_PREFIX}{snapshot.version}"):
+            if is_local_page:
+                raise Exception("Local result set is no longer available, re-run the query without executionId")
+            return None
+
+        limit = request.limit or 20
+        offset = int(request.nextToken[len(LOCAL_TOKEN_PREFIX):]) if request.nextToken else 0
         try:
-            log.info(f"Request received for inventory analysis: {request}")
-            
-            # Cast to Selection type if needed, or just pass as is if it's compatible
-            query = await query_builder_service.build_query(request, table_name=self.config.inventory_replenishment_table)
-            log.info(f"Athena query: {query}")
+            results, total = local_inventory_engine.execute(snapshot, plan, offset=offset, limit=limit, columnar=request.result_format == ResultFormat.COLUMNS)
+        except Exception as e:
+            if is_local_page:
+                raise
+            log.warning(f"Local snapshot could not answer the query, falling back to Athena: {str(e)}")
+            return None
+        log.info(f"Answered inventory query from local snapshot {snapshot.version} ({total} matching rows)")
+
+        count = max(0, min(limit, total - offset))
+        has_more = offset + count < total
+        return {
+            "results": results,
+            "executionId": f"{LOCAL_TOKEN_PREFIX}{snapshot.version}",
+            "nextToken": f"{LOCAL_TOKEN_PREFIX}{offset + count}" if has_more else None,
+            "hasMore": has_more,
+            "count": count
+        }
+
+    def _run_cached(self, plan: QueryPlan, request: InventoryAnalysisRequest, column_types: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """
+        Answers the plan by filtering a cached result of a broader query on
+        the same table. Returns None to fall back to Athena.
+        """
+        is_cache_page = bool(request.executionId and request.executionId.startswith(CACHE_TOKEN_PREFIX))
+        if request.executionId and not is_cache_page:
+            return None
+        if request.nextToken and not request.nextToken.startswith(CACHE_TOKEN_PREFIX):
+            return None
+
+        if is_cache_page:
+            entry = inventory_result_cache.get(request.executionId[len(CACHE_TOKEN_PREFIX):])
+            if entry is None:
+                raise Exception("Cached result set is no longer available, re-run the query without executionId")
+        else:
+            entry = inventory_result_cache.find(self.config.athena_database, plan, column_types)
+            if entry is None:
+                return None
+
+        limit = request.limit or 20
+        offset = int(request.nextToken[len(CACHE_TOKEN_PREFIX):]) if request.nextToken else 0
+        # Only the predicates the cached query did not already apply are left to evaluate
+        residual = replace(plan, predicates=tuple(p for p in plan.predicates if p not in entry.predicates))
+        try:
+            results, total = local_inventory_engine.execute_table(entry.table, residual, offset=offset, limit=limit, columnar=request.result_format == ResultFormat.COLUMNS)
+        except Exception as e:
+            if is_cache_page:
+                raise
+            log.warning(f"Cached result could not answer the query, falling back to Athena: {str(e)}")
+            return None
+        log.info(f"Answered inventory query from cached result {entry.id} ({total} matching rows)")
+
+        count = max(0, min(limit, total - offset))
+        has_more = offset + count < total
+        return {
+            "results": results,
+            "executionId": f"{CACHE_TOKEN_PREFIX}{entry.id}",
+            "nextToken": f"{CACHE_TOKEN_PREFIX}{offset + count}" if has_more else None,
+            "hasMore": has_more,
+            "count": count
+        }
+
+    async def _preflight(self, plan: QueryPlan, request: InventoryAnalysisRequest, allow_downgrade: bool = True) -> Tuple[QueryPlan, Optional[ScanEstimate]]:
+        """
+        Estimates the scan of a plan about to be submitted to Athena and
+        applies the tenant scan budget. Returns the plan to run and the
+        estimate, or no estimate when there is no budget and no dry run.
+        Continuing an existing execution scans nothing and is not checked.
+        """
+        budget = self.config.athena_scan_budget_bytes or settings.ATHENA_SCAN_BUDGET_BYTES
+        if request.executionId or not (budget or request.dry_run):
+            return plan, None
+
+        checked, estimate = await scan_cost_estimator.check(plan, self.config.athena_database, budget)
+        if not allow_downgrade and estimate.action == "downgraded":
+            estimate = await scan_cost_estimator.estimate(plan, self.config.athena_database)
+            estimate.budget_bytes = budget
+            estimate.action = "rejected"
+            return plan, estimate
+        return checked, estimate
+
+    async def _prepare_athena_plan(self, plan: QueryPlan, request: InventoryAnalysisRequest, allow_downgrade: bool = True) -> Tuple[QueryPlan, Optional[ScanEstimate]]:
+        """
+        Points the plan at a materialized hot-shape table when one covers it,
+        then applies the scan budget to what will actually run.
+        """
+        return await self._preflight(hot_query_materializer.rewrite(self.config, plan), request, allow_downgrade)
+
+    @staticmethod
+    def _format_results(response: Dict[str, Any], request: InventoryAnalysisRequest) -> Dict[str, Any]:
+        """Turns a page of rows into column arrays when the columns format was requested."""
+        results = response.get("results")
+        if request.result_format == ResultFormat.COLUMNS and isinstance(results, list):
+            names = list(dict.fromkeys(name for row in results for name in row))
+            response["results"] = {name: [row.get(name) for row in results] for name in names}
+        return response
+
+    @staticmethod
+    def _estimate_response(estimate: ScanEstimate) -> Dict[str, Any]:
+        """Response of a dry run or of a query rejected by the scan budget."""
+        return {
+            "results": [],
+            "executionId": "",
+            "nextToken": None,
+            "hasMore": False,
+            "count": 0,
+            "estimate": estimate.model_dump()
+        }
+
+    @staticmethod
+    def _with_estimate(response: Dict[str, Any], estimate: Optional[ScanEstimate]) -> Dict[str, Any]:
+        if estimate is not None:
+            response["estimate"] = estimate.model_dump()
+        return response
+
+    async def _run_inventory_query(self, request: InventoryAnalysisRequestWithSelection) -> Dict[str, Any]:
+        column_types = await self._get_column_types()
+        plan = query_builder_service.compile(request, self.config.inventory_replenishment_table, column_types)
+
+        if request.dry_run:
+            target = query_builder_service.build_summary(plan, column_types) if request.summary else plan
+            return self._estimate_response((await self._prepare_athena_plan(target, request, allow_downgrade=not request.summary))[1])
+
+        if request.summary:
+            return await self._run_summary_query(plan, request, column_types)
+
+        local = self._run_local(plan, request)
+        if local is not None:
+            return local
+
+        cached = self._run_cached(plan, request, column_types)
+        if cached is not None:
+            return cached
+
+        athena_plan, estimate = await self._prepare_athena_plan(plan, request)
+        if estimate is not None and estimate.action == "rejected":
+            return self._estimate_response(estimate)
+
+        if request.pagination == PaginationMode.KEYSET:
+            return self._with_estimate(await self._run_keyset_query(athena_plan, request, column_types), estimate)
+
+        query = athena_plan.to_athena_query()
+        log.info(f"Athena query: {query.query} parameters: {query.parameters}")
+
+        data = await self._run_athena(query, request, max_results=request.limit or 20)
+        if not request.executionId and athena_plan is plan:
+            # Keep the full result around so narrower follow-up queries skip Athena
+            inventory_result_cache.schedule_populate(self.config.athena_database, plan, data['executionId'], column_types)
+
+        results = data['results']
+        return self._with_estimate({
+            "results": results,
+            "executionId": data['executionId'],
+            "nextToken": data['nextToken'],
+            "hasMore": data['hasMore'],
+            "count": data['count']
+        }, estimate)
+
+    async def _run_keyset_query(self, plan: QueryPlan, request: InventoryAnalysisRequestWithSelection, column_types: Dict[str, str]) -> Dict[str, Any]:
+        """
+        Runs one page as its own `ORDER BY ... LIMIT` query. One extra row is
+        fetched to know whether another page exists; the returned nextToken is
+        a cursor holding the last row's sort key values.
+        """
+        limit = min(request.limit or 20, MAX_KEYSET_PAGE_SIZE)
+        cursor = decode_keyset_cursor(request.nextToken) if request.nextToken else None
+        page_plan = query_builder_service.build_keyset_page(plan, limit + 1, cursor, column_types)
+
+        query = page_plan.to_athena_query()
+        log.info(f"Athena keyset query: {query.query} parameters: {query.parameters}")
+
+        data = await athena_client.run_query(
+            query=query.query,
+            parameters=query.parameters,
+            # page + lookahead row + header row
+            max_results=limit + 2,
+            database=self.config.athena_database,
+            output_location=self.config.s3_athena_output_location,
+            workgroup=self.config.athena_workgroup
+        )
+
+        results = data['results']
+        has_more = len(results) > limit
+        results = results[:limit]
+
+        next_token = None
+        if has_more:
+            last_row = results[-1]
+            next_token = encode_keyset_cursor([last_row.get(key.column) for key in page_plan.order_by])
+
+        return {
+            "results": results,
+            "executionId": data['executionId'],
+            "nextToken": next_token,
+            "hasMore": has_more,
+            "count": len(results)
+        }
+
+    async def _run_summary_query(self, plan: QueryPlan, request: InventoryAnalysisRequestWithSelection, column_types: Dict[str, str]) -> Dict[str, Any]:
+        """
+        Answers count/statistics questions with one aggregate query, locally
+        when a snapshot is available, and returns no rows.
+        """
+        summary_plan = query_builder_service.build_summary(plan, column_types)
+
+        first_page = request.model_copy(update={"executionId": None, "nextToken": None, "result_format": None})
+        data = self._run_local(summary_plan, first_page)
+        if data is None:
+            data = self._run_cached(summary_plan, first_page, column_types)
+        estimate = None
+        if data is None:
+            summary_plan, estimate = await self._prepare_athena_plan(summary_plan, first_page, allow_downgrade=False)
+            if estimate is not None and estimate.action == "rejected":
+                return self._estimate_response(estimate)
+
+            query = summary_plan.to_athena_query()
+            log.info(f"Athena summary query: {query.query} parameters: {query.parameters}")
+
+            data = await athena_client.run_query(
+                query=query.query,
+                parameters=query.parameters,
+                max_results=2,
+                database=self.config.athena_database,
+                output_location=self.config.s3_athena_output_location,
+                workgroup=self.config.athena_workgroup
+            )
+
+        row = data['results'][0] if data['results'] else {}
+        stats: Dict[str, Dict[str, Any]] = {}
+        for alias, value in row.items():
+            if alias == SUMMARY_COUNT_ALIAS:
+                continue
+            fn, column = alias.split(":", 1)
+            stats.setdefault(column, {})[fn] = float(value) if value is not None else None
+
+        summary = InventorySummary(
+            total_count=int(row.get(SUMMARY_COUNT_ALIAS) or 0),
+            stats={column: NumericSummary(**values) for column, values in stats.items()}
+        )
+        return self._with_estimate({
+            "results": [],
+            "executionId": data['executionId'],
+            "nextToken": None,
+            "hasMore": False,
+            "count": 0,
+            "summary": summary.model_dump()
+        }, estimate)
+
+    @staticmethod
+    def _decode_health_token(token: str) -> Tuple[StockHealth, int]:
+        try:
+            health_class, offset = token.split(":", 1)
+            return StockHealth(health_class), int(offset)
+        except ValueError:
+            raise Exception(f"Invalid stock health nextToken: {token}")
+
+    async def _run_stock_health_counts(self, plan: QueryPlan, column_types: Dict[str, str]) -> Dict[str, Any]:
+        counts_plan = query_builder_service.build_stock_health_counts(plan, column_types)
+        query = counts_plan.to_athena_query()
+        log.info(f"Athena stock health counts query: {query.query} parameters: {query.parameters}")
+
+        data = await athena_client.run_query(
+            query=query.query,
+            parameters=query.parameters,
+            max_results=2,
+            database=self.config.athena_database,
+            output_location=self.config.s3_athena_output_location,
+            workgroup=self.config.athena_workgroup
+        )
+
+        row = data['results'][0] if data['results'] else {}
+        counts = {c.value: int(row.get(c.value) or 0) for c in StockHealth}
+        return {
+            "results": [],
+            "executionId": data['executionId'],
+            "nextToken": None,
+            "hasMore": False,
+            "count": 0,
+            "summary": InventorySummary(total_count=sum(counts.values())).model_dump(),
+            # A class token with offset 0 fetches the first page of that class
+            "classes": {
+                name: {"count": count, "hasMore": count > 0, "nextToken": f"{name}:0" if count > 0 else None}
+                for name, count in counts.items()
+            }
+        }
+
+    async def get_stock_health(self, request: StockHealthRequest) -> Dict[str, Any]:
+        """
+        Classifies the filtered rows as not_enough/excess/healthy in one Athena
+        scan and returns a page of rows per class (or of the requested
+        class), or only the per-class counts in summary mode.
+        """
+        try:
+            log.info(f"Request received for stock health analysis: {request}")
+            column_types = await self._get_column_types()
+            plan = query_builder_service.compile(request, self.config.inventory_replenishment_table, column_types)
+
+            plan = hot_query_materializer.rewrite(self.config, plan)
+            # The classification reads its input columns whatever the projection
+            scan_plan = replace(plan, columns=plan.columns + STOCK_HEALTH_INPUTS) if plan.columns is not None else plan
+            _, estimate = await self._preflight(scan_plan, request, allow_downgrade=False)
+            if estimate is not None and (request.dry_run or estimate.action == "rejected"):
+                return self._estimate_response(estimate)
+
+            if request.summary:
+                return self._with_estimate(await self._run_stock_health_counts(plan, column_types), estimate)
+
+            health_class, offset = request.health_class, 0
+            if request.nextToken:
+                health_class, offset = self._decode_health_token(request.nextToken)
+            classes = [health_class] if health_class is not None else list(StockHealth)
+            limit = min(request.limit or 20, MAX_KEYSET_PAGE_SIZE if health_class is not None else MAX_STOCK_HEALTH_PAGE_SIZE)
+
+            query = query_builder_service.build_stock_health_page(plan, limit, offset, health_class, column_types)
+            log.info(f"Athena stock health query: {query.query} parameters: {query.parameters}")
 
             data = await athena_client.run_query(
-                query=query,
-                execution_id=request.executionId,
-                next_token=request.nextToken,
-                max_results=request.limit or 20,
+                query=query.query,
+                parameters=query.parameters,
+                # every class page + header row
+                max_results=limit * len(classes) + 1,
                 database=self.config.athena_database,
                 output_location=self.config.s3_athena_output_location,
                 workgroup=self.config.athena_workgroup
             )
 
+            counts: Dict[str, int] = {}
             results = data['results']
-            return {
+            for row in results:
+                counts.setdefault(row.get(STOCK_HEALTH_COLUMN), int(row.pop(STOCK_HEALTH_COUNT) or 0))
+                row.pop(STOCK_HEALTH_RANK, None)
+
+            class_pages = {}
+            for c in classes:
+                count = counts.get(c.value, 0)
+                has_more = count > offset + limit
+                class_pages[c.value] = {
+                    "count": count,
+                    "hasMore": has_more,
+                    "nextToken": f"{c.value}:{offset + limit}" if has_more else None
+                }
+
+            return self._format_results(self._with_estimate({
                 "results": results,
                 "executionId": data['executionId'],
-                "nextToken": data['nextToken'],
-                "hasMore": data['hasMore'],
-                "count": len(results)
-            }
+                "nextToken": class_pages[health_class.value]["nextToken"] if health_class is not None else None,
+                "hasMore": any(page["hasMore"] for page in class_pages.values()),
+                "count": len(results),
+                "classes": class_pages
+            }, estimate), request)
+        except Exception as e:
+            log.error(f"Error in get_stock_health: {str(e)}")
+            raise Exception(str(e))
+
+    async def get_enough_stock(self, request: InventoryAnalysisRequestWithSelection) -> Dict[str, Any]:
+        try:
+            log.info(f"Request received for inventory analysis: {request}")
+            return self._format_results(await self._run_inventory_query(request), request)
         except Exception as e:
             log.error(f"Error in get_enough_stock: {str(e)}")
             raise Exception(str(e))
@@ -43,27 +459,120 @@ class MaxliteInventoryAnalysisService(IInventoryAnalysisService):
     async def get_excess_stock(self, request: InventoryAnalysisRequestWithSelection) -> Dict[str, Any]:
         try:
             log.info(f"Request received for inventory analysis: {request}")
-            query = await query_builder_service.build_query(request, table_name=self.config.inventory_replenishment_table)
-            log.info(f"Athena query: {query}")
+            return self._format_results(await self._run_inventory_query(request), request)
+        except Exception as e:
+            log.error(f"Error in get_excess_stock: {str(e)}")
+            raise Exception(str(e))
 
-            data = await athena_client.run_query(
-                query=query,
-                execution_id=request.executionId,
-                next_token=request.nextToken,
-                max_results=request.limit or 20,
-                database=self.config.athena_database,
-                output_location=self.config.s3_athena_output_location,
-                workgroup=self.config.athena_workgroup
+    async def stream_inventory(
+        self,
+        request: InventoryAnalysisRequestWithSelection
+    ) -> Tuple[str, AsyncIterator[Tuple[List[Dict[str, Any]], Optional[str]]]]:
+        """
+        Runs the query on Athena and returns its executionId with an iterator
+        over the full result set, one page at a time. Passing executionId
+        (and nextToken) streams an existing execution from that page on.
+        Exports are never downgraded: an over-budget query is rejected.
+        """
+        try:
+            log.info(f"Request received for inventory stream: {request}")
+            execution_id = request.executionId
+            if execution_id:
+                if execution_id.startswith((LOCAL_TOKEN_PREFIX, CACHE_TOKEN_PREFIX)):
+                    raise Exception("Only Athena executions can be streamed, re-run the query without executionId")
+                await athena_client.resume(execution_id, self.config.athena_workgroup, QueryPriority.BULK)
+            else:
+                column_types = await self._get_column_types()
+                plan = query_builder_service.compile(request, self.config.inventory_replenishment_table, column_types)
+                plan, estimate = await self._prepare_athena_plan(plan, request, allow_downgrade=False)
+                if estimate is not None and estimate.action == "rejected":
+                    raise Exception(
+                        f"Query would scan ~{estimate.estimated_bytes} bytes, over the scan budget of {estimate.budget_bytes} bytes"
+                    )
+
+                query = plan.to_athena_query()
+                log.info(f"Athena stream query: {query.query} parameters: {query.parameters}")
+                execution = await athena_client.execute(
+                    query=query.query,
+                    parameters=query.parameters,
+                    database=self.config.athena_database,
+                    output_location=self.config.s3_athena_output_location,
+                    workgroup=self.config.athena_workgroup,
+                    priority=QueryPriority.BULK
+                )
+                execution_id = execution['QueryExecutionId']
+
+            return execution_id, athena_client.iter_result_pages(execution_id, request.nextToken)
+        except Exception as e:
+            log.error(f"Error in stream_inventory: {str(e)}")
+            raise Exception(str(e))
+
+    async def start_export(self, request: InventoryAnalysisRequestWithSelection) -> Dict[str, Any]:
+        """
+        Starts a bulk export of the whole result set as Parquet files and
+        returns the job; poll get_export until it has succeeded. A dry run
+        only returns the scan estimate.
+        """
+        try:
+            log.info(f"Request received for inventory export: {request}")
+            column_types = await self._get_column_types()
+            plan = query_builder_service.compile(request, self.config.inventory_replenishment_table, column_types)
+            plan, estimate = await self._prepare_athena_plan(plan, request, allow_downgrade=False)
+            if estimate is not None and (request.dry_run or estimate.action == "rejected"):
+                return self._estimate_response(estimate)
+
+            return inventory_exporter.start(self.config, plan, estimate).model_dump()
+        except Exception as e:
+            log.error(f"Error in start_export: {str(e)}")
+            raise Exception(str(e))
+
+    async def get_export(self, job_id: str) -> Dict[str, Any]:
+        return inventory_exporter.get(self.config, job_id).model_dump()
+
+    async def cancel_export(self, job_id: str) -> Dict[str, Any]:
+        return inventory_exporter.cancel(self.config, job_id).model_dump()
+
+    def open_export_file(self, job_id: str, index: int) -> Tuple[str, Iterator[bytes]]:
+        return inventory_exporter.open_file(self.config, job_id, index)
+
+    async def aggregate_inventory(self, request: InventoryAggregationRequest) -> Dict[str, Any]:
+        try:
+            log.info(f"Request received for inventory aggregation: {request}")
+            column_types = await self._get_column_types()
+            plan = query_builder_service.compile_aggregation(
+                request,
+                table_name=self.config.inventory_replenishment_table,
+                column_types=column_types
             )
 
+            if request.dry_run:
+                return self._estimate_response((await self._prepare_athena_plan(plan, request, allow_downgrade=False))[1])
+
+            local = self._run_local(plan, request)
+            if local is not None:
+                return local
+
+            cached = self._run_cached(plan, request, column_types)
+            if cached is not None:
+                return cached
+
+            plan, estimate = await self._prepare_athena_plan(plan, request, allow_downgrade=False)
+            if estimate is not None and estimate.action == "rejected":
+                return self._estimate_response(estimate)
+
+            query = plan.to_athena_query()
+            log.info(f"Athena query: {query.query} parameters: {query.parameters}")
+
+            data = await self._run_athena(query, request, max_results=request.limit or 20)
+
             results = data['results']
-            return {
+            return self._with_estimate({
                 "results": results,
                 "executionId": data['executionId'],
                 "nextToken": data['nextToken'],
                 "hasMore": data['hasMore'],
-                "count": len(results)
-            }
+                "count": data['count']
+            }, estimate)
         except Exception as e:
-            log.error(f"Error in get_excess_stock: {str(e)}")
+            log.error(f"Error in aggregate_inventory: {str(e)}")
             raise Exception(str(e))
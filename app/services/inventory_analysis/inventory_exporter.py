@@ -0,0 +1,141 @@
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional, Tuple
+from urllib.parse import urlparse
+from app.core.client_config import ClientConfig
+from app.core.config import settings
+from app.lib.athena import QueryPriority, athena_client
+from app.lib.logger import log
+from app.lib.s3_client import s3_client
+from app.schemas.inventory_analysis import ExportFile, ExportJob, ExportStatus, ScanEstimate
+from app.services.inventory_analysis.query_plan import QueryPlan, inline_parameters
+
+@dataclass
+class ExportJobState:
+    job: ExportJob
+    # Name of the client that started the job; other clients cannot see it
+    owner: str
+    created_at: float
+    task: Optional[asyncio.Task] = None
+
+class InventoryExporter:
+    """
+    Runs bulk inventory extracts as `UNLOAD ... WITH (format = 'PARQUET')`
+    into a per-job prefix under the tenant's Athena output location, so
+    large results move as compressed Parquet parts written by Athena
+    instead of JSON rows paged through GetQueryResults.
+
+    Jobs run in the background; their state is kept in memory for
+    EXPORT_JOB_TTL_SECONDS, after which the job and its files are removed.
+    """
+    def __init__(self, ttl_seconds: int = settings.EXPORT_JOB_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._jobs: Dict[str, ExportJobState] = {}
+
+    def start(self, config: ClientConfig, plan: QueryPlan, estimate: Optional[ScanEstimate] = None) -> ExportJob:
+        if not config.s3_athena_output_location:
+            raise Exception("Exports need an Athena output location in the client configuration")
+        self._prune()
+
+        job_id = uuid.uuid4().hex
+        job = ExportJob(
+            jobId=job_id,
+            status=ExportStatus.RUNNING,
+            # UNLOAD refuses to write into a prefix that already has objects
+            location=f"{config.s3_athena_output_location.rstrip('/')}/exports/{job_id}/",
+            estimate=estimate
+        )
+        state = ExportJobState(job=job, owner=config.name, created_at=time.monotonic())
+        self._jobs[job_id] = state
+        state.task = asyncio.create_task(self._run(config, plan, state))
+        log.info(f"Started inventory export {job_id} to {job.location}")
+        return job
+
+    async def _run(self, config: ClientConfig, plan: QueryPlan, state: ExportJobState) -> None:
+        job = state.job
+        select_sql, parameters = plan.sql
+        unload = (
+            f"UNLOAD ({inline_parameters(select_sql, parameters)}) "
+            f"TO '{job.location}' WITH (format = 'PARQUET', compression = 'SNAPPY')"
+        )
+        start = time.monotonic()
+        try:
+            execution = await athena_client.execute(
+                query=unload,
+                database=config.athena_database,
+                output_location=config.s3_athena_output_location,
+                workgroup=config.athena_workgroup,
+                priority=QueryPriority.BULK,
+                timeout_seconds=settings.EXPORT_QUERY_TIMEOUT_SECONDS
+            )
+            job.executionId = execution['QueryExecutionId']
+            location = urlparse(job.location)
+            objects = await asyncio.to_thread(s3_client.list_prefix, location.netloc, location.path.lstrip("/"))
+            job.files = [ExportFile(key=obj['key'], size_bytes=obj['size']) for obj in objects]
+            job.status = ExportStatus.SUCCEEDED
+            log.info(
+                f"Inventory export {job.jobId} wrote {len(job.files)} Parquet files "
+                f"({sum(f.size_bytes for f in job.files)} bytes) in {time.monotonic() - start:.2f}s"
+            )
+        except asyncio.CancelledError:
+            job.status = ExportStatus.FAILED
+            job.error = "Export was cancelled"
+            raise
+        except Exception as e:
+            log.error(f"Inventory export {job.jobId} failed: {str(e)}")
+            job.status = ExportStatus.FAILED
+            job.error = str(e)
+
+    def _get_state(self, config: ClientConfig, job_id: str) -> ExportJobState:
+        state = self._jobs.get(job_id)
+        if state is None or state.owner != config.name:
+            raise Exception(f"Export job {job_id} not found")
+        return state
+
+    def get(self, config: ClientConfig, job_id: str) -> ExportJob:
+        """Returns the job, with fresh download URLs once it has succeeded."""
+        job = self._get_state(config, job_id).job.model_copy(deep=True)
+        if job.files:
+            bucket = urlparse(job.location).netloc
+            for file in job.files:
+                file.url = s3_client.generate_presigned_url(bucket, file.key, settings.EXPORT_URL_EXPIRY_SECONDS)
+        return job
+
+    def cancel(self, config: ClientConfig, job_id: str) -> ExportJob:
+        """Cancels a running job; its Athena execution is stopped."""
+        state = self._get_state(config, job_id)
+        if state.task is not None and not state.task.done():
+            state.task.cancel()
+            state.job.status = ExportStatus.FAILED
+            state.job.error = "Export was cancelled"
+        return state.job
+
+    def open_file(self, config: ClientConfig, job_id: str, index: int) -> Tuple[str, Iterator[bytes]]:
+        """Returns the key of one Parquet part of a finished job and an iterator over its bytes."""
+        job = self._get_state(config, job_id).job
+        if job.status != ExportStatus.SUCCEEDED:
+            raise Exception(f"Export job {job_id} is {job.status.value}")
+        if not 0 <= index < len(job.files or []):
+            raise Exception(f"Export job {job_id} has no file {index}")
+        key = job.files[index].key
+        return key, s3_client.iter_object_chunks(urlparse(job.location).netloc, key)
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        for job_id in [k for k, v in self._jobs.items() if now - v.created_at >= self.ttl_seconds]:
+            state = self._jobs.pop(job_id)
+            if state.task is not None and not state.task.done():
+                state.task.cancel()
+            asyncio.create_task(self._delete_files(state.job))
+
+    async def _delete_files(self, job: ExportJob) -> None:
+        location = urlparse(job.location)
+        try:
+            deleted = await asyncio.to_thread(s3_client.delete_prefix, location.netloc, location.path.lstrip("/"))
+            log.info(f"Removed expired inventory export {job.jobId} ({deleted} files)")
+        except Exception as e:
+            log.warning(f"Could not delete files of inventory export {job.jobId}: {str(e)}")
+
+inventory_exporter = InventoryExporter()
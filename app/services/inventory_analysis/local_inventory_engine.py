@@ -0,0 +1,278 @@
+import asyncio
+import io
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+from app.core.client_config import ClientConfig
+from app.core.config import settings
+from app.lib.athena import ATHENA_DECIMAL_TYPES, ATHENA_FLOAT_TYPES, ATHENA_INTEGER_TYPES, QueryPriority, athena_client
+from app.lib.logger import log
+from app.lib.s3_client import s3_client
+from app.services.inventory_analysis.column_type_registry import column_type_registry
+from app.services.inventory_analysis.query_builder_utils import NUMERIC_FIELDS
+from app.services.inventory_analysis.query_plan import ColumnRef, Predicate, QueryPlan
+
+# Columns with a hash index for equality lookups
+INDEX_COLUMNS = ["sku", "supplier", "main category", "sub category", "sub category2", "lifecycle", "abc code"]
+
+COMPARISON_FUNCTIONS = {
+    "=": pc.equal,
+    "!=": pc.not_equal,
+    ">": pc.greater,
+    "<": pc.less,
+    ">=": pc.greater_equal,
+    "<=": pc.less_equal,
+}
+
+AGGREGATE_FUNCTIONS = {"sum": "sum", "count": "count", "avg": "mean", "min": "min", "max": "max"}
+
+class InventorySnapshot:
+    """
+    In-memory copy of a tenant's inventory table with hash indexes on the
+    common equality filter columns.
+    """
+    def __init__(self, table: pa.Table):
+        self.table = table
+        self.version = uuid.uuid4().hex[:12]
+        self.loaded_at = time.monotonic()
+        # column -> value -> sorted row indices
+        self.indexes: Dict[str, Dict[Any, np.ndarray]] = {}
+        for column in INDEX_COLUMNS:
+            if column in table.column_names:
+                series = table.column(column).to_pandas()
+                self.indexes[column] = series.groupby(series, sort=False).indices
+
+    @property
+    def age_seconds(self) -> float:
+        return time.monotonic() - self.loaded_at
+
+class LocalInventoryEngine:
+    """
+    Answers inventory plans from an Arrow snapshot of the inventory table.
+    Snapshots are refreshed in the background once older than the refresh
+    interval and are only used while younger than the max age, so callers
+    fall back to Athena when no fresh snapshot exists. Tables larger than
+    max_bytes are not loaded, and a failed load is retried only after the
+    refresh interval.
+    """
+    def __init__(
+        self,
+        refresh_seconds: int = settings.INVENTORY_SNAPSHOT_REFRESH_SECONDS,
+        max_age_seconds: int = settings.INVENTORY_SNAPSHOT_MAX_AGE_SECONDS,
+        max_bytes: int = settings.INVENTORY_SNAPSHOT_MAX_BYTES
+    ):
+        self.refresh_seconds = refresh_seconds
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self._snapshots: Dict[Tuple[str, str], InventorySnapshot] = {}
+        self._refresh_tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+        # key -> time of the last failed or skipped load
+        self._failed_at: Dict[Tuple[str, str], float] = {}
+
+    def get_snapshot(self, config: ClientConfig) -> Optional[InventorySnapshot]:
+        """
+        Returns the tenant snapshot if it is fresh enough to answer from, and
+        schedules a background refresh when it is missing or getting old.
+        """
+        if not config.athena_database or not config.inventory_replenishment_table:
+            return None
+
+        key = (config.athena_database, config.inventory_replenishment_table)
+        snapshot = self._snapshots.get(key)
+        if snapshot is None or snapshot.age_seconds >= self.refresh_seconds:
+            self._schedule_refresh(key, config)
+
+        if snapshot is not None and snapshot.age_seconds < self.max_age_seconds:
+            return snapshot
+        return None
+
+    def _schedule_refresh(self, key: Tuple[str, str], config: ClientConfig) -> None:
+        task = self._refresh_tasks.get(key)
+        if task is not None and not task.done():
+            return
+        failed_at = self._failed_at.get(key)
+        if failed_at is not None and time.monotonic() - failed_at < self.refresh_seconds:
+            return
+        self._refresh_tasks[key] = asyncio.create_task(self._refresh(key, config))
+
+    async def _refresh(self, key: Tuple[str, str], config: ClientConfig) -> None:
+        try:
+            start = time.monotonic()
+            table = await self._load_table(config)
+            snapshot = await asyncio.to_thread(InventorySnapshot, table)
+            self._snapshots[key] = snapshot
+            self._failed_at.pop(key, None)
+            log.info(
+                f"Loaded inventory snapshot {snapshot.version} for {key[0]}.{key[1]}: "
+                f"{table.num_rows} rows in {time.monotonic() - start:.2f}s"
+            )
+        except Exception as e:
+            self._failed_at[key] = time.monotonic()
+            log.error(f"Failed to refresh inventory snapshot for {key[0]}.{key[1]}: {str(e)}")
+
+    async def _load_table(self, config: ClientConfig) -> pa.Table:
+        """
+        Runs SELECT * in Athena and reads the CSV result file straight from S3,
+        typed from the table schema. Raises when the file exceeds max_bytes.
+        """
+        column_types = await column_type_registry.get_column_types(config.athena_database, config.inventory_replenishment_table)
+        execution = await athena_client.execute(
+            query=f"SELECT * FROM {config.inventory_replenishment_table}",
+            database=config.athena_database,
+            output_location=config.s3_athena_output_location,
+            workgroup=config.athena_workgroup,
+            priority=QueryPriority.BULK,
+            # A load slower than the refresh interval would never catch up
+            timeout_seconds=self.refresh_seconds
+        )
+        location = urlparse(execution['ResultConfiguration']['OutputLocation'])
+        bucket, key = location.netloc, location.path.lstrip("/")
+
+        size = await asyncio.to_thread(s3_client.get_object_size, bucket, key)
+        if size > self.max_bytes:
+            raise Exception(f"Table result is {size} bytes, above the {self.max_bytes} byte snapshot limit")
+
+        content = await asyncio.to_thread(s3_client.read_bytes, bucket, key)
+        return await asyncio.to_thread(self._parse_csv, content, column_types)
+
+    @staticmethod
+    def _arrow_type(column: str, column_type: Optional[str]) -> pa.DataType:
+        base_type = (column_type or "").split("(")[0].strip().lower()
+        if base_type in ATHENA_INTEGER_TYPES:
+            return pa.int64()
+        # Decimals are compared as doubles locally: Arrow rejects comparing a
+        # decimal column with integer literals of a wider precision
+        if base_type in ATHENA_FLOAT_TYPES or base_type in ATHENA_DECIMAL_TYPES or column in NUMERIC_FIELDS:
+            return pa.float64()
+        if base_type == "boolean":
+            return pa.bool_()
+        return pa.string()
+
+    @staticmethod
+    def _parse_csv(content: bytes, column_types: Dict[str, str]) -> pa.Table:
+        # Without a schema, type at least the known numeric and index columns
+        # and let Arrow infer the rest
+        columns = list(column_types) or NUMERIC_FIELDS + INDEX_COLUMNS
+        convert_options = pacsv.ConvertOptions(
+            column_types={c: LocalInventoryEngine._arrow_type(c, column_types.get(c)) for c in columns},
+            strings_can_be_null=True,
+            null_values=[""]
+        )
+        return pacsv.read_csv(io.BytesIO(content), convert_options=convert_options)
+
+    @staticmethod
+    def can_execute(plan: QueryPlan) -> bool:
+        """Computed selections are only evaluated by Athena."""
+        if plan.computed:
+            return False
+        if any(p.is_expression for p in plan.predicates):
+            return False
+        return not any(a.is_expression for a in plan.aggregates)
+
+    @staticmethod
+    def _predicate_expression(predicate: Predicate) -> pc.Expression:
+        compare = COMPARISON_FUNCTIONS[predicate.op]
+        value = predicate.value
+        operand = pc.field(value.name) if isinstance(value, ColumnRef) else value
+        return compare(pc.field(predicate.target), operand)
+
+    def _filter(self, table: pa.Table, indexes: Dict[str, Dict[Any, np.ndarray]], plan: QueryPlan) -> pa.Table:
+        remaining: List[Predicate] = []
+        candidates: Optional[np.ndarray] = None
+
+        for predicate in plan.predicates:
+            index = indexes.get(predicate.target)
+            if index is not None and predicate.op == "=" and not isinstance(predicate.value, ColumnRef):
+                rows = index.get(predicate.value, np.empty(0, dtype=np.int64))
+                candidates = rows if candidates is None else np.intersect1d(candidates, rows, assume_unique=True)
+            else:
+                remaining.append(predicate)
+
+        if candidates is not None:
+            table = table.take(pa.array(np.sort(candidates)))
+
+        if remaining:
+            expression = self._predicate_expression(remaining[0])
+            for predicate in remaining[1:]:
+                expression = expression & self._predicate_expression(predicate)
+            table = table.filter(expression)
+
+        return table
+
+    def _aggregate(self, table: pa.Table, plan: QueryPlan) -> pa.Table:
+        output_names = []
+        for aggregate in plan.aggregates:
+            if aggregate.column is None:
+                output_names.append(([], "count_all", "count_all"))
+            else:
+                function = AGGREGATE_FUNCTIONS[aggregate.function]
+                output_names.append((aggregate.column, function, f"{aggregate.column}_{function}"))
+
+        specs = list(dict.fromkeys((column if column else (), function) for column, function, _ in output_names))
+        result = table.group_by(list(plan.group_by)).aggregate([(list(c) if c == () else c, f) for c, f in specs])
+
+        # Pick columns by name: the key/aggregate order differs across Arrow versions
+        arrays = [result.column(c) for c in plan.group_by] + [result.column(name) for _, _, name in output_names]
+        names = list(plan.group_by) + [a.alias for a in plan.aggregates]
+        return pa.Table.from_arrays(arrays, names=names)
+
+    def execute(
+        self,
+        snapshot: InventorySnapshot,
+        plan: QueryPlan,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        columnar: bool = False
+    ) -> Tuple[Union[List[Dict[str, Any]], Dict[str, List[Any]]], int]:
+        """
+        Evaluates the plan against the snapshot and returns one page of rows
+        plus the total number of matching rows.
+        """
+        return self.execute_table(snapshot.table, plan, offset, limit, snapshot.indexes, columnar)
+
+    def execute_table(
+        self,
+        table: pa.Table,
+        plan: QueryPlan,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        indexes: Optional[Dict[str, Dict[Any, np.ndarray]]] = None,
+        columnar: bool = False
+    ) -> Tuple[Union[List[Dict[str, Any]], Dict[str, List[Any]]], int]:
+        """
+        Evaluates the plan against any Arrow table, e.g. a cached query
+        result. The page is a list of rows, or with `columnar` a mapping of
+        column name to values. Raises when a projected column is missing from
+        the table, so the caller runs the query in Athena instead.
+        """
+        columns = None
+        if plan.columns and not plan.aggregates:
+            missing = [c for c in plan.columns if c not in table.column_names]
+            if missing:
+                raise Exception(f"Columns not in the local table: {', '.join(missing)}")
+            columns = list(plan.columns)
+
+        table = self._filter(table, indexes or {}, plan)
+        if plan.aggregates:
+            table = self._aggregate(table, plan)
+
+        # Sort before projecting, since the sort keys need not be projected;
+        # only the page's rows of the projected columns are then taken
+        total = table.num_rows
+        if plan.order_by:
+            # Arrow keeps nulls at the end like Athena does
+            indices = pc.sort_indices(table, sort_keys=[(k.column, "ascending" if k.direction == "ASC" else "descending") for k in plan.order_by])
+            indices = indices.slice(offset, limit) if limit is not None else indices.slice(offset)
+            page = (table.select(columns) if columns else table).take(indices)
+        else:
+            page = table.select(columns) if columns else table
+            page = page.slice(offset, limit) if limit is not None else page.slice(offset)
+
+        return (page.to_pydict() if columnar else page.to_pylist()), total
+
+local_inventory_engine = LocalInventoryEngine()
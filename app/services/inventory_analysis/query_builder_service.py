@@ -1,50 +1,418 @@
-from app.schemas.inventory_analysis import InventoryAnalysisRequestWithSelection
-from app.services.inventory_analysis.query_builder_utils import QueryBuilderUtils
+from collections import Counter, OrderedDict, deque
+from dataclasses import replace
+from typing import Any, Callable, Deque, Dict, FrozenSet, Hashable, List, Optional, Tuple
+from pydantic import BaseModel
+from app.core.config import settings
+from app.schemas.athena import AthenaQuery
+from app.schemas.inventory_analysis import (
+    ConditionalValues,
+    InventoryAggregationRequest,
+    InventoryAnalysisRequest,
+    InventoryAnalysisRequestWithSelection,
+    StockHealth
+)
+from app.services.inventory_analysis.column_type_registry import ColumnTypeRegistry
+from app.services.inventory_analysis.query_builder_utils import (
+    NUMERIC_FIELDS,
+    NUMERIC_FILTER_ATTRIBUTES,
+    STRING_FILTER_ATTRIBUTES,
+    QueryBuilderUtils,
+)
+from app.services.inventory_analysis.query_plan import (
+    AggregateColumn,
+    ComputedColumn,
+    KeysetBound,
+    Predicate,
+    QueryPlan,
+    SortKey,
+    format_parameter,
+    quote_identifier,
+)
+
+# Request attributes a plan is compiled from; paging and output options are not
+NUMERIC_FILTER_COLUMNS = dict(NUMERIC_FILTER_ATTRIBUTES)
+PLAN_ATTRIBUTES = frozenset(
+    ["columns", "selections", "target_service_level", "group_by", "aggregations"]
+    + [attribute for attribute, _ in STRING_FILTER_ATTRIBUTES]
+    + list(NUMERIC_FILTER_COLUMNS)
+)
+
+# Statistics computed per numeric column in summary mode
+SUMMARY_FUNCTIONS = ("min", "max", "avg", "sum")
+SUMMARY_COUNT_ALIAS = "total_count"
+
+# Unique key appended to every keyset sort so the row order is total
+KEYSET_TIEBREAKER = "sku"
+
+# Distinct query shapes tracked for hot-query materialization, and compiled
+# plans buffered until the materializer next counts them
+MAX_TRACKED_SHAPES = 10000
+
+# Stock health classification column and the per-class window columns
+STOCK_HEALTH_COLUMN = "stock health"
+STOCK_HEALTH_RANK = "health_rank"
+STOCK_HEALTH_COUNT = "health_count"
+# Columns the classification reads
+STOCK_HEALTH_INPUTS = ("replenishment quantity", "total inventory", "target inventory")
+
+def _freeze(value: Any) -> Hashable:
+    """Turns nested request models and lists into hashable tuples."""
+    if isinstance(value, BaseModel):
+        return (type(value),) + tuple([_freeze(v) if isinstance(v, (BaseModel, list)) else v for v in value.__dict__.values()])
+    if isinstance(value, list):
+        return tuple([_freeze(v) for v in value])
+    return value
+
+def _condition_key(value: ConditionalValues) -> Tuple[Any, ...]:
+    """The ConditionalValues fields the builder reads."""
+    return value.condition, value.min, value.max, value.equals, value.sortBy
 
 class QueryBuilderService:
-    def __init__(self):
+    def __init__(self, plan_cache_size: int = settings.QUERY_PLAN_CACHE_SIZE):
         self.utils = QueryBuilderUtils()
+        self.plan_cache_size = plan_cache_size
+        # Bounded LRU of compiled plans keyed by request fingerprint
+        self._plan_cache: OrderedDict[Hashable, QueryPlan] = OrderedDict()
+        # (table, filter predicates, sort on table columns) -> compile count
+        self._shape_counts: Counter = Counter()
+        # Plans compiled since the shapes were last counted
+        self._recent_plans: Deque[QueryPlan] = deque(maxlen=MAX_TRACKED_SHAPES)
+
+    async def build_query(
+        self,
+        request: InventoryAnalysisRequestWithSelection,
+        table_name: str,
+        column_types: Optional[Dict[str, str]] = None
+    ) -> AthenaQuery:
+        return self.compile(request, table_name, column_types).to_athena_query()
+
+    def fingerprint(
+        self,
+        request: InventoryAnalysisRequest,
+        table_name: str,
+        column_types: Optional[Dict[str, str]] = None
+    ) -> Tuple[str, Hashable]:
+        """
+        Canonical cache key for a request, built only from what the plan is
+        compiled from: the projection, string filters, numeric filters with
+        the type of their column (which decides the CAST), selections and
+        aggregations. Paging/output options and the rest of the schema are
+        left out.
+        """
+        column_types = column_types or {}
+        request_key: List[Tuple[str, Hashable]] = []
+        for name, value in request.__dict__.items():
+            if value is None or name not in PLAN_ATTRIBUTES:
+                continue
+            if isinstance(value, ConditionalValues):
+                value = _condition_key(value)
+                column = NUMERIC_FILTER_COLUMNS.get(name)
+                if column is not None:
+                    value += (column_types.get(column),)
+            elif isinstance(value, list):
+                value = _freeze(value)
+            request_key.append((name, value))
+
+        aggregations = request.__dict__.get("aggregations")
+        if aggregations:
+            request_key.append(("aggregation types", tuple([column_types.get(a.column) for a in aggregations])))
+        return table_name, tuple(request_key)
+
+    def compile(
+        self,
+        request: InventoryAnalysisRequestWithSelection,
+        table_name: str,
+        column_types: Optional[Dict[str, str]] = None
+    ) -> QueryPlan:
+        """
+        Returns the compiled plan for the request, served from the plan cache
+        when an identical request was compiled before.
+        """
+        plan = self._cached_compile(self._compile, request, table_name, column_types)
+        self.record_shape(plan)
+        return plan
+
+    def compile_aggregation(
+        self,
+        request: InventoryAggregationRequest,
+        table_name: str,
+        column_types: Optional[Dict[str, str]] = None
+    ) -> QueryPlan:
+        """
+        Compiles an aggregation request into a GROUP BY plan that reuses the
+        inventory filters.
+        """
+        plan = self._cached_compile(self._compile_aggregation, request, table_name, column_types)
+        self.record_shape(plan)
+        return plan
+
+    def record_shape(self, plan: QueryPlan) -> None:
+        """
+        Buffers the plan for shape counting. Hashing the predicate set is left
+        to hot_shapes, so the request path only pays for an append.
+        """
+        if plan.predicates:
+            self._recent_plans.append(plan)
+
+    def _count_recent_shapes(self) -> None:
+        while self._recent_plans:
+            self._shape_counts[self._recent_plans.popleft().shape] += 1
+        if len(self._shape_counts) > MAX_TRACKED_SHAPES:
+            # Forget the rarest half
+            self._shape_counts = Counter(dict(self._shape_counts.most_common(MAX_TRACKED_SHAPES // 2)))
+
+    def hot_shapes(self, table_name: str, limit: int, min_hits: int) -> List[Tuple[FrozenSet[Predicate], Tuple[SortKey, ...]]]:
+        """
+        Returns the most compiled predicate sets of the table (each with its
+        most frequent sort) seen at least `min_hits` times, then halves every
+        count of the table so old traffic decays.
+        """
+        self._count_recent_shapes()
+        totals: Counter = Counter()
+        sorts: Dict[FrozenSet[Predicate], Counter] = {}
+        for (table, predicates, order_by), count in self._shape_counts.items():
+            if table != table_name:
+                continue
+            totals[predicates] += count
+            sorts.setdefault(predicates, Counter())[order_by] += count
+
+        for key in [k for k in self._shape_counts if k[0] == table_name]:
+            self._shape_counts[key] //= 2
+            if not self._shape_counts[key]:
+                del self._shape_counts[key]
+
+        return [
+            (predicates, sorts[predicates].most_common(1)[0][0])
+            for predicates, count in totals.most_common(limit)
+            if count >= min_hits
+        ]
+
+    def _cached_compile(
+        self,
+        compile_fn: Callable[[InventoryAnalysisRequest, str, Optional[Dict[str, str]]], QueryPlan],
+        request: InventoryAnalysisRequest,
+        table_name: str,
+        column_types: Optional[Dict[str, str]] = None
+    ) -> QueryPlan:
+        if self.plan_cache_size <= 0:
+            return compile_fn(request, table_name, column_types)
+
+        key = (type(request), self.fingerprint(request, table_name, column_types))
+        plan = self._plan_cache.get(key)
+        if plan is not None:
+            self._plan_cache.move_to_end(key)
+            return plan
+
+        plan = compile_fn(request, table_name, column_types)
+        self._plan_cache[key] = plan
+        if len(self._plan_cache) > self.plan_cache_size:
+            self._plan_cache.popitem(last=False)
+        return plan
+
+    def build_summary(
+        self,
+        plan: QueryPlan,
+        column_types: Optional[Dict[str, str]] = None
+    ) -> QueryPlan:
+        """
+        Derives a single-row aggregate query from a compiled plan: the matching
+        row count plus min/max/avg/sum of the numeric columns the request
+        projects or filters on and of its computed selections.
+        """
+        column_types = column_types or {}
+        numeric_columns = [c for c in (plan.columns or ()) if c in NUMERIC_FIELDS]
+        numeric_columns += [p.target for p in plan.predicates if not p.is_expression and p.target in NUMERIC_FIELDS]
+        numeric_columns += [k.column for k in plan.order_by if k.column in NUMERIC_FIELDS]
 
-    async def build_query(self, request: InventoryAnalysisRequestWithSelection, table_name: str) -> str:
-        query = f"SELECT * FROM {table_name}"
-        
-        # Use dict keys to maintain insertion order like JS Set
-        condition_set = {}
-        order_set = {}
-
-        if request.selections:
-            selection_query, selection_conditions, selection_order_by = self.utils.build_selection_query(request, table_name=table_name)
-            query = selection_query
-            for c in selection_conditions:
-                condition_set[c] = None
-            
-            if selection_order_by:
-                parts = selection_order_by.replace("ORDER BY", "").split(",")
-                for p in parts:
-                    order_set[p.strip()] = None
+        aggregates = [AggregateColumn("count", None, SUMMARY_COUNT_ALIAS)]
+        for column in dict.fromkeys(numeric_columns):
+            cast = not ColumnTypeRegistry.is_numeric(column_types.get(column))
+            aggregates += [AggregateColumn(fn, column, f"{fn}:{column}", cast=cast) for fn in SUMMARY_FUNCTIONS]
+        for computed in plan.computed:
+            aggregates += [
+                AggregateColumn(fn, computed.sql, f"{fn}:{computed.alias}", cast=True, is_expression=True)
+                for fn in SUMMARY_FUNCTIONS
+            ]
 
+        return replace(plan, columns=None, computed=(), order_by=(), keyset=(), limit=None, group_by=(), aggregates=tuple(aggregates))
+
+    @staticmethod
+    def stock_health_sql(column_types: Optional[Dict[str, str]] = None) -> str:
+        """
+        CASE expression classifying a row, first match wins:
+        not_enough when replenishment quantity > 0 (a replenishment is due),
+        excess when total inventory > target inventory, else healthy.
+        """
+        column_types = column_types or {}
+
+        def numeric(column: str) -> str:
+            if ColumnTypeRegistry.is_numeric(column_types.get(column)):
+                return quote_identifier(column)
+            return f"CAST({quote_identifier(column)} AS DOUBLE)"
+
+        return (
+            f"(CASE WHEN {numeric('replenishment quantity')} > 0 THEN {format_parameter(StockHealth.NOT_ENOUGH.value)} "
+            f"WHEN {numeric('total inventory')} > {numeric('target inventory')} THEN {format_parameter(StockHealth.EXCESS.value)} "
+            f"ELSE {format_parameter(StockHealth.HEALTHY.value)} END)"
+        )
+
+    def build_stock_health_counts(
+        self,
+        plan: QueryPlan,
+        column_types: Optional[Dict[str, str]] = None
+    ) -> QueryPlan:
+        """Derives a single-row query counting the matching rows of each class."""
+        health_sql = self.stock_health_sql(column_types)
+        aggregates = tuple(
+            AggregateColumn("count_if", f"{health_sql} = {format_parameter(c.value)}", c.value, is_expression=True)
+            for c in StockHealth
+        )
+        return replace(plan, columns=None, computed=(), order_by=(), keyset=(), limit=None, group_by=(), aggregates=aggregates)
+
+    def build_stock_health_page(
+        self,
+        plan: QueryPlan,
+        limit: int,
+        offset: int = 0,
+        health_class: Optional[StockHealth] = None,
+        column_types: Optional[Dict[str, str]] = None
+    ) -> AthenaQuery:
+        """
+        Tags every matching row with its stock health class and returns rows
+        `offset + 1` to `offset + limit` of each class in the plan's sort
+        order, plus each class's total in `health_count`, from a single scan.
+        """
+        health = ComputedColumn(STOCK_HEALTH_COLUMN, self.stock_health_sql(column_types))
+        order_by = self.keyset_sort_keys(plan)
+        computed = {c.alias for c in plan.computed}
+        columns = plan.columns
+        if columns is not None:
+            # The window is ordered on the projected columns, so sort columns must be selected
+            columns = tuple(dict.fromkeys(columns + tuple(k.column for k in order_by if k.column not in computed)))
+        tagged = replace(plan, columns=columns, computed=plan.computed + (health,), order_by=(), keyset=(), limit=None)
+        inner_sql, parameters = tagged.sql
+
+        partition = quote_identifier(STOCK_HEALTH_COLUMN)
+        order_sql = ", ".join(key.to_sql() for key in order_by)
+        conditions = [f"{quote_identifier(STOCK_HEALTH_RANK)} > ?", f"{quote_identifier(STOCK_HEALTH_RANK)} <= ?"]
+        parameters += (format_parameter(offset), format_parameter(offset + limit))
+        if health_class is not None:
+            conditions.append(f"{partition} = ?")
+            parameters += (format_parameter(health_class.value),)
+
+        query = (
+            f"SELECT * FROM ("
+            f"SELECT tagged.*, "
+            f"ROW_NUMBER() OVER (PARTITION BY {partition} ORDER BY {order_sql}) AS {quote_identifier(STOCK_HEALTH_RANK)}, "
+            f"COUNT(*) OVER (PARTITION BY {partition}) AS {quote_identifier(STOCK_HEALTH_COUNT)} "
+            f"FROM ({inner_sql}) tagged"
+            f") WHERE {' AND '.join(conditions)} "
+            f"ORDER BY {partition}, {quote_identifier(STOCK_HEALTH_RANK)}"
+        )
+        return AthenaQuery(query=query, parameters=list(parameters))
+
+    def keyset_sort_keys(self, plan: QueryPlan) -> Tuple[SortKey, ...]:
+        if any(key.column == KEYSET_TIEBREAKER for key in plan.order_by):
+            return plan.order_by
+        return plan.order_by + (SortKey(KEYSET_TIEBREAKER, "ASC"),)
+
+    def build_keyset_page(
+        self,
+        plan: QueryPlan,
+        limit: int,
+        cursor: Optional[List[Any]] = None,
+        column_types: Optional[Dict[str, str]] = None
+    ) -> QueryPlan:
+        """
+        Derives a single-page query from a compiled plan: ORDER BY the plan's
+        sort keys plus `sku`, only rows after the cursor position, and LIMIT.
+        Every page is a small independent query, so no page needs the full
+        sorted result.
+        """
+        sort_keys = self.keyset_sort_keys(plan)
+        computed = {c.alias: c.sql for c in plan.computed}
+        column_types = column_types or {}
+
+        columns = plan.columns
+        if columns is not None:
+            # The cursor is read back from the rows, so sort columns must be returned
+            columns = tuple(dict.fromkeys(columns + tuple(k.column for k in sort_keys if k.column not in computed)))
+
+        bounds: Tuple[KeysetBound, ...] = ()
+        if cursor is not None:
+            if len(cursor) != len(sort_keys):
+                raise Exception("Keyset cursor does not match the query sort order")
+            bounds = tuple(
+                KeysetBound(
+                    sql=computed.get(key.column) or quote_identifier(key.column),
+                    direction=key.direction,
+                    value=self._typed_keyset_value(key.column, value, key.column in computed, column_types),
+                )
+                for key, value in zip(sort_keys, cursor)
+            )
+
+        return replace(plan, columns=columns, order_by=sort_keys, keyset=bounds, limit=limit)
+
+    @staticmethod
+    def _typed_keyset_value(column: str, value: Any, is_computed: bool, column_types: Dict[str, str]) -> Any:
+        """
+        Cursor values may come back as strings (e.g. from varchar-typed
+        results); numeric sort keys have to be bound as numbers for the
+        comparison to type-check.
+        """
+        if value is None:
+            return None
+        column_type = column_types.get(column)
+        numeric = is_computed or ColumnTypeRegistry.is_numeric(column_type) or (column_type is None and column in NUMERIC_FIELDS)
+        if not numeric:
+            return str(value)
+        parsed = QueryBuilderUtils.parse_if_number(str(value))
+        return parsed if isinstance(parsed, (int, float)) else str(value)
+
+    def _compile(
+        self,
+        request: InventoryAnalysisRequestWithSelection,
+        table_name: str,
+        column_types: Optional[Dict[str, str]] = None
+    ) -> QueryPlan:
+        selected_columns, computed, selection_conditions, selection_order = self.utils.build_selection_query(request)
+        common_conditions = self.utils.build_common_filter_conditions(request)
+        athena_conditions, athena_order = self.utils.build_athena_query_filters(request, column_types)
+
+        # dict keys drop duplicates while keeping insertion order
+        predicates = dict.fromkeys(selection_conditions + common_conditions + athena_conditions)
+        order_by = dict.fromkeys(selection_order + athena_order)
+
+        return QueryPlan(
+            table_name=table_name,
+            columns=self.utils.build_projection(request.columns, selected_columns),
+            computed=tuple(computed),
+            predicates=tuple(predicates),
+            order_by=tuple(order_by),
+        )
+
+    def _compile_aggregation(
+        self,
+        request: InventoryAggregationRequest,
+        table_name: str,
+        column_types: Optional[Dict[str, str]] = None
+    ) -> QueryPlan:
         common_conditions = self.utils.build_common_filter_conditions(request)
-        for c in common_conditions:
-            condition_set[c] = None
-
-        athena_conditions, athena_order_by = self.utils.build_athena_query_filters(request)
-        for c in athena_conditions:
-            condition_set[c] = None
-        
-        if athena_order_by:
-            parts = athena_order_by.replace("ORDER BY", "").split(",")
-            for p in parts:
-                order_set[p.strip()] = None
-
-        final_conditions = list(condition_set.keys())
-        final_order = list(order_set.keys())
-
-        if final_conditions:
-            query += f" WHERE {' AND '.join(final_conditions)}"
-        
-        if final_order:
-            query += f" ORDER BY {', '.join(final_order)}"
-
-        return query
+        # Filter sort keys are dropped: raw columns cannot be ordered on after grouping
+        athena_conditions, _ = self.utils.build_athena_query_filters(request, column_types)
+        aggregates, aggregate_order = self.utils.build_aggregates(request.aggregations, column_types)
+        if not aggregates:
+            raise Exception("At least one aggregation is required")
+
+        group_by = tuple(dict.fromkeys(request.group_by))
+        order_by = aggregate_order or [SortKey(c, "ASC") for c in group_by]
+
+        return QueryPlan(
+            table_name=table_name,
+            predicates=tuple(dict.fromkeys(common_conditions + athena_conditions)),
+            order_by=tuple(dict.fromkeys(order_by)),
+            group_by=group_by,
+            aggregates=tuple(aggregates),
+        )
 
 query_builder_service = QueryBuilderService()
@@ -1,19 +1,87 @@
 import re
-from typing import List, Optional, Any, Tuple
-from app.core.config import settings
+from typing import Dict, List, Optional, Any, Tuple, Union
 from app.schemas.inventory_analysis import (
+    AggregateFunction,
+    Aggregation,
     InventoryAnalysisRequest, 
     InventoryAnalysisRequestWithSelection,
     ConditionalValues,
     Condition,
+    Operations,
+    SelectionExpression,
     SelectionOperations
 )
+from app.services.inventory_analysis.column_type_registry import ColumnTypeRegistry
+from app.services.inventory_analysis.query_plan import (
+    AggregateColumn,
+    ColumnRef,
+    ComputedColumn,
+    Predicate,
+    SortKey,
+    format_parameter,
+    quote_identifier,
+)
+
+NUMERIC_FIELDS = [
+    "moq", "expected lead time (days)", "transit days", "buffer days",
+    "on-hand inventory", "available", "on orders to vendors",
+    "in-transit inventory", "total inventory", "current robust autonomy",
+    "target autonomy", "target inventory", "replenishment quantity",
+    "replenishment quantity (without moq)", "expected lost sales"
+]
+
+# (attribute name, column name) pairs, resolved once from the request model
+# so filters can be read straight off the model without a model_dump
+NUMERIC_FILTER_ATTRIBUTES: List[Tuple[str, str]] = [
+    (name, info.alias or name)
+    for name, info in InventoryAnalysisRequest.model_fields.items()
+    if (info.alias or name) in NUMERIC_FIELDS
+]
+
+STRING_FILTER_ATTRIBUTES: List[Tuple[str, str]] = [
+    ("sku", "sku"),
+    ("supplier", "supplier"),
+    ("main_category", "main category"),
+    ("sub_category", "sub category"),
+    ("sub_category2", "sub category2"),
+    ("lifecycle", "lifecycle"),
+    ("abc_code", "abc code"),
+]
+
+OPERATION_SYMBOLS = {
+    "add": "+",
+    "diff": "-",
+    "multiply": "*",
+    "division": "/",
+    "modulo": "%"
+}
+
+# Operations rendered as a SQL function over their operand list
+FUNCTION_OPERATIONS = {
+    "greatest": "GREATEST",
+    "least": "LEAST",
+    "coalesce": "COALESCE"
+}
 
 class QueryBuilderUtils:
     @staticmethod
-    def format_field(field: str) -> str:
-        is_expression = bool(re.search(r'[\+\-\*\/\%\(\)]', field))
-        return field if is_expression else f'"{field}"'
+    def quote_identifier(name: str) -> str:
+        return quote_identifier(name)
+
+    @staticmethod
+    def format_parameter(value: Any) -> str:
+        return format_parameter(value)
+
+    @staticmethod
+    def to_operand(value: Any) -> Union[int, float, ColumnRef]:
+        """
+        Returns the comparison operand for a filter value: numbers are bound as
+        parameters, other strings keep referencing a column.
+        """
+        parsed = QueryBuilderUtils.parse_if_number(value)
+        if isinstance(parsed, (int, float)):
+            return parsed
+        return ColumnRef(str(value))
 
     @staticmethod
     def parse_if_number(value: Any) -> Any:
@@ -23,142 +91,215 @@ class QueryBuilderUtils:
                     return float(value)
                 return int(value)
             except ValueError:
-                return f"\"{value}\""
+                return quote_identifier(value)
         if isinstance(value, (int, float)):
             return value
-        return f"\"{value}\""
+        return quote_identifier(str(value))
 
     @staticmethod
-    def condition_to_sql(field: str, v: ConditionalValues) -> Optional[str]:
+    def condition_to_predicates(
+        field: str,
+        v: ConditionalValues,
+        column_type: Optional[str] = None,
+        is_expression: bool = False,
+        is_text: bool = False
+    ) -> List[Predicate]:
         if not v.condition:
-            return None
+            return []
         
-        f = QueryBuilderUtils.format_field(field)
+        # Natively numeric columns are compared as-is so Athena can prune on
+        # Parquet statistics and partitions; strings and expressions are cast.
+        # Text expressions (bucket labels) are compared to string literals.
+        cast = not is_text and (is_expression or not ColumnTypeRegistry.is_numeric(column_type))
+
+        def compare(op: str, value: Any) -> Predicate:
+            operand = str(value) if is_text else QueryBuilderUtils.to_operand(value)
+            return Predicate(field, op, operand, is_expression=is_expression, cast=cast)
         
         if v.condition == Condition.EQUALS_TO and v.equals is not None:
-            return f"CAST({f} AS DOUBLE) = {QueryBuilderUtils.parse_if_number(v.equals)}"
+            return [compare("=", v.equals)]
         
         if v.condition == Condition.NOT_EQUALS_TO and v.equals is not None:
-            return f"CAST({f} AS DOUBLE) != {QueryBuilderUtils.parse_if_number(v.equals)}"
+            return [compare("!=", v.equals)]
         
         if v.condition == Condition.GREATER_THAN and v.min is not None:
-            return f"CAST({f} AS DOUBLE) > {QueryBuilderUtils.parse_if_number(v.min)}"
+            return [compare(">", v.min)]
         
         if v.condition == Condition.LESSER_THAN and v.max is not None:
-            return f"CAST({f} AS DOUBLE) < {QueryBuilderUtils.parse_if_number(v.max)}"
+            return [compare("<", v.max)]
         
         if v.condition == Condition.GREATER_THAN_EQUALS and v.min is not None:
-            return f"CAST({f} AS DOUBLE) >= {QueryBuilderUtils.parse_if_number(v.min)}"
+            return [compare(">=", v.min)]
         
         if v.condition == Condition.LESSER_THAN_EQUALS and v.max is not None:
-            return f"CAST({f} AS DOUBLE) <= {QueryBuilderUtils.parse_if_number(v.max)}"
+            return [compare("<=", v.max)]
         
         if v.condition == Condition.GREATER_AND_LESSER_EQUALS and v.min is not None and v.max is not None:
-            return f"CAST({f} AS DOUBLE) >= {QueryBuilderUtils.parse_if_number(v.min)} AND CAST({f} AS DOUBLE) <= {QueryBuilderUtils.parse_if_number(v.max)}"
+            return [compare(">=", v.min), compare("<=", v.max)]
         
         if v.condition == Condition.GREATER_AND_LESSER and v.min is not None and v.max is not None:
-            return f"CAST({f} AS DOUBLE) > {QueryBuilderUtils.parse_if_number(v.min)} AND CAST({f} AS DOUBLE) < {QueryBuilderUtils.parse_if_number(v.max)}"
+            return [compare(">", v.min), compare("<", v.max)]
         
-        return None
+        return []
+
+    @staticmethod
+    def build_expression(node: Union[SelectionExpression, str, float, int]) -> str:
+        """
+        Renders an expression tree as one SQL expression. Column names are
+        quoted, numbers inlined and bucket labels escaped as literals.
+        """
+        if not isinstance(node, SelectionExpression):
+            return str(QueryBuilderUtils.parse_if_number(node))
+
+        operation = node.operation.value
+        if operation in OPERATION_SYMBOLS:
+            if node.value_a is None or node.value_b is None:
+                raise Exception(f"Operation {operation} requires value_a and value_b")
+            val_a = QueryBuilderUtils.build_expression(node.value_a)
+            val_b = QueryBuilderUtils.build_expression(node.value_b)
+            return f"({val_a} {OPERATION_SYMBOLS[operation]} {val_b})"
+
+        if operation in FUNCTION_OPERATIONS:
+            operands = node.values if node.values else [v for v in (node.value_a, node.value_b) if v is not None]
+            if len(operands) < 2:
+                raise Exception(f"Operation {operation} requires at least two values")
+            rendered = ", ".join(QueryBuilderUtils.build_expression(v) for v in operands)
+            return f"{FUNCTION_OPERATIONS[operation]}({rendered})"
+
+        if node.operation == Operations.BUCKET:
+            if node.value_a is None or not node.buckets:
+                raise Exception("Operation bucket requires value_a and buckets")
+            value = QueryBuilderUtils.build_expression(node.value_a)
+            branches = []
+            for bucket in node.buckets:
+                bounds = []
+                if bucket.min is not None:
+                    bounds.append(f"{value} >= {format_parameter(bucket.min)}")
+                if bucket.max is not None:
+                    bounds.append(f"{value} < {format_parameter(bucket.max)}")
+                condition = " AND ".join(bounds) if bounds else "TRUE"
+                branches.append(f"WHEN {condition} THEN {format_parameter(bucket.label)}")
+            default = format_parameter(node.default) if node.default is not None else "NULL"
+            return f"(CASE {' '.join(branches)} ELSE {default} END)"
+
+        raise Exception(f"Unknown operation: {node.operation}")
 
     @staticmethod
-    def build_common_filter_conditions(request: InventoryAnalysisRequest) -> List[str]:
+    def build_common_filter_conditions(request: InventoryAnalysisRequest) -> List[Predicate]:
         conditions = []
-        if request.sku: conditions.append(f"sku = '{request.sku}'")
-        if request.supplier: conditions.append(f"supplier = '{request.supplier}'")
-        if request.main_category: conditions.append(f"\"main category\" = '{request.main_category}'")
-        if request.sub_category: conditions.append(f"\"sub category\" = '{request.sub_category}'")
-        if request.sub_category2: conditions.append(f"\"sub category2\" = '{request.sub_category2}'")
-        if request.lifecycle: conditions.append(f"lifecycle = '{request.lifecycle}'")
-        if request.abc_code: conditions.append(f"\"abc code\" = '{request.abc_code}'")
+        for attribute, column in STRING_FILTER_ATTRIBUTES:
+            value = getattr(request, attribute)
+            if value:
+                conditions.append(Predicate(column, "=", value))
 
         if request.target_service_level and request.target_service_level.condition:
             v = request.target_service_level
             numeric = v.equals if v.equals is not None else (v.max if v.max is not None else v.min)
             if numeric is not None:
-                conditions.append(f"\"target service level\" = {numeric}")
+                conditions.append(Predicate("target service level", "=", QueryBuilderUtils.to_operand(numeric)))
         
         return conditions
 
     @staticmethod
-    def build_athena_query_filters(filters: InventoryAnalysisRequest) -> Tuple[List[str], str]:
+    def build_athena_query_filters(
+        filters: InventoryAnalysisRequest,
+        column_types: Optional[Dict[str, str]] = None
+    ) -> Tuple[List[Predicate], List[SortKey]]:
         conditions = []
         order_parts = []
+        column_types = column_types or {}
         
-        # We need to iterate over numeric fields
-        numeric_fields = [
-            "moq", "expected lead time (days)", "transit days", "buffer days",
-            "on-hand inventory", "available", "on orders to vendors",
-            "in-transit inventory", "total inventory", "current robust autonomy",
-            "target autonomy", "target inventory", "replenishment quantity",
-            "replenishment quantity (without moq)", "expected lost sales"
-        ]
-        
-        filter_dict = filters.model_dump(by_alias=True, exclude_none=True)
-        
-        for field in numeric_fields:
-            if field in filter_dict and isinstance(filter_dict[field], dict):
-                v_dict = filter_dict[field]
-                v = ConditionalValues(**v_dict)
-                if v.condition:
-                    sql = QueryBuilderUtils.condition_to_sql(field, v)
-                    if sql:
-                        conditions.append(sql)
-                
-                if v.sortBy:
-                    order_parts.append(f"\"{field}\" {v.sortBy.value}")
+        for attribute, field in NUMERIC_FILTER_ATTRIBUTES:
+            v = getattr(filters, attribute)
+            if v is None:
+                continue
+
+            if v.condition:
+                conditions.extend(QueryBuilderUtils.condition_to_predicates(field, v, column_types.get(field)))
+            
+            if v.sortBy:
+                order_parts.append(SortKey(field, v.sortBy.value))
         
-        order_by = f"ORDER BY {', '.join(order_parts)}" if order_parts else ""
-        return conditions, order_by
+        return conditions, order_parts
 
     @staticmethod
-    def build_selection_query(request: InventoryAnalysisRequestWithSelection, table_name: str) -> Tuple[str, List[str], str]:
+    def build_selection_query(
+        request: InventoryAnalysisRequestWithSelection
+    ) -> Tuple[List[str], List[ComputedColumn], List[Predicate], List[SortKey]]:
+        """
+        Splits the request selections into plain columns to project, computed
+        expressions, predicates on those expressions and their sort keys.
+        """
         selection_fields = request.selections or []
-        unique_selections = []
+        columns = []
+        computed = []
         order_parts = []
         conditions = []
 
-        op_map = {
-            "add": "+",
-            "diff": "-",
-            "multiply": "*",
-            "division": "/",
-            "modulo": "%"
-        }
-
         for field in selection_fields:
             if isinstance(field, str):
-                if field == "*":
-                    unique_selections.append("*")
-                else:
-                    unique_selections.append(f"\"{field}\"")
+                columns.append(field)
             elif isinstance(field, SelectionOperations) or isinstance(field, dict):
                 if isinstance(field, dict):
                     field = SelectionOperations(**field)
                 
-                op = op_map.get(field.operation.value)
-                if not op:
-                    raise Exception(f"Unknown operation: {field.operation}")
-                
-                val_a = QueryBuilderUtils.parse_if_number(field.value_a)
-                val_b = QueryBuilderUtils.parse_if_number(field.value_b)
-                
-                raw_expr = f"({val_a} {op} {val_b})"
-                expr_with_alias = f"{raw_expr} AS \"{field.alias}\""
-                
-                unique_selections.append(expr_with_alias)
+                raw_expr = QueryBuilderUtils.build_expression(field)
+                computed.append(ComputedColumn(field.alias, raw_expr))
                 
                 if field.sortBy:
-                    order_parts.append(f"\"{field.alias}\" {field.sortBy.value}")
+                    order_parts.append(SortKey(field.alias, field.sortBy.value))
                 
                 if field.comparison and field.comparison.condition:
-                    sql = QueryBuilderUtils.condition_to_sql(raw_expr, field.comparison)
-                    if sql:
-                        conditions.append(sql)
-        
-        selections_str = ", ".join(unique_selections)
-        order_by = f"ORDER BY {', '.join(order_parts)}" if order_parts else ""
-        
-        query = f"SELECT *, {selections_str} FROM {table_name}" if selections_str else f"SELECT * FROM {table_name}"
+                    conditions.extend(QueryBuilderUtils.condition_to_predicates(
+                        raw_expr,
+                        field.comparison,
+                        is_expression=True,
+                        is_text=field.operation == Operations.BUCKET
+                    ))
         
-        return query, conditions, order_by
+        return columns, computed, conditions, order_parts
+
+    @staticmethod
+    def build_projection(columns: Optional[List[str]], selected_columns: Optional[List[str]] = None) -> Optional[Tuple[str, ...]]:
+        """
+        Resolves the projected columns. None means every column (`*`); an
+        explicit projection is extended with any plainly selected columns.
+        """
+        if not columns or "*" in columns:
+            return None
+        selected_columns = selected_columns or []
+        if "*" in selected_columns:
+            return None
+        # dict keys keep the first occurrence and the original order
+        return tuple(dict.fromkeys(list(columns) + selected_columns))
+
+    @staticmethod
+    def build_aggregates(
+        aggregations: List[Aggregation],
+        column_types: Optional[Dict[str, str]] = None
+    ) -> Tuple[List[AggregateColumn], List[SortKey]]:
+        """
+        Compiles aggregate requests over the known numeric fields into
+        aggregate columns and the sort keys on their aliases.
+        """
+        column_types = column_types or {}
+        aggregates = []
+        order_parts = []
+
+        for aggregation in aggregations:
+            column = aggregation.column
+            if column in (None, "*"):
+                if aggregation.function != AggregateFunction.COUNT:
+                    raise Exception(f"Aggregate {aggregation.function.value} requires a column")
+                column = None
+            elif column not in NUMERIC_FIELDS:
+                raise Exception(f"Unsupported aggregate column: {column}")
+
+            alias = aggregation.alias or re.sub(r"[^0-9a-zA-Z]+", "_", f"{aggregation.function.value}_{column or 'rows'}").strip("_")
+            cast = column is not None and not ColumnTypeRegistry.is_numeric(column_types.get(column))
+            aggregates.append(AggregateColumn(aggregation.function.value, column, alias, cast=cast))
+
+            if aggregation.sortBy:
+                order_parts.append(SortKey(alias, aggregation.sortBy.value))
+
+        return aggregates, order_parts
@@ -0,0 +1,252 @@
+import base64
+import json
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Any, FrozenSet, List, Optional, Tuple, Union
+from app.schemas.athena import AthenaQuery
+
+def quote_identifier(name: str) -> str:
+    escaped = name.replace('"', '""')
+    return f'"{escaped}"'
+
+def format_parameter(value: Any) -> str:
+    """
+    Formats a python value as an Athena execution parameter literal.
+    Numbers are passed through, everything else becomes an escaped varchar literal.
+    """
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return str(value)
+    escaped = str(value).replace("'", "''")
+    return f"'{escaped}'"
+
+def inline_parameters(query: str, parameters: Tuple[str, ...]) -> str:
+    """
+    Substitutes `?` placeholders outside quoted literals and identifiers with
+    the (already escaped) parameter literals, for statements that cannot be
+    run with execution parameters.
+    """
+    parts: List[str] = []
+    remaining = iter(parameters)
+    quote: Optional[str] = None
+    for char in query:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"'):
+            quote = char
+        elif char == "?":
+            parts.append(next(remaining))
+            continue
+        parts.append(char)
+    return "".join(parts)
+
+@dataclass(frozen=True)
+class ColumnRef:
+    """A comparison operand that refers to another column instead of a literal."""
+    name: str
+
+@dataclass(frozen=True)
+class Predicate:
+    """
+    One conjunct of the WHERE clause. `target` is a column name, or the
+    rendered SQL of a selection expression when `is_expression` is set.
+    """
+    target: str
+    op: str
+    value: Union[int, float, str, ColumnRef]
+    is_expression: bool = False
+    cast: bool = False
+
+    def to_sql(self) -> Tuple[str, Tuple[str, ...]]:
+        lhs = self.target if self.is_expression else quote_identifier(self.target)
+        if self.cast:
+            lhs = f"CAST({lhs} AS DOUBLE)"
+        if isinstance(self.value, ColumnRef):
+            return f"{lhs} {self.op} {quote_identifier(self.value.name)}", ()
+        return f"{lhs} {self.op} ?", (format_parameter(self.value),)
+
+@dataclass(frozen=True)
+class ComputedColumn:
+    """A selection expression returned under `alias`."""
+    alias: str
+    sql: str
+
+    def to_sql(self) -> str:
+        return f"{self.sql} AS {quote_identifier(self.alias)}"
+
+@dataclass(frozen=True)
+class AggregateColumn:
+    """
+    An aggregate over a column (or all rows for COUNT(*)) returned under
+    `alias`. `column` holds rendered SQL when `is_expression` is set.
+    """
+    function: str
+    column: Optional[str]
+    alias: str
+    cast: bool = False
+    is_expression: bool = False
+
+    def to_sql(self) -> str:
+        if self.column is None:
+            operand = "*"
+        else:
+            operand = self.column if self.is_expression else quote_identifier(self.column)
+            if self.cast:
+                operand = f"CAST({operand} AS DOUBLE)"
+        return f"{self.function.upper()}({operand}) AS {quote_identifier(self.alias)}"
+
+@dataclass(frozen=True)
+class SortKey:
+    column: str
+    direction: str = "ASC"
+
+    def to_sql(self) -> str:
+        return f"{quote_identifier(self.column)} {self.direction}"
+
+@dataclass(frozen=True)
+class KeysetBound:
+    """
+    Position of the last returned row on one sort key. `sql` is the rendered
+    sort expression and `value` the typed value of that row (None for NULL).
+    """
+    sql: str
+    direction: str
+    value: Any = None
+
+def keyset_to_sql(bounds: Tuple[KeysetBound, ...]) -> Tuple[str, Tuple[str, ...]]:
+    """
+    Renders the "rows after this position" predicate for a multi-column sort:
+    (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ...
+    Athena sorts NULLs last in both directions, so NULL is after every value
+    and nothing sorts after a NULL on the same key.
+    """
+    terms: List[str] = []
+    parameters: List[str] = []
+    equal_sql: List[str] = []
+    equal_params: List[str] = []
+
+    for bound in bounds:
+        if bound.value is not None:
+            op = ">" if bound.direction == "ASC" else "<"
+            terms.append(" AND ".join(equal_sql + [f"({bound.sql} {op} ? OR {bound.sql} IS NULL)"]))
+            parameters.extend(equal_params + [format_parameter(bound.value)])
+            equal_sql.append(f"{bound.sql} = ?")
+            equal_params.append(format_parameter(bound.value))
+        else:
+            equal_sql.append(f"{bound.sql} IS NULL")
+
+    if not terms:
+        return "FALSE", ()
+    return "(" + " OR ".join(f"({t})" for t in terms) + ")", tuple(parameters)
+
+def encode_keyset_cursor(values: List[Any]) -> str:
+    # Decimals round-trip as strings and are typed again when the cursor is bound
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode("utf-8")).decode("ascii")
+
+def decode_keyset_cursor(cursor: str) -> List[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except ValueError as e:
+        raise Exception(f"Invalid keyset cursor: {str(e)}")
+    if not isinstance(values, list):
+        raise Exception("Invalid keyset cursor")
+    return values
+
+@dataclass(frozen=True)
+class QueryPlan:
+    """
+    Compiled form of an inventory request: projection, conjunctive predicates
+    and sort keys. Plans are immutable so they can be shared from the plan cache.
+    """
+    table_name: str
+    # None selects every column
+    columns: Optional[Tuple[str, ...]] = None
+    computed: Tuple[ComputedColumn, ...] = ()
+    predicates: Tuple[Predicate, ...] = ()
+    order_by: Tuple[SortKey, ...] = field(default=())
+    # Keyset pagination: rows strictly after these bounds, at most `limit` rows
+    keyset: Tuple[KeysetBound, ...] = ()
+    limit: Optional[int] = None
+    # Aggregation: when set, only the group columns and aggregates are selected
+    group_by: Tuple[str, ...] = ()
+    aggregates: Tuple[AggregateColumn, ...] = ()
+
+    @property
+    def shape(self) -> Tuple[str, FrozenSet[Predicate], Tuple[SortKey, ...]]:
+        """
+        Table, predicate set and sort on table columns, the key hot-query
+        materialization counts. Sorts on computed or aggregate aliases are
+        left out since a materialized table cannot be ordered on them.
+        """
+        aliases = {c.alias for c in self.computed} | {a.alias for a in self.aggregates}
+        order_by = tuple(k for k in self.order_by if k.column not in aliases)
+        return self.table_name, frozenset(self.predicates), order_by
+
+    @cached_property
+    def referenced_columns(self) -> Optional[FrozenSet[str]]:
+        """
+        Table columns the query reads, or None when it may read every column
+        (SELECT * or computed expressions).
+        """
+        if (self.columns is None and not self.aggregates) or self.computed:
+            return None
+        if any(p.is_expression for p in self.predicates) or any(a.is_expression for a in self.aggregates):
+            return None
+        aliases = {a.alias for a in self.aggregates}
+        columns = set(self.columns or ()) | set(self.group_by)
+        columns |= {a.column for a in self.aggregates if a.column is not None}
+        columns |= {k.column for k in self.order_by if k.column not in aliases}
+        for predicate in self.predicates:
+            columns.add(predicate.target)
+            if isinstance(predicate.value, ColumnRef):
+                columns.add(predicate.value.name)
+        return frozenset(columns)
+
+    def _projection_sql(self) -> str:
+        if self.aggregates:
+            return ", ".join([quote_identifier(c) for c in self.group_by] + [a.to_sql() for a in self.aggregates])
+        base = [quote_identifier(c) for c in self.columns] if self.columns else ["*"]
+        # dict keys keep the first occurrence and the original order
+        return ", ".join(dict.fromkeys(base + [c.to_sql() for c in self.computed]))
+
+    def _where(self) -> Tuple[str, Tuple[str, ...]]:
+        clauses: List[str] = []
+        parameters: List[str] = []
+        for predicate in self.predicates:
+            sql, params = predicate.to_sql()
+            clauses.append(sql)
+            parameters.extend(params)
+        if self.keyset:
+            sql, params = keyset_to_sql(self.keyset)
+            clauses.append(sql)
+            parameters.extend(params)
+        return " AND ".join(clauses), tuple(parameters)
+
+    @cached_property
+    def sql(self) -> Tuple[str, Tuple[str, ...]]:
+        """Parameterized SQL, rendered once per plan on first use."""
+        query = f"SELECT {self._projection_sql()} FROM {self.table_name}"
+        where_sql, parameters = self._where()
+        if where_sql:
+            query += f" WHERE {where_sql}"
+        if self.aggregates and self.group_by:
+            query += f" GROUP BY {', '.join(quote_identifier(c) for c in self.group_by)}"
+        if self.order_by:
+            query += f" ORDER BY {', '.join(key.to_sql() for key in self.order_by)}"
+        if self.limit is not None:
+            query += f" LIMIT {int(self.limit)}"
+        return query, parameters
+
+    @cached_property
+    def athena_query(self) -> AthenaQuery:
+        query, parameters = self.sql
+        return AthenaQuery(query=query, parameters=list(parameters))
+
+    def to_athena_query(self) -> AthenaQuery:
+        """
+        Returns the rendered query. The instance is shared by every request
+        that hits the same cached plan, so callers must treat it as read-only.
+        """
+        return self.athena_query
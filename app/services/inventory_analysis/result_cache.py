@@ -0,0 +1,169 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Optional, Set, Tuple
+from urllib.parse import urlparse
+import pyarrow as pa
+from app.core.config import settings
+from app.lib.athena import athena_client
+from app.lib.logger import log
+from app.lib.s3_client import s3_client
+from app.services.inventory_analysis.local_inventory_engine import LocalInventoryEngine
+from app.services.inventory_analysis.query_plan import QueryPlan
+
+class CachedResult:
+    """
+    Full result of a completed inventory query together with the predicate
+    set that produced it.
+    """
+    def __init__(self, database: str, plan: QueryPlan, table: pa.Table, schema_key: int):
+        self.id = uuid.uuid4().hex[:12]
+        self.database = database
+        self.plan = plan
+        self.table = table
+        self.schema_key = schema_key
+        self.predicates = frozenset(plan.predicates)
+        self.created_at = time.monotonic()
+
+    @property
+    def age_seconds(self) -> float:
+        return time.monotonic() - self.created_at
+
+class InventoryResultCache:
+    """
+    Semantic cache of inventory query results. A cached result answers any
+    later query on the same table and schema whose predicates are a superset
+    of the cached query's predicates (a narrower drill-down), by filtering
+    the cached rows locally instead of submitting a new Athena query.
+
+    Results are only downloaded for filter shapes run at least
+    RESULT_CACHE_MIN_HITS times within the TTL, so one-off queries never
+    pay for the download, and at most RESULT_CACHE_MAX_CONCURRENT_POPULATES
+    downloads run at once.
+    """
+    def __init__(
+        self,
+        ttl_seconds: int = settings.RESULT_CACHE_TTL_SECONDS,
+        max_entries: int = settings.RESULT_CACHE_MAX_ENTRIES,
+        max_bytes: int = settings.RESULT_CACHE_MAX_BYTES,
+        min_hits: int = settings.RESULT_CACHE_MIN_HITS,
+        max_concurrent_populates: int = settings.RESULT_CACHE_MAX_CONCURRENT_POPULATES
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.min_hits = min_hits
+        self.max_concurrent_populates = max_concurrent_populates
+        self._entries: OrderedDict[str, CachedResult] = OrderedDict()
+        self._pending: Set[Tuple[str, QueryPlan]] = set()
+        # (database, table, predicates) -> (first seen, runs) within the TTL
+        self._shape_hits: OrderedDict[Tuple[str, str, FrozenSet], Tuple[float, int]] = OrderedDict()
+        # Running downloads, referenced so they are not garbage-collected
+        self._tasks: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def schema_key(column_types: Optional[Dict[str, str]]) -> int:
+        return hash(frozenset(column_types.items())) if column_types else 0
+
+    @staticmethod
+    def is_cacheable(plan: QueryPlan) -> bool:
+        """Only plain row queries over the whole filtered set can serve other queries."""
+        return not (plan.computed or plan.aggregates or plan.keyset or plan.limit is not None)
+
+    def _covers(self, entry: CachedResult, database: str, plan: QueryPlan, schema_key: int) -> bool:
+        if entry.database != database or entry.plan.table_name != plan.table_name or entry.schema_key != schema_key:
+            return False
+        if not entry.predicates.issubset(plan.predicates):
+            return False
+        if entry.plan.columns is None:
+            return True
+        required = plan.referenced_columns
+        return required is not None and required.issubset(entry.plan.columns)
+
+    def get(self, entry_id: str) -> Optional[CachedResult]:
+        entry = self._entries.get(entry_id)
+        if entry is None or entry.age_seconds >= self.ttl_seconds:
+            return None
+        return entry
+
+    def find(self, database: str, plan: QueryPlan, column_types: Optional[Dict[str, str]] = None) -> Optional[CachedResult]:
+        """
+        Returns the narrowest live cached result that covers the plan, i.e.
+        the one with the fewest rows left to filter.
+        """
+        if not LocalInventoryEngine.can_execute(plan):
+            return None
+
+        schema_key = self.schema_key(column_types)
+        best: Optional[CachedResult] = None
+        for entry_id, entry in list(self._entries.items()):
+            if entry.age_seconds >= self.ttl_seconds:
+                del self._entries[entry_id]
+                continue
+            if self._covers(entry, database, plan, schema_key) and (best is None or entry.table.num_rows < best.table.num_rows):
+                best = entry
+
+        if best is not None:
+            self._entries.move_to_end(best.id)
+        return best
+
+    def _record_hit(self, database: str, plan: QueryPlan) -> int:
+        """Counts a run of the plan's filter shape and returns its runs within the TTL."""
+        key = (database, plan.table_name, frozenset(plan.predicates))
+        now = time.monotonic()
+        first_seen, hits = self._shape_hits.pop(key, (now, 0))
+        if now - first_seen >= self.ttl_seconds:
+            first_seen, hits = now, 0
+        self._shape_hits[key] = (first_seen, hits + 1)
+        while len(self._shape_hits) > self.max_entries * 8:
+            self._shape_hits.popitem(last=False)
+        return hits + 1
+
+    def schedule_populate(self, database: str, plan: QueryPlan, execution_id: str, column_types: Optional[Dict[str, str]] = None) -> None:
+        """
+        Loads the full result of a completed execution in the background
+        when its filter shape is being repeated and a download slot is free.
+        """
+        if not self.is_cacheable(plan) or (database, plan) in self._pending:
+            return
+        if self._record_hit(database, plan) < self.min_hits:
+            return
+        if len(self._tasks) >= self.max_concurrent_populates:
+            log.info(f"Skipped caching result of {execution_id}: {len(self._tasks)} downloads in flight")
+            return
+        self._pending.add((database, plan))
+        task = asyncio.create_task(self._populate(database, plan, execution_id, column_types or {}))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _populate(self, database: str, plan: QueryPlan, execution_id: str, column_types: Dict[str, str]) -> None:
+        try:
+            execution = await athena_client.wait_for_query(execution_id)
+            location = urlparse(execution['ResultConfiguration']['OutputLocation'])
+            bucket, key = location.netloc, location.path.lstrip("/")
+
+            size = await asyncio.to_thread(s3_client.get_object_size, bucket, key)
+            if size > self.max_bytes:
+                log.info(f"Result of {execution_id} is {size} bytes, too large to cache")
+                return
+
+            content = await asyncio.to_thread(s3_client.read_bytes, bucket, key)
+            table = await asyncio.to_thread(LocalInventoryEngine._parse_csv, content, column_types)
+
+            entry = CachedResult(database, plan, table, self.schema_key(column_types))
+            self._entries[entry.id] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            log.info(f"Cached result {entry.id} of {execution_id}: {table.num_rows} rows, {len(entry.predicates)} predicates")
+        except Exception as e:
+            log.warning(f"Could not cache result of {execution_id}: {str(e)}")
+        finally:
+            self._pending.discard((database, plan))
+
+    def invalidate(self, database: str, table_name: str) -> None:
+        for entry_id, entry in list(self._entries.items()):
+            if entry.database == database and entry.plan.table_name == table_name:
+                del self._entries[entry_id]
+
+inventory_result_cache = InventoryResultCache()
@@ -0,0 +1,140 @@
+import asyncio
+import time
+from dataclasses import dataclass, replace
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+from app.core.config import settings
+from app.lib.athena import athena_client
+from app.lib.logger import log
+from app.lib.s3_client import s3_client
+from app.schemas.inventory_analysis import ScanEstimate
+from app.services.inventory_analysis.query_plan import QueryPlan
+
+# Athena bills at least 10 MB per query
+MIN_BILLED_BYTES = 10 * 1024 * 1024
+
+# Glue table parameters that may carry the table size, in order of preference
+SIZE_PARAMETERS = ("totalSize", "sizeKey", "rawDataSize")
+
+# Always kept in a downgraded projection so rows stay identifiable
+DOWNGRADE_KEY_COLUMNS = ("sku",)
+
+@dataclass(frozen=True)
+class TableStatistics:
+    size_bytes: Optional[int]
+    column_count: int
+    # Parquet/ORC tables only read the referenced columns
+    columnar: bool
+
+class ScanCostEstimator:
+    """
+    Estimates how many bytes an inventory plan scans from the table size
+    (Glue statistics, else the size of the table location in S3) and the
+    fraction of columns it reads, and enforces a per-tenant scan budget.
+
+    EXPLAIN (TYPE IO) only reports sizes when column statistics exist and
+    costs an extra Athena execution per query, so table statistics are used
+    instead.
+    """
+    def __init__(self, ttl_seconds: int = settings.ATHENA_SCHEMA_CACHE_TTL):
+        self.ttl_seconds = ttl_seconds
+        # (database, table) -> (loaded_at, statistics)
+        self._cache: Dict[Tuple[str, str], Tuple[float, TableStatistics]] = {}
+
+    async def get_table_statistics(self, database: str, table_name: str) -> Optional[TableStatistics]:
+        key = (database, table_name)
+        cached = self._cache.get(key)
+        if cached and time.monotonic() - cached[0] < self.ttl_seconds:
+            return cached[1]
+
+        try:
+            metadata = await asyncio.to_thread(athena_client.get_table_metadata, database, table_name)
+            parameters = metadata.get('Parameters', {})
+
+            size_bytes = next((int(parameters[p]) for p in SIZE_PARAMETERS if parameters.get(p, "").isdigit()), None)
+            if size_bytes is None and parameters.get('location'):
+                location = urlparse(parameters['location'])
+                # A capped listing undercounts huge prefixes rather than blocking on them
+                size_bytes = await asyncio.to_thread(
+                    s3_client.get_prefix_size, location.netloc, location.path.lstrip("/"), settings.SCAN_ESTIMATE_MAX_LISTED_OBJECTS
+                )
+
+            storage = " ".join([parameters.get('inputformat', ''), parameters.get('classification', '')]).lower()
+            statistics = TableStatistics(
+                size_bytes=size_bytes,
+                column_count=len(metadata.get('Columns', [])) + len(metadata.get('PartitionKeys', [])),
+                columnar="parquet" in storage or "orc" in storage,
+            )
+            log.info(f"Loaded scan statistics for {database}.{table_name}: {statistics}")
+        except Exception as e:
+            log.warning(f"Could not load scan statistics for {database}.{table_name}: {str(e)}")
+            return cached[1] if cached else None
+
+        self._cache[key] = (time.monotonic(), statistics)
+        return statistics
+
+    async def estimate(self, plan: QueryPlan, database: str) -> ScanEstimate:
+        statistics = await self.get_table_statistics(database, plan.table_name)
+        if statistics is None or statistics.size_bytes is None:
+            return ScanEstimate()
+
+        scanned = statistics.size_bytes
+        columns = plan.referenced_columns
+        if statistics.columnar and columns is not None and statistics.column_count:
+            scanned = int(scanned * min(1.0, len(columns) / statistics.column_count))
+
+        billed = max(scanned, MIN_BILLED_BYTES)
+        return ScanEstimate(
+            estimated_bytes=scanned,
+            estimated_cost_usd=round(billed / 1024 ** 4 * settings.ATHENA_COST_PER_TB, 6),
+        )
+
+    @staticmethod
+    def downgrade(plan: QueryPlan) -> Optional[QueryPlan]:
+        """
+        Narrows a row query to the columns it filters and sorts on plus the
+        key columns, and caps it at ATHENA_DOWNGRADE_ROW_LIMIT rows. Returns
+        None when the plan cannot be narrowed.
+        """
+        if plan.aggregates or plan.computed:
+            return None
+        columns = [c for c in DOWNGRADE_KEY_COLUMNS]
+        columns += [p.target for p in plan.predicates if not p.is_expression]
+        columns += [k.column for k in plan.order_by]
+        columns = tuple(dict.fromkeys(columns))
+        if plan.columns is not None and set(plan.columns) <= set(columns):
+            return None
+        limit = min(plan.limit or settings.ATHENA_DOWNGRADE_ROW_LIMIT, settings.ATHENA_DOWNGRADE_ROW_LIMIT)
+        return replace(plan, columns=columns, limit=limit)
+
+    async def check(self, plan: QueryPlan, database: str, budget_bytes: Optional[int]) -> Tuple[QueryPlan, ScanEstimate]:
+        """
+        Returns the plan to run and its estimate. Over budget, the plan is
+        downgraded when that brings it under budget, otherwise the estimate's
+        action is "rejected" and the plan must not run.
+        """
+        estimate = await self.estimate(plan, database)
+        estimate.budget_bytes = budget_bytes or None
+        if not budget_bytes or estimate.estimated_bytes is None or estimate.estimated_bytes <= budget_bytes:
+            return plan, estimate
+
+        downgraded = self.downgrade(plan)
+        if downgraded is not None:
+            downgraded_estimate = await self.estimate(downgraded, database)
+            if downgraded_estimate.estimated_bytes is not None and downgraded_estimate.estimated_bytes <= budget_bytes:
+                log.info(
+                    f"Downgraded inventory query from ~{estimate.estimated_bytes} to ~{downgraded_estimate.estimated_bytes} "
+                    f"scanned bytes (budget {budget_bytes})"
+                )
+                return downgraded, downgraded_estimate.model_copy(update={
+                    "budget_bytes": budget_bytes,
+                    "action": "downgraded",
+                    "columns": list(downgraded.columns),
+                    "row_limit": downgraded.limit,
+                })
+
+        log.warning(f"Rejected inventory query scanning ~{estimate.estimated_bytes} bytes (budget {budget_bytes})")
+        estimate.action = "rejected"
+        return plan, estimate
+
+scan_cost_estimator = ScanCostEstimator()
@@ -0,0 +1,205 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+from dateutil.relativedelta import relativedelta
+import pandas as pd
+from app.core.config import settings
+from app.lib.logger import log
+from app.repos.sales.sales_repo import AsyncSalesRepo
+
+# (sales type, region, year, month); region is None for dealers without one
+RollupKey = Tuple[str, Optional[str], int, int]
+
+def _normalize(value: Optional[str]) -> Optional[str]:
+    # SQL Server compares these case-insensitively and ignores trailing spaces
+    return value.rstrip().casefold() if value is not None else None
+
+@dataclass
+class SalesRollup:
+    """Units sold per (sales type, region, year, month) of one company."""
+    units: Dict[RollupKey, Any]
+    # Months in [covered_from, covered_until) are loaded
+    covered_from: date
+    covered_until: date
+    # Normalized region -> region name as stored in CorporateRegion
+    region_names: Dict[Optional[str], Optional[str]] = field(default_factory=dict)
+    refreshed_at: float = field(default_factory=time.monotonic)
+
+    def covers(self, start_date: date, end_date: date) -> bool:
+        return self.covered_from <= start_date and end_date <= self.covered_until
+
+    def _matches(self, key: RollupKey, sales_type: str, region_name: Optional[str]) -> bool:
+        if key[0] != _normalize(sales_type):
+            return False
+        return not region_name or region_name.lower() == "all" or key[1] == _normalize(region_name)
+
+    def total(self, start_date: date, end_date: date, sales_type: str, region_name: Optional[str]) -> Any:
+        """SUM of units sold in the range, or None when no sales matched (like SQL)."""
+        values = [
+            units for key, units in self.units.items()
+            if self._matches(key, sales_type, region_name) and start_date <= date(key[2], key[3], 1) < end_date
+        ]
+        return sum(values) if values else None
+
+    def monthly_totals(self, start_date: date, end_date: date, sales_type: str, region_name: Optional[str]) -> List[Dict[str, Any]]:
+        """Units sold per year and month in the range, ordered by month."""
+        totals: Dict[Tuple[int, int], Any] = {}
+        for key, units in self.units.items():
+            if self._matches(key, sales_type, region_name) and start_date <= date(key[2], key[3], 1) < end_date:
+                totals[(key[2], key[3])] = totals.get((key[2], key[3]), 0) + units
+        return [
+            {"SalesYear": year, "SalesMonth": month, "TotalUnitsSold": units}
+            for (year, month), units in sorted(totals.items(), key=lambda item: (item[0][1], item[0][0]))
+        ]
+
+    def totals_by_region(self, start_date: date, end_date: date, sales_type: str, by_month: bool = False) -> pd.DataFrame:
+        """Units sold per region (and month) in the range, shaped like SalesRepo.get_units_sold_by_region."""
+        sales_type = _normalize(sales_type)
+        totals: Dict[Tuple, Any] = {}
+        for (key_type, region, year, month), units in self.units.items():
+            if key_type != sales_type or not start_date <= date(year, month, 1) < end_date:
+                continue
+            group = (self.region_names.get(region, region), year, month) if by_month else (self.region_names.get(region, region),)
+            totals[group] = totals.get(group, 0) + units
+        columns = ["RegionName", "SalesYear", "SalesMonth"] if by_month else ["RegionName"]
+        return pd.DataFrame([group + (units,) for group, units in totals.items()], columns=columns + ["TotalUnitsSold"])
+
+class SalesRollupStore:
+    """
+    In-process monthly sales rollup per company, so forecast requests read
+    pre-aggregated months instead of grouping raw Sales rows.
+
+    The first request of a company builds SALES_ROLLUP_HISTORY_MONTHS months
+    in one query. If that build fails, the company is served from SQL for
+    SALES_ROLLUP_BUILD_BACKOFF_SECONDS before another build is tried.
+
+    While the refresh timer runs (start()/stop() from the app lifespan),
+    every loaded rollup older than the refresh interval has its last
+    SALES_ROLLUP_REFRESH_MONTHS months (where late sales still land)
+    reloaded and swapped in, whether or not it was requested since.
+    Without the timer, a stale rollup is refreshed in the background on
+    its next request. Ranges outside the loaded months are not answered,
+    so callers fall back to SQL.
+    """
+    def __init__(
+        self,
+        enabled: bool = settings.SALES_ROLLUP_ENABLED,
+        history_months: int = settings.SALES_ROLLUP_HISTORY_MONTHS,
+        refresh_months: int = settings.SALES_ROLLUP_REFRESH_MONTHS,
+        refresh_seconds: int = settings.SALES_ROLLUP_REFRESH_SECONDS,
+        build_backoff_seconds: int = settings.SALES_ROLLUP_BUILD_BACKOFF_SECONDS
+    ):
+        self.enabled = enabled
+        self.history_months = history_months
+        self.refresh_months = refresh_months
+        self.refresh_seconds = refresh_seconds
+        self.build_backoff_seconds = build_backoff_seconds
+        self.repo = AsyncSalesRepo()
+        self._rollups: Dict[str, SalesRollup] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # company -> time of its last failed build
+        self._failed_at: Dict[str, float] = {}
+        self._timer: Optional[asyncio.Task] = None
+
+    async def get_or_build(self, company_id: str) -> Optional[SalesRollup]:
+        """
+        Returns the company rollup, waiting for the bulk build on first use
+        (concurrent callers share it) and scheduling an incremental refresh
+        when it is stale. Returns None if the build failed.
+        """
+        if not self.enabled:
+            return None
+
+        rollup = self._rollups.get(company_id)
+        if rollup is None:
+            task = self._tasks.get(company_id)
+            if task is None or task.done():
+                failed_at = self._failed_at.get(company_id)
+                if failed_at is not None and time.monotonic() - failed_at < self.build_backoff_seconds:
+                    return None
+                task = self._tasks[company_id] = asyncio.create_task(self._build(company_id))
+            await asyncio.shield(task)
+            return self._rollups.get(company_id)
+
+        if time.monotonic() - rollup.refreshed_at >= self.refresh_seconds:
+            self._schedule_refresh(company_id)
+        return rollup
+
+    def _schedule_refresh(self, company_id: str) -> asyncio.Task:
+        task = self._tasks.get(company_id)
+        if task is None or task.done():
+            task = self._tasks[company_id] = asyncio.create_task(self._refresh(company_id))
+        return task
+
+    def start(self) -> None:
+        """Starts refreshing stale rollups on a timer; call from a running event loop."""
+        if self.enabled and (self._timer is None or self._timer.done()):
+            self._timer = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            try:
+                await self._timer
+            except asyncio.CancelledError:
+                pass
+            self._timer = None
+
+    async def _refresh_loop(self) -> None:
+        # Checked more often than the interval so a rollup is at most a minute past it
+        interval = min(self.refresh_seconds, 60)
+        while True:
+            await asyncio.sleep(interval)
+            for company_id, rollup in list(self._rollups.items()):
+                if time.monotonic() - rollup.refreshed_at >= self.refresh_seconds:
+                    # One company at a time, so refreshes never pile onto SQL Server
+                    await asyncio.shield(self._schedule_refresh(company_id))
+
+    @staticmethod
+    def _to_units(rows: List[Dict[str, Any]]) -> Tuple[Dict[RollupKey, Any], Dict[Optional[str], Optional[str]]]:
+        units: Dict[RollupKey, Any] = {}
+        region_names: Dict[Optional[str], Optional[str]] = {}
+        for row in rows:
+            region = _normalize(row["RegionName"])
+            region_names.setdefault(region, row["RegionName"])
+            key = (_normalize(row["SalesType"]), region, int(row["SalesYear"]), int(row["SalesMonth"]))
+            units[key] = units.get(key, 0) + (row["TotalUnitsSold"] or 0)
+        return units, region_names
+
+    async def _build(self, company_id: str) -> None:
+        covered_until = date.today().replace(day=1) + relativedelta(months=1)
+        covered_from = covered_until - relativedelta(months=self.history_months)
+        try:
+            start = time.monotonic()
+            rows = await self.repo.get_monthly_rollup(company_id, covered_from, covered_until)
+            units, region_names = self._to_units(rows)
+            self._rollups[company_id] = SalesRollup(units, covered_from, covered_until, region_names)
+            self._failed_at.pop(company_id, None)
+            log.info(f"Built sales rollup for {company_id}: {len(rows)} groups from {covered_from} in {time.monotonic() - start:.2f}s")
+        except Exception as e:
+            self._failed_at[company_id] = time.monotonic()
+            log.error(f"Failed to build sales rollup for {company_id}, using SQL for {self.build_backoff_seconds}s: {str(e)}")
+
+    async def _refresh(self, company_id: str) -> None:
+        covered_until = date.today().replace(day=1) + relativedelta(months=1)
+        refresh_from = covered_until - relativedelta(months=self.refresh_months)
+        try:
+            start = time.monotonic()
+            rows = await self.repo.get_monthly_rollup(company_id, refresh_from, covered_until)
+            current = self._rollups[company_id]
+            covered_from = max(current.covered_from, covered_until - relativedelta(months=self.history_months))
+            if refresh_from > current.covered_until:
+                # Months between the old coverage and the reloaded ones were never loaded
+                covered_from = refresh_from
+            # Reloaded months replace what was there; older months are kept
+            units = {k: v for k, v in current.units.items() if covered_from <= date(k[2], k[3], 1) < refresh_from}
+            reloaded, region_names = self._to_units(rows)
+            units.update(reloaded)
+            self._rollups[company_id] = SalesRollup(units, covered_from, covered_until, {**current.region_names, **region_names})
+            log.info(f"Refreshed sales rollup for {company_id} from {refresh_from}: {len(rows)} groups in {time.monotonic() - start:.2f}s")
+        except Exception as e:
+            log.error(f"Failed to refresh sales rollup for {company_id}: {str(e)}")
+
+sales_rollup_store = SalesRollupStore()
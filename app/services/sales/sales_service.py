@@ -1,32 +1,49 @@
-from typing import Any
+from typing import Any, AsyncIterator, Optional
+import pandas as pd
 from dateutil.relativedelta import relativedelta
 from datetime import date
-from app.repos.sales.sales_repo import SalesRepo
-from sqlalchemy.orm import Session
+from app.repos.sales.sales_repo import AsyncSalesRepo
+from app.services.sales.sales_rollup import sales_rollup_store
 
-class SalesService:
-    def __init__(self, db: Session):
-        self.repo = SalesRepo(db)
+def _month_range(year: int, month: int) -> tuple[date, date]:
+    """First day of the month and first day of the next month."""
+    start_date = date(year, month, 1)
+    # Handle year rollover for next month
+    if month == 12:
+        end_date = date(year + 1, 1, 1)
+    else:
+        end_date = date(year, month + 1, 1)
+    return start_date, end_date
 
-    def get_monthly_sales_total(
-        self, 
-        company_id: str, 
-        year: int, 
+def _last_24_months_range() -> tuple[date, date]:
+    # From today to 24 months ago, because the sales data is available from the last month
+    today = date.today()
+    end_date = today.replace(day=1)
+    start_date = end_date - relativedelta(months=24)
+    return start_date, end_date
+
+class AsyncSalesService:
+    """
+    Sales totals for the demand forecast and sales tools. Totals come from
+    the monthly sales rollup; ranges it does not cover are queried on the
+    DB executor.
+    """
+    def __init__(self):
+        self.repo = AsyncSalesRepo()
+
+    async def get_monthly_sales_total(
+        self,
+        company_id: str,
+        year: int,
         month: int,
         sales_type: str,
         region_name: str
     ) -> float:
-        """
-        Calculates the total units sold for a specific company in a given month.
-        """
-        start_date = date(year, month, 1)
-        # Handle year rollover for next month
-        if month == 12:
-            end_date = date(year + 1, 1, 1)
-        else:
-            end_date = date(year, month + 1, 1)
-
-        total_units_sold = self.repo.get_units_sold_by_company_and_date_range(
+        start_date, end_date = _month_range(year, month)
+        rollup = await sales_rollup_store.get_or_build(company_id)
+        if rollup is not None and rollup.covers(start_date, end_date):
+            return rollup.total(start_date, end_date, sales_type, region_name)
+        return await self.repo.get_units_sold_by_company_and_date_range(
             company_id=company_id,
             start_date=start_date,
             end_date=end_date,
@@ -34,28 +51,94 @@ class SalesService:
             region_name=region_name
         )
 
-        return total_units_sold
-
-    def get_last_12_months_yoy_sales_total(
-        self, 
-        company_id: str, 
+    async def get_last_12_months_yoy_sales_total(
+        self,
+        company_id: str,
         sales_type: str,
         region_name: str
     ) -> list[dict[str, Any]]:
+        start_date, end_date = _last_24_months_range()
+        rollup = await sales_rollup_store.get_or_build(company_id)
+        if rollup is not None and rollup.covers(start_date, end_date):
+            return rollup.monthly_totals(start_date, end_date, sales_type, region_name)
+        return await self.repo.get_yoy_sales_total(
+            company_id=company_id,
+            start_date=start_date,
+            end_date=end_date,
+            sales_type=sales_type,
+            region_name=region_name
+        )
+
+    async def get_sales_by_region(
+        self,
+        company_id: str,
+        start_date: date,
+        end_date: date,
+        sales_type: str,
+        by_month: bool = False
+    ) -> pd.DataFrame:
+        rollup = await sales_rollup_store.get_or_build(company_id)
+        if rollup is not None and rollup.covers(start_date, end_date):
+            return rollup.totals_by_region(start_date, end_date, sales_type, by_month)
+        return await self.repo.get_units_sold_by_region(
+            company_id=company_id,
+            start_date=start_date,
+            end_date=end_date,
+            sales_type=sales_type,
+            by_month=by_month
+        )
+
+    async def get_dealer_sales_page(
+        self,
+        company_id: str,
+        start_date: date,
+        end_date: date,
+        sales_type: str,
+        region_name: str,
+        top_n: Optional[int] = None,
+        offset: int = 0,
+        limit: int = 20
+    ) -> tuple[list[dict[str, Any]], bool]:
         """
-        Calculates the total units sold for a specific company in a given month.
+        Returns one page of the dealer ranking and whether another page
+        exists. One extra dealer is fetched to know that, never past top N.
         """
-        # From today to 24 months ago, because the sales data is available from the last month
-        today = date.today()
-        end_date = today.replace(day=1)
-        start_date = end_date - relativedelta(months=24)
+        remaining = top_n - offset if top_n is not None else None
+        if remaining is not None and remaining <= 0:
+            return [], False
 
-        result = self.repo.get_yoy_sales_total(
+        fetch = limit + 1 if remaining is None else min(limit + 1, remaining)
+        rows = await self.repo.get_units_sold_by_dealer(
             company_id=company_id,
             start_date=start_date,
             end_date=end_date,
             sales_type=sales_type,
-            region_name=region_name
+            region_name=region_name,
+            offset=offset,
+            limit=fetch
         )
+        return rows[:limit], len(rows) > limit
 
-        return result
\ No newline at end of file
+    async def stream_dealer_sales(
+        self,
+        company_id: str,
+        start_date: date,
+        end_date: date,
+        sales_type: str,
+        region_name: str,
+        top_n: Optional[int] = None,
+        offset: int = 0
+    ) -> AsyncIterator[list[dict[str, Any]]]:
+        """Yields the dealer ranking in cursor batches, from `offset` to top N."""
+        if top_n is not None and top_n <= offset:
+            return
+        async for batch in self.repo.stream_units_sold_by_dealer(
+            company_id=company_id,
+            start_date=start_date,
+            end_date=end_date,
+            sales_type=sales_type,
+            region_name=region_name,
+            offset=offset,
+            limit=top_n - offset if top_n is not None else None
+        ):
+            yield batch
@@ -24,7 +24,7 @@ class DemandForecastTools:
             req_model = DemandForecastRequest(**request)
             service = self._get_service()
             
-            result = service.get_forecast_explanation(req_model)
+            result = await service.get_forecast_explanation(req_model)
             
             # If it's a Pydantic model, convert to dict
             if hasattr(result, "model_dump"):
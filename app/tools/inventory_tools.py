@@ -1,9 +1,28 @@
 from app.services.inventory_analysis.factory import InventoryAnalysisServiceFactory
 from app.core.client_config import get_client_config
 import json
-from typing import Dict, Any
-from app.schemas.inventory_analysis import InventoryAnalysisRequestWithSelection, InventoryAnalysisRequestWithSelection
+from typing import Any, Awaitable, Callable, Dict, List
+from app.schemas.inventory_analysis import InventoryAggregationRequest, InventoryAnalysisRequestWithSelection, StockHealthRequest
 from app.core.context import get_company_id
+from app.lib.logger import log
+
+# Default projections used when the agent does not ask for specific columns.
+# Only columns the request filters already reference (STRING_FILTER_ATTRIBUTES
+# and NUMERIC_FIELDS), so a default call never names a column the table lacks
+ENOUGH_STOCK_COLUMNS = [
+    "sku", "supplier", "main category", "lifecycle", "moq",
+    "expected lead time (days)", "available", "on-hand inventory",
+    "total inventory", "target inventory", "current robust autonomy",
+    "target autonomy", "replenishment quantity",
+]
+
+EXCESS_STOCK_COLUMNS = [
+    "sku", "supplier", "main category", "lifecycle", "available",
+    "on-hand inventory", "in-transit inventory", "total inventory",
+    "target inventory", "current robust autonomy", "target autonomy",
+]
+
+STOCK_HEALTH_COLUMNS = list(dict.fromkeys(ENOUGH_STOCK_COLUMNS + EXCESS_STOCK_COLUMNS))
 
 class InventoryTools:
     def _get_service(self):
@@ -22,10 +41,12 @@ class InventoryTools:
         try:
             # Convert dict to Pydantic model
             req_model = InventoryAnalysisRequestWithSelection(**request)
+            if req_model.columns is None:
+                req_model.columns = ENOUGH_STOCK_COLUMNS
             service = self._get_service()
             response = await service.get_enough_stock(req_model)
             
-            json_output = json.dumps(response, indent=2)
+            json_output = json.dumps(response, indent=2, default=str)
             
             return {
                 "content": [{"type": "text", "text": json_output}],
@@ -34,7 +55,9 @@ class InventoryTools:
                     "executionId": response.get("executionId", ""),
                     "nextToken": response.get("nextToken", "") or "",
                     "hasMore": response.get("hasMore", False),
-                    "count": response.get("count", 0)
+                    "count": response.get("count", 0),
+                    "summary": response.get("summary"),
+                    "estimate": response.get("estimate")
                 }
             }
         except Exception as e:
@@ -55,10 +78,12 @@ class InventoryTools:
         print("Request received for excess inventory analysis:", request)
         try:
             req_model = InventoryAnalysisRequestWithSelection(**request)
+            if req_model.columns is None:
+                req_model.columns = EXCESS_STOCK_COLUMNS
             service = self._get_service()
             response = await service.get_excess_stock(req_model)
             
-            json_output = json.dumps(response, indent=2)
+            json_output = json.dumps(response, indent=2, default=str)
             
             return {
                 "content": [{"type": "text", "text": json_output}],
@@ -67,7 +92,9 @@ class InventoryTools:
                     "executionId": response.get("executionId", ""),
                     "nextToken": response.get("nextToken", "") or "",
                     "hasMore": response.get("hasMore", False),
-                    "count": response.get("count", 0)
+                    "count": response.get("count", 0),
+                    "summary": response.get("summary"),
+                    "estimate": response.get("estimate")
                 }
             }
         except Exception as e:
@@ -84,4 +111,122 @@ class InventoryTools:
                 }
             }
 
+    async def inventory_aggregation(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        log.info(f"Request received for inventory aggregation: {request}")
+        try:
+            req_model = InventoryAggregationRequest(**request)
+            service = self._get_service()
+            response = await service.aggregate_inventory(req_model)
+            
+            json_output = json.dumps(response, indent=2, default=str)
+            
+            return {
+                "content": [{"type": "text", "text": json_output}],
+                "structuredContent": {
+                    "results": json_output,
+                    "executionId": response.get("executionId", ""),
+                    "nextToken": response.get("nextToken", "") or "",
+                    "hasMore": response.get("hasMore", False),
+                    "count": response.get("count", 0),
+                    "summary": response.get("summary"),
+                    "estimate": response.get("estimate")
+                }
+            }
+        except Exception as e:
+            log.error(f"Error calling inventory aggregation: {str(e)}")
+            error_output = {"error": f"Unexpected error: {str(e)}"}
+            return {
+                "content": [{"type": "text", "text": json.dumps(error_output, indent=2)}],
+                "structuredContent": {
+                    "results": json.dumps(error_output),
+                    "executionId": "",
+                    "nextToken": "",
+                    "hasMore": False,
+                    "count": 0
+                }
+            }
+
+    async def stock_health_analysis(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        log.info(f"Request received for stock health analysis: {request}")
+        try:
+            req_model = StockHealthRequest(**request)
+            if req_model.columns is None:
+                req_model.columns = STOCK_HEALTH_COLUMNS
+            service = self._get_service()
+            response = await service.get_stock_health(req_model)
+            
+            json_output = json.dumps(response, indent=2, default=str)
+            
+            return {
+                "content": [{"type": "text", "text": json_output}],
+                "structuredContent": {
+                    "results": json_output,
+                    "executionId": response.get("executionId", ""),
+                    "nextToken": response.get("nextToken", "") or "",
+                    "hasMore": response.get("hasMore", False),
+                    "count": response.get("count", 0),
+                    "summary": response.get("summary"),
+                    "classes": response.get("classes"),
+                    "estimate": response.get("estimate")
+                }
+            }
+        except Exception as e:
+            log.error(f"Error calling stock health analysis: {str(e)}")
+            error_output = {"error": f"Unexpected error: {str(e)}"}
+            return {
+                "content": [{"type": "text", "text": json.dumps(error_output, indent=2)}],
+                "structuredContent": {
+                    "results": json.dumps(error_output),
+                    "executionId": "",
+                    "nextToken": "",
+                    "hasMore": False,
+                    "count": 0
+                }
+            }
+
+    async def inventory_stream(
+        self,
+        request: Dict[str, Any],
+        on_page: Callable[[List[Dict[str, Any]], int], Awaitable[None]]
+    ) -> Dict[str, Any]:
+        """
+        Runs the query and hands every page of rows to `on_page` (with the
+        running row count) as it is read, instead of collecting the result.
+        """
+        log.info(f"Request received for inventory stream: {request}")
+        try:
+            req_model = InventoryAnalysisRequestWithSelection(**request)
+            service = self._get_service()
+            execution_id, pages = await service.stream_inventory(req_model)
+
+            count = 0
+            async for rows, _ in pages:
+                count += len(rows)
+                await on_page(rows, count)
+
+            output = {"executionId": execution_id, "count": count}
+            return {
+                "content": [{"type": "text", "text": json.dumps(output, indent=2, default=str)}],
+                "structuredContent": {
+                    "results": json.dumps(output, default=str),
+                    "executionId": execution_id,
+                    "nextToken": "",
+                    "hasMore": False,
+                    "count": count
+                }
+            }
+        except Exception as e:
+            log.error(f"Error calling inventory stream: {str(e)}")
+            error_output = {"error": f"Unexpected error: {str(e)}"}
+            return {
+                "content": [{"type": "text", "text": json.dumps(error_output, indent=2)}],
+                "structuredContent": {
+                    "results": json.dumps(error_output),
+                    "executionId": "",
+                    "nextToken": "",
+                    "hasMore": False,
+                    "count": 0
+                }
+            }
+
 inventory_tools = InventoryTools()
@@ -0,0 +1,82 @@
+import json
+from datetime import date
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from dateutil.relativedelta import relativedelta
+from app.core.context import get_company_id
+from app.lib.logger import log
+from app.schemas.sales import DealerSales, DealerSalesRequest
+from app.services.sales.sales_service import AsyncSalesService
+
+class SalesTools:
+    def __init__(self):
+        self.service = AsyncSalesService()
+
+    @staticmethod
+    def _date_range(request: DealerSalesRequest) -> Tuple[date, date]:
+        end_date = date.fromisoformat(request.end_date) if request.end_date else date.today().replace(day=1)
+        start_date = date.fromisoformat(request.start_date) if request.start_date else end_date - relativedelta(months=12)
+        return start_date, end_date
+
+    @staticmethod
+    def _to_dealer_sales(row: Dict[str, Any]) -> Dict[str, Any]:
+        return DealerSales(
+            dealer_id=str(row["DealerID"]),
+            region=row["RegionName"],
+            units_sold=float(row["TotalUnitsSold"] or 0),
+            share=row["ShareOfSales"],
+            rank=int(row["SalesRank"])
+        ).model_dump()
+
+    async def dealer_sales_breakdown(
+        self,
+        request: Dict[str, Any],
+        on_batch: Optional[Callable[[List[Dict[str, Any]], int], Awaitable[None]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Ranks dealers by units sold for the company in context. Returns one
+        page, or with `stream` hands every batch of the ranking to
+        `on_batch` and returns only the count.
+        """
+        log.info(f"Request received for dealer sales breakdown: {request}")
+        try:
+            company_id = get_company_id()
+            if not company_id:
+                raise ValueError("Company ID not found in context")
+
+            req_model = DealerSalesRequest(**request)
+            start_date, end_date = self._date_range(req_model)
+            offset = int(req_model.nextToken) if req_model.nextToken else 0
+
+            if req_model.stream and on_batch is not None:
+                count = 0
+                async for batch in self.service.stream_dealer_sales(
+                    company_id, start_date, end_date, req_model.sales_type, req_model.region, req_model.top_n, offset
+                ):
+                    count += len(batch)
+                    await on_batch([self._to_dealer_sales(row) for row in batch], count)
+                response = {"results": [], "count": count, "hasMore": False, "nextToken": None}
+            else:
+                limit = req_model.limit or 20
+                rows, has_more = await self.service.get_dealer_sales_page(
+                    company_id, start_date, end_date, req_model.sales_type, req_model.region, req_model.top_n, offset, limit
+                )
+                response = {
+                    "results": [self._to_dealer_sales(row) for row in rows],
+                    "count": len(rows),
+                    "hasMore": has_more,
+                    "nextToken": str(offset + len(rows)) if has_more else None
+                }
+
+            return {
+                "content": [{"type": "text", "text": json.dumps(response, indent=2)}],
+                "structuredContent": response
+            }
+        except Exception as e:
+            log.error(f"Error calling dealer sales breakdown: {str(e)}")
+            error_output = {"error": f"Unexpected error: {str(e)}"}
+            return {
+                "content": [{"type": "text", "text": json.dumps(error_output, indent=2)}],
+                "structuredContent": error_output
+            }
+
+sales_tools = SalesTools()
@@ -0,0 +1,92 @@
+"""
+Microbenchmark for QueryBuilderService.build_query.
+
+Compares the per-build cost of the builder before query plans
+(benchmarks/legacy_query_builder.py), a plan cache miss (fingerprint, compile
+and render for a request not seen before) and a plan cache hit, for a small
+set of request shapes repeated the way agent fan-out repeats them.
+
+A miss still costs roughly twice the legacy builder, since it builds the
+predicate and sort key objects the result cache, local engine and keyset
+pagination reuse; the fingerprint that a hit pays for only reads the fields
+the plan is compiled from.
+
+    python -m benchmarks.bench_query_builder
+"""
+import asyncio
+import os
+import time
+
+# Settings are loaded at import time; the builder never touches these.
+for key in ("ENV", "DB_SERVER", "DB_NAME", "DB_USER", "DB_PASSWORD", "AWS_S3_BUCKET"):
+    os.environ.setdefault(key, "bench")
+
+from app.schemas.inventory_analysis import InventoryAnalysisRequestWithSelection
+from app.services.inventory_analysis.query_builder_service import QueryBuilderService
+from benchmarks.legacy_query_builder import LegacyQueryBuilderService
+
+TABLE_NAME = "inventory"
+COLUMN_TYPES = {"available": "double", "total inventory": "double", "target inventory": "double"}
+
+REQUESTS = [
+    InventoryAnalysisRequestWithSelection(**{"supplier": "ACME"}),
+    InventoryAnalysisRequestWithSelection(**{
+        "available": {"condition": "lesser_than", "max": 100, "sortBy": "ASC"},
+        "lifecycle": "Active",
+    }),
+    InventoryAnalysisRequestWithSelection(**{
+        "columns": ["sku", "supplier", "available"],
+        "replenishment quantity": {"condition": "greater_than", "min": 0, "sortBy": "DESC"},
+        "target autonomy": {"condition": "greater_and_lesser_equals", "min": 10, "max": 60},
+    }),
+    InventoryAnalysisRequestWithSelection(**{
+        "supplier": "ACME",
+        "selections": [
+            "sku",
+            {
+                "operation": "diff",
+                "value_a": "target inventory",
+                "value_b": "total inventory",
+                "alias": "gap",
+                "sortBy": "DESC",
+                "comparison": {"condition": "greater_than", "min": 0},
+            },
+        ],
+    }),
+]
+
+def run(service: QueryBuilderService, iterations: int) -> float:
+    async def loop():
+        for _ in range(iterations):
+            for request in REQUESTS:
+                await service.build_query(request, TABLE_NAME, COLUMN_TYPES)
+
+    start = time.perf_counter()
+    asyncio.run(loop())
+    elapsed = time.perf_counter() - start
+    return elapsed / (iterations * len(REQUESTS)) * 1e6
+
+def run_legacy(service: LegacyQueryBuilderService, iterations: int) -> float:
+    async def loop():
+        for _ in range(iterations):
+            for request in REQUESTS:
+                await service.build_query(request, TABLE_NAME)
+
+    start = time.perf_counter()
+    asyncio.run(loop())
+    elapsed = time.perf_counter() - start
+    return elapsed / (iterations * len(REQUESTS)) * 1e6
+
+if __name__ == "__main__":
+    iterations = 2000
+    repeats = 5
+    # Best of several runs, so scheduler noise does not skew the comparison
+    legacy = min(run_legacy(LegacyQueryBuilderService(), iterations) for _ in range(repeats))
+    # A one-entry cache cycling through the requests misses on every build
+    missed = min(run(QueryBuilderService(plan_cache_size=1), iterations) for _ in range(repeats))
+    cached = min(run(QueryBuilderService(), iterations) for _ in range(repeats))
+    print(f"legacy builder:   {legacy:8.2f} us/build")
+    print(f"plan cache miss:  {missed:8.2f} us/build")
+    print(f"plan cache hit:   {cached:8.2f} us/build")
+    print(f"miss vs legacy:   {legacy / missed:8.2f}x")
+    print(f"hit vs legacy:    {legacy / cached:8.2f}x")
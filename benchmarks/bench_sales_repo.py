@@ -0,0 +1,94 @@
+"""
+Microbenchmark for SalesRepo statement preparation.
+
+Compares the per-call cost of the previous approach (concatenating the SQL,
+wrapping it in text() twice and literal-compiling it for MSSQL on every call)
+against executing the statements SalesRepo builds once per shape. Both run
+against an in-memory SQLite database with a handful of rows, so the numbers
+are dominated by statement overhead, not by the query.
+
+    python -m benchmarks.bench_sales_repo
+"""
+import os
+import time
+from datetime import date
+
+# Settings are loaded at import time; the benchmark never touches these.
+for key in ("ENV", "DB_SERVER", "DB_NAME", "DB_USER", "DB_PASSWORD", "AWS_S3_BUCKET"):
+    os.environ.setdefault(key, "bench")
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.dialects import mssql
+from sqlalchemy.orm import Session
+from app.repos.sales.sales_repo import SalesRepo
+
+CALLS = [
+    ("c1", date(2024, 1, 1), date(2025, 1, 1), "Retail", "All"),
+    ("c1", date(2024, 1, 1), date(2025, 1, 1), "Retail", "North"),
+    ("c1", date(2023, 1, 1), date(2024, 1, 1), "Fleet", "South"),
+]
+
+def make_session() -> Session:
+    engine = create_engine("sqlite://")
+
+    @event.listens_for(engine, "connect")
+    def add_date_functions(dbapi_connection, connection_record):
+        dbapi_connection.create_function("YEAR", 1, lambda d: int(d[:4]))
+        dbapi_connection.create_function("MONTH", 1, lambda d: int(d[5:7]))
+
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE CorporateRegion (RegionID INTEGER, RegionName TEXT)"))
+        conn.execute(text("CREATE TABLE Dealer (DealerID INTEGER, CorporateRegionID INTEGER)"))
+        conn.execute(text("CREATE TABLE Sales (CompanyID TEXT, DealerID INTEGER, SalesType TEXT, SalesDate TEXT, UnitsSold INTEGER)"))
+        conn.execute(text("INSERT INTO CorporateRegion VALUES (1, 'North'), (2, 'South')"))
+        conn.execute(text("INSERT INTO Dealer VALUES (1, 1), (2, 2)"))
+        conn.execute(text(
+            "INSERT INTO Sales VALUES ('c1', 1, 'Retail', '2024-03-01', 5), ('c1', 2, 'Retail', '2024-04-01', 7), "
+            "('c1', 2, 'Fleet', '2023-05-01', 3)"
+        ))
+    return Session(engine)
+
+def legacy_units_sold(db: Session, company_id, start_date, end_date, sales_type, region_name):
+    """SalesRepo.get_units_sold_by_company_and_date_range before the statement cache."""
+    query_str = """
+        SELECT
+            SUM(s.UnitsSold) AS TotalUnitsSold
+        FROM Sales s
+        LEFT JOIN Dealer d ON d.DealerID = s.DealerID
+        LEFT JOIN CorporateRegion cr ON cr.RegionID = d.CorporateRegionID
+        WHERE s.CompanyID = :company_id
+            AND s.SalesType = :sales_type
+            AND SalesDate >= :start_date
+            AND SalesDate <  :end_date
+    """
+    params = {"company_id": company_id, "sales_type": sales_type, "start_date": start_date, "end_date": end_date}
+    if region_name and region_name.lower() != "all":
+        query_str += " AND cr.RegionName = :region_name"
+        params["region_name"] = region_name
+
+    stmt = text(query_str).bindparams(**params)
+    stmt.compile(dialect=mssql.dialect(), compile_kwargs={"literal_binds": True})
+    return db.execute(text(query_str), params).scalar_one_or_none()
+
+def cached_units_sold(db: Session, company_id, start_date, end_date, sales_type, region_name):
+    return SalesRepo(db).get_units_sold_by_company_and_date_range(company_id, start_date, end_date, sales_type, region_name)
+
+def run(fn, db: Session, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for call in CALLS:
+            fn(db, *call)
+    elapsed = time.perf_counter() - start
+    return elapsed / (iterations * len(CALLS)) * 1e6
+
+if __name__ == "__main__":
+    iterations = 2000
+    db = make_session()
+    for call in CALLS:
+        assert legacy_units_sold(db, *call) == cached_units_sold(db, *call)
+
+    legacy = run(legacy_units_sold, db, iterations)
+    cached = run(cached_units_sold, db, iterations)
+    print(f"per-call build + literal compile: {legacy:8.2f} us/call")
+    print(f"prebuilt statement:               {cached:8.2f} us/call")
+    print(f"speedup:                          {legacy / cached:8.2f}x")
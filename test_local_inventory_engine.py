@@ -0,0 +1,39 @@
+import os
+
+# Settings are loaded at import time; the engine never touches these.
+for key in ("ENV", "DB_SERVER", "DB_NAME", "DB_USER", "DB_PASSWORD", "AWS_S3_BUCKET"):
+    os.environ.setdefault(key, "test")
+
+import pyarrow as pa
+from app.services.inventory_analysis.local_inventory_engine import LocalInventoryEngine
+from app.services.inventory_analysis.query_plan import Predicate, QueryPlan, SortKey
+
+TABLE = pa.table({
+    "sku": ["a", "b", "c", "d"],
+    "supplier": ["ACME", "ACME", "Other", "ACME"],
+    "available": [5.0, 1.0, 3.0, None],
+})
+
+def test_sort_on_unprojected_column():
+    plan = QueryPlan(
+        table_name="inventory",
+        columns=("sku",),
+        predicates=(Predicate("supplier", "=", "ACME"),),
+        order_by=(SortKey("available", "DESC"),),
+    )
+    rows, total = LocalInventoryEngine().execute_table(TABLE, plan, limit=2)
+    assert total == 3
+    assert rows == [{"sku": "a"}, {"sku": "b"}]
+
+def test_missing_projected_column_is_not_answered_locally():
+    plan = QueryPlan(table_name="inventory", columns=("sku", "target inventory"))
+    try:
+        LocalInventoryEngine().execute_table(TABLE, plan)
+    except Exception as e:
+        assert "target inventory" in str(e)
+    else:
+        raise AssertionError("expected the query to be left to Athena")
+
+if __name__ == "__main__":
+    test_sort_on_unprojected_column()
+    test_missing_projected_column_is_not_answered_locally()